@@ -1,9 +1,44 @@
 from services.rag_client import RAGClient
-from typing import Dict
+from services.deadline import DeadlineExceeded
+from services.admission import AdmissionRejected
+from services.prompt_budget import PromptBuilder, summarize_rows
+from config import settings
+from typing import Dict, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Prompt templates; every placeholder is a budgeted section (see services/prompt_budget.py)
+CLASSIFICATION_PROMPT = """
+Based on the Intent Classification Guide, classify this query:
+
+User Query: "{user_query}"
+User Context: {user_context}
+
+Respond with ONLY valid JSON following the classification format.
+"""
+
+SQL_GENERATION_PROMPT = """
+Based on the SQL Generation Guide, generate SQL for this query:
+
+Application: {application}
+User Query: "{user_query}"
+User Context: {user_context}
+Intent: {intent}
+
+Generate ONLY the SQL query with proper user context filtering. Include the semicolon at the end.
+"""
+
+RESPONSE_PROMPT = """
+Based on the Response Formatting Guide, create a natural response:
+
+User Question: "{original_query}"
+Query Result: {query_result}{result_note}
+Additional Context: {rag_context}
+
+Generate a clear, conversational response.
+"""
+
 class RAGBasedAgent:
     """Uses enterprise RAG API for all AI tasks"""
     
@@ -13,27 +48,27 @@ class RAGBasedAgent:
     async def classify_intent(self, user_query: str, user_context: Dict) -> Dict:
         """Classify user intent using RAG API"""
         
-        classification_query = f"""
-Based on the Intent Classification Guide, classify this query:
-
-User Query: "{user_query}"
-User Context: OU={user_context.get('ou')}, LRE={user_context.get('lre')}, Country={user_context.get('country')}
-
-Respond with ONLY valid JSON following the classification format.
-"""
+        prompt = PromptBuilder(
+            "classification", CLASSIFICATION_PROMPT, default_top_k=3, document_type="classification"
+        ).section(
+            "user_query", user_query, priority=1, floor=settings.PROMPT_MIN_QUESTION_BYTES
+        ).fixed(
+            "user_context",
+            f"OU={user_context.get('ou')}, LRE={user_context.get('lre')}, Country={user_context.get('country')}"
+        ).build()
         
         try:
             # Use the new structured query method
             result = await self.rag_client.query_rag_with_structure(
-                query=classification_query,
+                query=prompt.text,
                 expected_format="json",
-                top_k=3,
+                top_k=prompt.top_k,
                 filters={"document_type": "classification"}
             )
             
             if result.get("success") and result.get("data"):
                 classification = result["data"]
-                logger.info(f"Intent classified: {classification}")
+                logger.info("Intent classified: %s", classification, extra={"category": "classification"})
                 return classification
             else:
                 # Fallback
@@ -46,6 +81,8 @@ Respond with ONLY valid JSON following the classification format.
                     "reasoning": "Could not classify, defaulting to RAG"
                 }
                 
+        except (DeadlineExceeded, AdmissionRejected):
+            raise
         except Exception as e:
             logger.error(f"Classification error: {e}")
             return {
@@ -65,29 +102,28 @@ Respond with ONLY valid JSON following the classification format.
     ) -> Dict:
         """Generate SQL query using RAG API"""
         
-        sql_generation_query = f"""
-Based on the SQL Generation Guide, generate SQL for this query:
-
-Application: {application}
-User Query: "{user_query}"
-User Context: ou={user_context.get('ou')}, lre={user_context.get('lre')}, country={user_context.get('country')}, user_id={user_context.get('user_id')}
-Intent: {intent}
-
-Generate ONLY the SQL query with proper user context filtering. Include the semicolon at the end.
-"""
+        prompt = PromptBuilder(
+            "sql_generation", SQL_GENERATION_PROMPT, default_top_k=5, document_type="sql_guide"
+        ).section(
+            "user_query", user_query, priority=1, floor=settings.PROMPT_MIN_QUESTION_BYTES
+        ).fixed("application", application).fixed(
+            "user_context",
+            f"ou={user_context.get('ou')}, lre={user_context.get('lre')}, "
+            f"country={user_context.get('country')}, user_id={user_context.get('user_id')}"
+        ).fixed("intent", intent).build()
         
         try:
             # Use the new structured query method for SQL
             result = await self.rag_client.query_rag_with_structure(
-                query=sql_generation_query,
+                query=prompt.text,
                 expected_format="sql",
-                top_k=5,
+                top_k=prompt.top_k,
                 filters={"document_type": "sql_guide"}
             )
             
             if result.get("success") and result.get("sql"):
                 sql_query = result["sql"]
-                logger.info(f"Generated SQL: {sql_query}")
+                logger.info("Generated SQL: %s", sql_query, extra={"category": "sql"})
                 
                 return {
                     "sql_query": sql_query,
@@ -101,30 +137,52 @@ Generate ONLY the SQL query with proper user context filtering. Include the semi
             logger.error(f"SQL generation error: {e}")
             raise
     
+    @staticmethod
+    def fallback_response(query_result: any, total_rows: Optional[int] = None) -> str:
+        """Plain summary of a query result when no generated response is available"""
+        if isinstance(query_result, list) and len(query_result) > 0:
+            return f"I found {total_rows or len(query_result)} result(s) matching your query."
+        elif isinstance(query_result, dict) and 'count' in query_result:
+            return f"The count is {query_result['count']}."
+        else:
+            return "Query executed successfully."
+    
     async def generate_response(
         self,
         query_result: any,
         original_query: str,
-        rag_context: str = None
+        rag_context: str = None,
+        total_rows: Optional[int] = None
     ) -> str:
-        """Generate natural language response using RAG API"""
+        """
+        Generate natural language response using RAG API
         
-        response_query = f"""
-Based on the Response Formatting Guide, create a natural response:
-
-User Question: "{original_query}"
-Query Result: {str(query_result)}
-Additional Context: {rag_context or 'None'}
-
-Generate a clear, conversational response.
-"""
+        ``total_rows`` is passed when ``query_result`` is only the first page
+        of a larger result, so the response can describe the whole result.
+        """
+        
+        result_note = ""
+        if total_rows is not None and isinstance(query_result, list) and total_rows > len(query_result):
+            result_note = f"\nTotal Rows: {total_rows} (only the first {len(query_result)} are shown above)"
+        
+        # Retrieved context goes first, then result rows (summarized), then the question
+        prompt = PromptBuilder(
+            "response", RESPONSE_PROMPT, default_top_k=3, document_type="response_guide"
+        ).section(
+            "rag_context", rag_context or "None", priority=0
+        ).section(
+            "query_result", str(query_result), priority=1,
+            compact=lambda max_bytes: summarize_rows(query_result, max_bytes)
+        ).section(
+            "original_query", original_query, priority=2, floor=settings.PROMPT_MIN_QUESTION_BYTES
+        ).fixed("result_note", result_note).build()
         
         try:
             # Use the new structured query method for text
             result = await self.rag_client.query_rag_with_structure(
-                query=response_query,
+                query=prompt.text,
                 expected_format="text",
-                top_k=3,
+                top_k=prompt.top_k,
                 filters={"document_type": "response_guide"}
             )
             
@@ -133,17 +191,14 @@ Generate a clear, conversational response.
                 
                 # Fallback if response is too short
                 if len(final_response) < 10:
-                    if isinstance(query_result, list) and len(query_result) > 0:
-                        final_response = f"I found {len(query_result)} result(s) matching your query."
-                    elif isinstance(query_result, dict) and 'count' in query_result:
-                        final_response = f"The count is {query_result['count']}."
-                    else:
-                        final_response = "Query executed successfully."
+                    final_response = self.fallback_response(query_result)
                 
                 return final_response
             else:
                 return "I've processed your request. Please check the results below."
             
+        except (DeadlineExceeded, AdmissionRejected):
+            raise
         except Exception as e:
             logger.error(f"Response generation error: {e}")
             return "I've processed your request. Please check the results below."
\ No newline at end of file
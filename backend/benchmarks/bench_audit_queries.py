@@ -0,0 +1,225 @@
+"""
+Latency benchmark for audit history queries on a large audit table.
+
+Fills ``audit_logs`` in a scratch schema (``audit_bench`` by default) of a
+real Postgres database with generated rows, then times the previous queries
+(ORM hydration of whole rows, LIMIT plus OFFSET to reach later pages, the
+old single-column indexes) against services.audit_service (column
+projection, keyset pages, AUDIT_INDEX_DDL) for the first and a deep page of
+one busy user's history and one record's trail.
+
+Needs a database the benchmark may create a schema in; drop it afterwards
+with --drop.
+
+Usage (from the backend directory):
+    python benchmarks/bench_audit_queries.py --url postgresql+asyncpg://... [--rows 5000000] [--drop]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, text  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # noqa: E402
+
+from config import settings  # noqa: E402
+from models.database import AuditLog  # noqa: E402
+from services.audit_service import AUDIT_INDEX_DDL, AuditService  # noqa: E402
+
+USERS = 2000
+BUSY_USER = 7  # gets ~5% of all rows
+RECORDS = 50000
+PAGE = 100
+DEEP_PAGE = 200
+
+FILL = """
+    INSERT INTO audit_logs (
+        user_id, username, application, operation, table_name, record_id,
+        query_executed, changes, timestamp, ip_address, success
+    )
+    SELECT
+        CASE WHEN i % 20 = 0 THEN :busy ELSE 1 + (i * 7919) % :users END,
+        'user' || (i % :users),
+        CASE WHEN i % 3 = 0 THEN 'eControls' ELSE 'MyKRI' END,
+        (ARRAY['READ', 'INSERT', 'UPDATE', 'DELETE'])[1 + i % 4],
+        CASE WHEN i % 3 = 0 THEN 'controls' ELSE 'kri_values' END,
+        ((i * 104729) % :records)::text,
+        'SELECT * FROM kri_values WHERE kri_id = ' || i || repeat(' AND 1 = 1', 40),
+        jsonb_build_object('before', jsonb_build_object('kri_value', i), 'after', jsonb_build_object('kri_value', i + 1)),
+        TIMESTAMP '2024-01-01' + (i || ' seconds')::interval,
+        '10.0.0.' || (i % 250),
+        i % 50 <> 0
+    FROM generate_series(:start, :stop) AS i
+"""
+
+LEGACY_INDEX_DDL = [
+    "CREATE INDEX IF NOT EXISTS idx_audit_user_id ON audit_logs(user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_audit_timestamp ON audit_logs(timestamp DESC)"
+]
+
+
+# ==================== Previous implementation ====================
+
+
+async def legacy_history(session, user_id, limit, offset):
+    stmt = select(AuditLog).where(
+        AuditLog.user_id == user_id
+    ).order_by(
+        AuditLog.timestamp.desc()
+    ).limit(limit).offset(offset)
+    audit_logs = (await session.execute(stmt)).scalars().all()
+    return [
+        {
+            "audit_id": log.audit_id,
+            "operation": log.operation,
+            "application": log.application,
+            "table_name": log.table_name,
+            "timestamp": log.timestamp.isoformat(),
+            "success": log.success
+        }
+        for log in audit_logs
+    ]
+
+
+async def legacy_record(session, application, table_name, record_id, limit, offset):
+    stmt = select(AuditLog).where(
+        AuditLog.application == application,
+        AuditLog.table_name == table_name,
+        AuditLog.record_id == record_id
+    ).order_by(
+        AuditLog.timestamp.desc()
+    ).limit(limit).offset(offset)
+    audit_logs = (await session.execute(stmt)).scalars().all()
+    return [
+        {
+            "audit_id": log.audit_id,
+            "username": log.username,
+            "operation": log.operation,
+            "changes": log.changes,
+            "timestamp": log.timestamp.isoformat(),
+            "success": log.success
+        }
+        for log in audit_logs
+    ]
+
+
+# ==================== Harness ====================
+
+
+async def _prepare(engine, rows: int):
+    async with engine.begin() as conn:
+        await conn.run_sync(AuditLog.__table__.create, checkfirst=True)
+        existing = (await conn.execute(text("SELECT count(*) FROM audit_logs"))).scalar()
+    if existing >= rows:
+        return
+
+    batch = 500000
+    print(f"Filling audit_logs with {rows - existing} rows...")
+    for start in range(existing + 1, rows + 1, batch):
+        async with engine.begin() as conn:
+            await conn.execute(text(FILL), {
+                "busy": BUSY_USER, "users": USERS, "records": RECORDS,
+                "start": start, "stop": min(start + batch - 1, rows)
+            })
+    async with engine.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("VACUUM ANALYZE audit_logs"))
+
+
+async def _indexes(engine, statements, drop=()):
+    async with engine.begin() as conn:
+        for name in drop:
+            await conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        for statement in statements:
+            await conn.execute(text(statement))
+    async with engine.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("VACUUM ANALYZE audit_logs"))
+
+
+async def _time(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+async def _keyset_deep(conn, page_fn, pages: int):
+    cursor = None
+    for _ in range(pages):
+        page = await page_fn(conn, cursor)
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    return cursor
+
+
+async def run(args):
+    engine = create_async_engine(
+        args.url,
+        connect_args={"server_settings": {"search_path": args.schema}}
+    )
+    async with engine.begin() as conn:
+        await conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {args.schema}"))
+    await _prepare(engine, args.rows)
+
+    async with engine.connect() as conn:
+        record_id = (await conn.execute(text(
+            "SELECT record_id FROM audit_logs WHERE application = 'MyKRI' GROUP BY record_id "
+            "ORDER BY count(*) DESC LIMIT 1"
+        ))).scalar()
+
+    def history_page(conn, cursor):
+        return AuditService.get_user_audit_history(conn, BUSY_USER, limit=PAGE, cursor=cursor)
+
+    def record_page(conn, cursor):
+        return AuditService.get_operation_audit(conn, "MyKRI", "kri_values", record_id, limit=PAGE, cursor=cursor)
+
+    print(f"{'query':<34}{'legacy ms':>12}{'new ms':>10}")
+    await _indexes(engine, LEGACY_INDEX_DDL, drop=("idx_audit_user_ts", "idx_audit_record_ts"))
+    legacy = {}
+    async with AsyncSession(engine) as session:
+        legacy["history, first page"] = await _time(lambda: legacy_history(session, BUSY_USER, PAGE, 0), args.repeat)
+        legacy[f"history, page {DEEP_PAGE}"] = await _time(
+            lambda: legacy_history(session, BUSY_USER, PAGE, PAGE * DEEP_PAGE), args.repeat
+        )
+        legacy["record trail, first page"] = await _time(
+            lambda: legacy_record(session, "MyKRI", "kri_values", record_id, PAGE, 0), args.repeat
+        )
+
+    await _indexes(engine, AUDIT_INDEX_DDL)
+    new = {}
+    async with engine.connect() as conn:
+        new["history, first page"] = await _time(lambda: history_page(conn, None), args.repeat)
+        # Walk to the deep page once, then time fetching it from its cursor
+        cursor = await _keyset_deep(conn, history_page, DEEP_PAGE)
+        new[f"history, page {DEEP_PAGE}"] = await _time(lambda: history_page(conn, cursor), args.repeat)
+        new["record trail, first page"] = await _time(lambda: record_page(conn, None), args.repeat)
+
+    for name, seconds in legacy.items():
+        print(f"{name:<34}{seconds * 1000:>12.1f}{new[name] * 1000:>10.1f}")
+
+    if args.drop:
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA {args.schema} CASCADE"))
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default=settings.mykri_database_url, help="SQLAlchemy asyncpg URL")
+    parser.add_argument("--schema", default="audit_bench", help="scratch schema to create the table in")
+    parser.add_argument("--rows", type=int, default=5000000, help="audit rows to generate")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per query (median reported)")
+    parser.add_argument("--drop", action="store_true", help="drop the scratch schema when done")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
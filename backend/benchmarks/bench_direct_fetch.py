@@ -0,0 +1,182 @@
+"""
+Throughput benchmark for READ result fetching and serialization.
+
+Fills a table of mixed columns (integers, text, numerics, dates, timestamps)
+in a scratch schema (``fetch_bench`` by default) of a real Postgres
+database, then times, for several result sizes, the previous READ path
+(SQLAlchemy ``execute`` + ``fetchall``, conversation memory transposing the
+rows, result_store pagination encoding values one by one, FastAPI encoding
+the first page) against services.direct_fetch (asyncpg batches into
+columns, one codec per column) feeding the same consumers.
+
+Needs a database the benchmark may create a schema in; drop it afterwards
+with --drop.
+
+Usage (from the backend directory):
+    python benchmarks/bench_direct_fetch.py --url postgresql+asyncpg://... [--rows 500000] [--drop]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine  # noqa: E402
+
+from config import settings  # noqa: E402
+from services.conversation import ColumnarResult  # noqa: E402
+from services.direct_fetch import fetch_columns  # noqa: E402
+from services.result_store import ResultStore  # noqa: E402
+
+SIZES = (1000, 10000, 100000, 500000)
+
+CREATE = """
+    CREATE TABLE IF NOT EXISTS kri_snapshot (
+        kri_id INTEGER PRIMARY KEY,
+        kri_ref TEXT NOT NULL,
+        kri_name TEXT NOT NULL,
+        ou TEXT NOT NULL,
+        country TEXT NOT NULL,
+        kri_value NUMERIC(14, 4),
+        threshold NUMERIC(14, 4),
+        score DOUBLE PRECISION,
+        period_date DATE NOT NULL,
+        updated_at TIMESTAMP NOT NULL,
+        breached BOOLEAN NOT NULL
+    )
+"""
+
+FILL = """
+    INSERT INTO kri_snapshot
+    SELECT
+        i,
+        'KRI-' || lpad(i::text, 7, '0'),
+        'Indicator ' || i || ' for operational loss events',
+        'OU' || (i % 40),
+        (ARRAY['DE', 'FR', 'GB', 'US', 'SG'])[1 + i % 5],
+        CASE WHEN i % 17 = 0 THEN NULL ELSE (i % 10000) / 7.0 END,
+        (i % 500) * 3.25,
+        (i % 1000) / 1000.0,
+        DATE '2024-01-01' + (i % 365),
+        TIMESTAMP '2024-01-01' + (i || ' seconds')::interval,
+        i % 9 = 0
+    FROM generate_series(:start, :stop) AS i
+"""
+
+QUERY = "SELECT * FROM kri_snapshot ORDER BY kri_id LIMIT {limit};"
+
+
+# ==================== Previous implementation ====================
+
+
+async def legacy_read(session, sql_query: str, store: ResultStore):
+    await session.execute(text("SET LOCAL statement_timeout = 600000"))
+    result = await session.execute(text(sql_query))
+    columns = list(result.keys())
+    rows = result.fetchall()
+    base = ColumnarResult.from_rows(columns, rows)
+    page, handle = await store.paginate(0, columns, rows, settings.RESULT_PAGE_SIZE)
+    return base, jsonable_encoder(page)
+
+
+# ==================== Direct fetch ====================
+
+
+async def direct_read(session, sql_query: str, store: ResultStore):
+    await session.execute(text("SET LOCAL statement_timeout = 600000"))
+    fetched = await fetch_columns(session, sql_query)
+    page, handle = await store.paginate(0, fetched.columns, fetched.encoded_rows(), settings.RESULT_PAGE_SIZE)
+    return fetched, jsonable_encoder(page)
+
+
+# ==================== Harness ====================
+
+
+async def _prepare(engine, rows: int):
+    async with engine.begin() as conn:
+        await conn.execute(text(CREATE))
+        existing = (await conn.execute(text("SELECT count(*) FROM kri_snapshot"))).scalar()
+    if existing >= rows:
+        return
+
+    batch = 250000
+    print(f"Filling kri_snapshot with {rows - existing} rows...")
+    for start in range(existing + 1, rows + 1, batch):
+        async with engine.begin() as conn:
+            await conn.execute(text(FILL), {"start": start, "stop": min(start + batch - 1, rows)})
+    async with engine.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("VACUUM ANALYZE kri_snapshot"))
+
+
+async def _read_once(engine, read, sql_query: str) -> float:
+    store = ResultStore()
+    async with AsyncSession(engine) as session:
+        start = time.perf_counter()
+        result = await read(session, sql_query, store)
+        elapsed = time.perf_counter() - start
+        await session.rollback()
+    del result
+    store.clear()
+    return elapsed
+
+
+async def _measure(engine, read, sql_query: str, repeat: int):
+    """Median seconds of ``repeat`` reads, and peak traced memory (MiB) of one more"""
+    timings = [await _read_once(engine, read, sql_query) for _ in range(repeat)]
+    # Traced separately; tracemalloc slows allocation-heavy code down a lot
+    tracemalloc.start()
+    await _read_once(engine, read, sql_query)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(timings), peak / (1024 * 1024)
+
+
+async def run(args):
+    engine = create_async_engine(
+        args.url,
+        connect_args={"server_settings": {"search_path": args.schema}}
+    )
+    async with engine.begin() as conn:
+        await conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {args.schema}"))
+    await _prepare(engine, args.rows or max(SIZES))
+
+    # Prime the buffer cache and connection so neither path pays for it
+    async with AsyncSession(engine) as session:
+        await session.execute(text("SELECT count(*) FROM kri_snapshot"))
+
+    sizes = [size for size in SIZES if args.rows is None or size < args.rows] + [args.rows or max(SIZES)]
+    print(f"{'rows':>8}{'legacy ms':>12}{'direct ms':>12}{'speed-up':>10}{'legacy MiB':>12}{'direct MiB':>12}")
+    for size in sizes:
+        sql_query = QUERY.format(limit=size)
+        legacy_seconds, legacy_mib = await _measure(engine, legacy_read, sql_query, args.repeat)
+        direct_seconds, direct_mib = await _measure(engine, direct_read, sql_query, args.repeat)
+        print(
+            f"{size:>8}{legacy_seconds * 1000:>12.1f}{direct_seconds * 1000:>12.1f}"
+            f"{legacy_seconds / direct_seconds:>9.2f}x{legacy_mib:>12.1f}{direct_mib:>12.1f}"
+        )
+
+    if args.drop:
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA {args.schema} CASCADE"))
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default=settings.mykri_database_url, help="SQLAlchemy asyncpg URL")
+    parser.add_argument("--schema", default="fetch_bench", help="scratch schema to create the table in")
+    parser.add_argument("--rows", type=int, default=None, help=f"largest result to time (default {max(SIZES)})")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per size (median reported)")
+    parser.add_argument("--drop", action="store_true", help="drop the scratch schema when done")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Micro-benchmark for per-request logging overhead.
+
+Emits the log calls one chat request makes on its hot path (classification,
+generated SQL, RAG success, audit) through the previous set-up
+(``logging.basicConfig`` and f-strings, written synchronously) and through
+services.log_pipeline (queued, lazily formatted, sampled). The reported time
+is what the request itself pays; the pipeline's listener thread formats and
+writes afterwards. "slow" sink adds a delay per write, like a stdout pipe
+that a log shipper is not draining fast enough.
+
+Usage (from the backend directory):
+    python benchmarks/bench_logging.py [--requests 20000] [--slow-write-us 50]
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import log_pipeline  # noqa: E402
+
+CLASSIFICATION = {"application": "MyKRI", "intent": "READ", "confidence": 0.93, "reasoning": "Asks for KRI values"}
+SQL = "SELECT k.kri_id, k.kri_name, k.current_value, k.threshold_amber, k.threshold_red FROM kris k " + (
+    "WHERE k.ou = 'OU-001' AND k.country = 'GB' " * 20
+)
+QUERY = "Show me every KRI in my OU that is currently above its amber threshold, by country"
+
+
+class SlowSink:
+    """A stream whose writes take ``delay`` seconds"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def write(self, data):
+        end = time.perf_counter() + self.delay
+        while time.perf_counter() < end:
+            pass
+
+    def flush(self):
+        pass
+
+
+# ==================== Previous implementation ====================
+
+
+def legacy_configure(stream):
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        stream=stream
+    )
+
+
+def legacy_request(logger):
+    logger.info(f"Intent classified: {CLASSIFICATION}")
+    logger.info(f"Query classified: {CLASSIFICATION}")
+    logger.info(f"Generated SQL: {SQL}")
+    logger.info(f"RAG query successful: {QUERY[:50]}...")
+    logger.info(
+        "Audit logged - User: alice, App: MyKRI, "
+        "Operation: READ, Table: multi_table_query"
+    )
+
+
+# ==================== Current implementation ====================
+
+
+def pipeline_request(logger):
+    logger.info("Intent classified: %s", CLASSIFICATION, extra={"category": "classification"})
+    logger.info("Query classified: %s", CLASSIFICATION, extra={"category": "classification"})
+    logger.info("Generated SQL: %s", SQL, extra={"category": "sql"})
+    logger.info("RAG query successful: %.50s...", QUERY, extra={"category": "rag"})
+    logger.info(
+        "Audit logged - User: %s, App: %s, Operation: %s, Table: %s",
+        "alice", "MyKRI", "READ", "multi_table_query",
+        extra={"category": "audit"}
+    )
+
+
+def _time_requests(request, logger, count: int) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        request(logger)
+    return (time.perf_counter() - start) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000, help="simulated requests per run")
+    parser.add_argument("--slow-write-us", type=float, default=50.0, help="per-write delay of the slow sink")
+    args = parser.parse_args()
+
+    logger = logging.getLogger("bench")
+    devnull = open(os.devnull, "w")
+    sinks = [("devnull", devnull), ("slow", SlowSink(args.slow_write_us / 1e6))]
+
+    print(f"{'sink':<10}{'legacy us/req':>16}{'pipeline us/req':>18}{'speed-up':>10}{'dropped':>10}")
+    for name, sink in sinks:
+        legacy_configure(sink)
+        legacy = _time_requests(legacy_request, logger, args.requests)
+
+        dropped_before = sum(log_pipeline.dropped_records.snapshot()["values"].values())
+        listener = log_pipeline.configure_logging(sink)
+        pipeline = _time_requests(pipeline_request, logger, args.requests)
+        if listener is not None:
+            listener.stop()
+        dropped = sum(log_pipeline.dropped_records.snapshot()["values"].values()) - dropped_before
+
+        print(
+            f"{name:<10}{legacy * 1e6:>16.1f}{pipeline * 1e6:>18.1f}"
+            f"{legacy / pipeline:>9.1f}x{int(dropped):>10}"
+        )
+    devnull.close()
+
+
+if __name__ == "__main__":
+    main()
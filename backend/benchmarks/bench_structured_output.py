@@ -0,0 +1,154 @@
+"""
+Micro-benchmark for RAG structured output extraction.
+
+Compares the regex-based extractors that used to live in RAGClient with
+services.structured_output on adversarial contexts of growing size. The old
+patterns grow quadratically on these inputs; the new extractors should scale
+linearly (time per KB roughly constant across sizes).
+
+Usage (from the backend directory):
+    python benchmarks/bench_structured_output.py [--max-kb 64] [--budget 2]
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import structured_output  # noqa: E402
+
+# ==================== Previous implementation ====================
+
+
+def legacy_extract_json(text):
+    for match in re.finditer(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', text, re.DOTALL):
+        try:
+            parsed = json.loads(match.group(0))
+            if isinstance(parsed, dict):
+                return parsed
+        except json.JSONDecodeError:
+            continue
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    code_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', text, re.DOTALL)
+    if code_match:
+        try:
+            return json.loads(code_match.group(1))
+        except json.JSONDecodeError:
+            pass
+    return None
+
+
+def legacy_extract_sql(text):
+    for pattern in (
+        r'(SELECT|INSERT|UPDATE|DELETE|WITH)\s+.*?;',
+        r'```(?:sql)?\s*((?:SELECT|INSERT|UPDATE|DELETE|WITH).*?)\s*```',
+        r'(SELECT|INSERT|UPDATE|DELETE|WITH)\s+.*?(?=\n\n|$)',
+    ):
+        match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
+        if match:
+            return ' '.join(match.group(0).split())
+    return None
+
+
+def legacy_clean_text(text):
+    for pattern in (
+        r'based on the.*?guide[,:]?\s*',
+        r'(?:example|response|format):\s*',
+        r'here(?:\'s| is) (?:the|a|an).*?:\s*',
+        r'```.*?```',
+    ):
+        text = re.sub(pattern, '', text, flags=re.IGNORECASE | re.DOTALL)
+    return re.sub(r'\n{3,}', '\n\n', text).strip()
+
+# ==================== Adversarial contexts ====================
+
+
+def _repeat(unit: str, size_bytes: int) -> str:
+    return unit * max(1, size_bytes // len(unit))
+
+
+CASES = [
+    # Many openers, nothing ever closes: every '{' starts a failed match
+    ("json/unclosed-braces", "json", lambda n: _repeat('{"k": [1, 2, ', n)),
+    # Balanced prose braces that never decode, followed by the real answer
+    ("json/prose-braces", "json", lambda n: _repeat('{note: see {ref}} ', n) + '{"application": "MyKRI"}'),
+    # Prose braces that never close, followed by the real answer
+    ("json/unmatched-prose", "json", lambda n: _repeat('Note: use { for sets. ', n) + '{"application": "MyKRI"}'),
+    # Keywords with no terminator: each SELECT scans to the end
+    ("sql/no-terminator", "sql", lambda n: _repeat('select the rows ', n)),
+    # Unclosed code fences
+    ("sql/unclosed-fences", "sql", lambda n: _repeat('``` update ', n)),
+    # Instruction phrases without the closing "guide"
+    ("text/no-guide", "text", lambda n: _repeat('Based on the results ', n)),
+    ("text/unclosed-fences", "text", lambda n: _repeat('``` here is the ', n)),
+]
+
+# Inputs the new extractors must still answer the way the old patterns did
+EXPECTED = [
+    ("json", '{"application": "MyKRI", "intent": "READ"}', {"application": "MyKRI", "intent": "READ"}),
+    ("json", 'Note: use { for sets. Answer: {"application": "MyKRI", "intent": "READ"}',
+     {"application": "MyKRI", "intent": "READ"}),
+    ("json", '{note: {"application": "MyKRI"}} and {"intent": "READ"}', {"application": "MyKRI"}),
+    ("json", 'Nested {"a": {"b": 1}} first', {"a": {"b": 1}}),
+    ("sql", "Here you go: SELECT * FROM kri_values WHERE note = 'a;b';", "SELECT * FROM kri_values WHERE note = 'a;b';"),
+]
+
+EXTRACTORS = {
+    "json": (legacy_extract_json, structured_output.extract_json),
+    "sql": (legacy_extract_sql, structured_output.extract_sql),
+    "text": (legacy_clean_text, structured_output.clean_text),
+}
+
+
+def _time(fn, text: str) -> float:
+    start = time.perf_counter()
+    try:
+        fn(text)
+    except Exception:
+        # RAGClient treated extractor errors as "nothing found"
+        pass
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--max-kb", type=int, default=64, help="largest context size in KB")
+    parser.add_argument("--budget", type=float, default=2.0,
+                        help="stop timing the legacy extractor once a run exceeds this many seconds")
+    args = parser.parse_args()
+
+    for kind, text, expected in EXPECTED:
+        found = EXTRACTORS[kind][1](text)
+        if found != expected:
+            sys.exit(f"{kind} extractor returned {found!r} for {text!r}, expected {expected!r}")
+
+    sizes = []
+    size = 4
+    while size <= args.max_kb:
+        sizes.append(size)
+        size *= 4
+
+    print(f"{'case':<24}{'size':>8}{'legacy ms':>14}{'new ms':>12}{'new us/KB':>12}")
+    for name, kind, build in CASES:
+        legacy_fn, new_fn = EXTRACTORS[kind]
+        legacy_skipped = False
+        for kb in sizes:
+            text = build(kb * 1024)
+            new_s = _time(new_fn, text)
+            if legacy_skipped:
+                legacy_col = "skipped"
+            else:
+                legacy_s = _time(legacy_fn, text)
+                legacy_col = f"{legacy_s * 1000:.1f}"
+                legacy_skipped = legacy_s > args.budget
+            print(f"{name:<24}{kb:>6}KB{legacy_col:>14}{new_s * 1000:>12.1f}{new_s * 1e6 / kb:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -21,12 +21,43 @@ class Settings(BaseSettings):
     MYKRI_DB_USER: str = "postgres"
     MYKRI_DB_PASSWORD: str = "password"
     
+    # Application Databases
+    # JSON map of application -> {"url", "pool_size", "max_overflow", "admission_capacity",
+    # "replicas": [url, ...], "shard_key": "country", "shards": {"<value>": {"url", ...}}}.
+    # Empty: eControls and MyKRI from the settings above.
+    DATABASE_APPLICATIONS: dict = {}
+    DATABASE_POOL_SIZE: int = 10
+    DATABASE_MAX_OVERFLOW: int = 20
+    DATABASE_ECHO: bool = False  # SQLAlchemy statement logging; very noisy under load
+    
+    # Startup
+    STARTUP_SCHEMA_FINGERPRINT: bool = True  # skip DDL when the stored schema fingerprint matches
+    DATABASE_POOL_PREWARM: int = 2  # connections opened per engine at start-up
+    
     # RAG API Configuration
     RAG_API_BASE_URL: str = "https://your-rag-api.azure.com"
     RAG_API_BEARER_TOKEN: str = "your-bearer-token"
     RAG_UPLOAD_ENDPOINT: str = "/upload"
     RAG_QUERY_ENDPOINT: str = "/query"
     
+    # RAG API Resilience
+    RAG_QUERY_TIMEOUT_SECONDS: float = 60.0
+    RAG_MIN_TIMEOUT_SECONDS: float = 2.0
+    RAG_TIMEOUT_PERCENTILE: float = 99.0
+    RAG_TIMEOUT_MULTIPLIER: float = 2.0
+    RAG_RETRY_MAX_ATTEMPTS: int = 3
+    RAG_RETRY_BUDGET_RATIO: float = 0.2
+    RAG_RETRY_BASE_DELAY_SECONDS: float = 0.2
+    RAG_RETRY_MAX_DELAY_SECONDS: float = 2.0
+    RAG_HEDGE_ENABLED: bool = False
+    RAG_HEDGE_PERCENTILE: float = 95.0
+    RAG_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    RAG_CIRCUIT_RESET_SECONDS: float = 30.0
+    RAG_STALE_CACHE_SIZE: int = 512
+    RAG_STALE_CACHE_MAX_AGE_SECONDS: float = 3600.0
+    RAG_ANSWER_CACHE_SIZE: int = 20000  # classification and SQL answers, per prompt
+    RAG_ANSWER_CACHE_TTL_SECONDS: float = 14400.0  # outlasts peak hours after a warm-up
+    
     # Azure OpenAI (for LangChain)
     AZURE_OPENAI_API_KEY: str = "your-azure-openai-key"
     AZURE_OPENAI_ENDPOINT: str = "https://your-resource.openai.azure.com/"
@@ -38,11 +69,128 @@ class Settings(BaseSettings):
     JWT_ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     
+    # Request Deadlines
+    CHAT_DEADLINE_SECONDS: float = 45.0
+    CHAT_MAX_DEADLINE_SECONDS: float = 120.0
+    AUDIT_MIN_TIMEOUT_SECONDS: float = 2.0
+    
+    # Admission Control
+    ADMISSION_RAG_CAPACITY: int = 32
+    ADMISSION_ECONTROLS_DB_CAPACITY: int = 24  # below pool_size + max_overflow (30)
+    ADMISSION_MYKRI_DB_CAPACITY: int = 24
+    ADMISSION_MAX_QUEUE: int = 200
+    ADMISSION_PER_USER_CONCURRENCY: int = 4
+    ADMISSION_PER_USER_MAX_QUEUE: int = 20
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = 30.0
+    # Units of database capacity held by heavy work (an interactive READ holds 1)
+    ADMISSION_INGEST_WEIGHT: int = 4  # bulk COPY upload
+    ADMISSION_EXPORT_WEIGHT: int = 4  # connection and cursor held for the whole download
+    ADMISSION_BULK_READ_WEIGHT: int = 2  # async jobs and cache warm-up reads, no LIMIT
+    
+    # Batch Chat
+    BATCH_MAX_QUESTIONS: int = 100
+    BATCH_CONCURRENCY: int = 4
+    
+    # Async Jobs
+    JOB_WORKERS: int = 4
+    JOB_QUEUE_SIZE: int = 100
+    JOB_MAX_ACTIVE_PER_USER: int = 10
+    JOB_DEADLINE_SECONDS: float = 900.0
+    JOB_RESULT_TTL_SECONDS: int = 3600
+    JOB_MAX_RETAINED: int = 1000
+    JOB_RESPONSE_PREVIEW_ROWS: int = 50
+    
+    # Result Storage
+    RESULT_SPILL_THRESHOLD_BYTES: int = 4 * 1024 * 1024
+    RESULT_SPILL_DIR: str = ""  # system temp dir when empty
+    RESULT_PAGE_SIZE: int = 100
+    RESULT_MAX_PAGE_SIZE: int = 1000
+    RESULT_STORE_MAX_RESULTS: int = 500
+    RESULT_STORE_TTL_SECONDS: int = 1800
+    DIRECT_FETCH_ENABLED: bool = True  # READ results read on the raw asyncpg connection, column-wise
+    DIRECT_FETCH_BATCH_ROWS: int = 5000
+    
+    # Export
+    EXPORT_BATCH_ROWS: int = 5000
+    
+    # KRI Bulk Ingestion
+    KRI_INGEST_BATCH_ROWS: int = 5000
+    KRI_INGEST_MAX_REPORTED_ERRORS: int = 100
+    
+    # Audit Queries
+    AUDIT_PAGE_SIZE: int = 100
+    AUDIT_MAX_PAGE_SIZE: int = 1000
+    
+    # Audit Partitioning
+    AUDIT_PARTITION_CHECK_SECONDS: float = 3600.0
+    AUDIT_PARTITIONS_AHEAD: int = 3  # future monthly partitions kept ready
+    AUDIT_RETENTION_DAYS: int = 365  # older partitions are archived to files and dropped
+    AUDIT_ARCHIVE_DIR: str = "./audit_archive"  # use shared storage when running several replicas
+    AUDIT_ARCHIVE_BATCH_ROWS: int = 50000
+    AUDIT_ARCHIVE_COMPRESSION: str = "zstd"
+    AUDIT_DETACH_LOCK_TIMEOUT_MS: int = 5000
+    
+    # KRI Breach Engine
+    KRI_TREND_POINTS: int = 6
+    KRI_TREND_MAX_POINTS: int = 24
+    
+    # Rollups
+    ROLLUP_REFRESH_SECONDS: float = 300.0
+    ROLLUP_OVERDUE_DAYS: int = 90  # since the last review (or creation, if never reviewed)
+    ROLLUP_COMPLETED_STATUSES: list = ["Completed"]
+    
+    # Prompt Budgets (tokens, including the top_k chunks the RAG API adds)
+    PROMPT_BUDGET_TOKENS: dict = {"classification": 2000, "sql_generation": 4000, "response": 6000, "retrieval": 3000}
+    PROMPT_DEFAULT_BUDGET_TOKENS: int = 4000
+    PROMPT_BYTES_PER_TOKEN: int = 4
+    PROMPT_CHUNK_TOKENS: float = 300.0  # assumed retrieved chunk size until one has been seen
+    PROMPT_MIN_TOP_K: int = 1
+    PROMPT_MIN_QUESTION_BYTES: int = 1000  # the user's question is never cut below this
+    
+    # Request Profiling
+    PROFILING_TOKEN: str = ""  # X-Profile-Token value that forces a profile and opens /api/admin/profiles
+    PROFILING_SAMPLE_RATE: float = 0.0  # fraction of PROFILING_PATHS requests profiled
+    PROFILING_PATHS: list = ["/api/chat"]
+    PROFILING_INTERVAL_MS: float = 5.0
+    PROFILING_BUFFER_SIZE: int = 50  # most recent profiles kept in memory
+    
+    # Conversation Memory
+    CONVERSATION_CACHE_SIZE: int = 1000
+    CONVERSATION_TTL_SECONDS: int = 1800
+    CONVERSATION_MAX_ROWS: int = 50000
+    
+    # Health Monitoring
+    HEALTH_CHECK_INTERVAL_SECONDS: float = 15.0
+    HEALTH_CHECK_TIMEOUT_SECONDS: float = 5.0
+    
+    # User Context Cache
+    USER_CONTEXT_CACHE_SIZE: int = 10000
+    USER_CONTEXT_CACHE_TTL_SECONDS: float = 900.0
+    USER_CONTEXT_WARM_LIMIT: int = 10000
+    USER_CONTEXT_NOTIFY_CHANNEL: str = "user_context_changed"
+    
+    # Cache Warm-up
+    WARMUP_TIMES: list = ["06:30"]  # UTC, ahead of peak hours; empty disables the schedule
+    WARMUP_ON_STARTUP: bool = False
+    WARMUP_LOOKBACK_DAYS: int = 14
+    WARMUP_MAX_QUESTIONS: int = 500  # most asked (user, question) pairs per application
+    WARMUP_CONCURRENCY: int = 4
+    WARMUP_EXECUTE_READS: bool = True  # run READ queries once to load the database buffer cache
+    
+    # Logging
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"  # "json" or "text"
+    LOG_ASYNC: bool = True  # format and write records on a background thread
+    LOG_QUEUE_SIZE: int = 10000  # records beyond this are dropped, not waited for
+    LOG_MAX_MESSAGE_CHARS: int = 2000
+    LOG_SAMPLE_RATES: dict = {"classification": 0.1, "sql": 0.1, "audit": 0.1, "rag": 0.1}
+    
     # CORS
     CORS_ORIGINS: list = ["http://localhost:3000", "http://localhost:5173"]
     
     # Streaming
     STREAM_CHUNK_SIZE: int = 512
+    STREAM_DISCONNECT_POLL_SECONDS: float = 0.5
     
     @property
     def econtrols_database_url(self) -> str:
@@ -1,85 +1,110 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import declarative_base
+from sqlalchemy.ext.asyncio import AsyncEngine
+from typing import Dict, Optional
 from config import settings
+from database.registry import DatabaseRegistry, DatabaseTarget
+from database.schema import ensure_schema, ensure_statements, fingerprint, metadata_statements
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Create async engines for both databases
-econtrols_engine = create_async_engine(
-    settings.econtrols_database_url,
-    echo=settings.DEBUG,
-    pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20
-)
+# Columns added to model tables after they were first created (create_all never
+# alters an existing table); required like the tables themselves
+MODEL_COLUMN_DDL = [
+    # Questions are mined by the cache warm-up (services.cache_warmup)
+    "ALTER TABLE audit_logs ADD COLUMN IF NOT EXISTS question TEXT"
+]
 
-mykri_engine = create_async_engine(
-    settings.mykri_database_url,
-    echo=settings.DEBUG,
-    pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20
-)
+# Engines and session makers for every configured application, shard and replica
+registry = DatabaseRegistry.from_settings()
 
-# Create session makers
-EControlsSessionLocal = async_sessionmaker(
-    econtrols_engine,
-    class_=AsyncSession,
-    expire_on_commit=False
-)
-
-MyKRISessionLocal = async_sessionmaker(
-    mykri_engine,
-    class_=AsyncSession,
-    expire_on_commit=False
-)
-
-# Dependency functions
-async def get_econtrols_db():
-    async with EControlsSessionLocal() as session:
-        try:
-            yield session
+class SessionRouter:
+    """Request-scoped sessions, opened on first use on the database each application/user routes to"""
+    
+    def __init__(self, registry: DatabaseRegistry):
+        self.registry = registry
+        self._sessions: Dict[str, AsyncSession] = {}
+    
+    def get(self, application: str, user_context: Optional[dict] = None) -> AsyncSession:
+        target = self.registry.target(application, user_context)
+        session = self._sessions.get(target.resource)
+        if session is None:
+            session = self._sessions[target.resource] = target.session_factory()
+        return session
+    
+    async def commit(self):
+        for session in self._sessions.values():
             await session.commit()
-        except Exception as e:
+    
+    async def rollback(self):
+        for session in self._sessions.values():
             await session.rollback()
-            logger.error(f"Database session error: {str(e)}")
-            raise
-        finally:
+    
+    async def close(self):
+        for session in self._sessions.values():
             await session.close()
+        self._sessions.clear()
 
-async def get_mykri_db():
-    async with MyKRISessionLocal() as session:
-        try:
-            yield session
-            await session.commit()
-        except Exception as e:
-            await session.rollback()
-            logger.error(f"Database session error: {str(e)}")
-            raise
-        finally:
-            await session.close()
+# Dependency function
+async def get_sessions():
+    sessions = SessionRouter(registry)
+    try:
+        yield sessions
+        await sessions.commit()
+    except Exception as e:
+        await sessions.rollback()
+        logger.error(f"Database session error: {str(e)}")
+        raise
+    finally:
+        await sessions.close()
 
 # Database initialization
+async def _init_database(target: DatabaseTarget, models_fingerprint: str):
+    from models.database import Base
+    
+    async def create_all(conn):
+        await conn.run_sync(Base.metadata.create_all)
+    
+    applied = await ensure_schema(target.engine, "models", models_fingerprint, create_all)
+    applied = await ensure_statements(target.engine, "model_columns", MODEL_COLUMN_DDL) or applied
+    logger.info(f"{target.resource} initialized successfully" + ("" if applied else " (schema unchanged)"))
+
 async def init_databases():
-    """Initialize database tables"""
+    """Initialize database tables on every database concurrently"""
     from models.database import Base
     
     try:
-        async with econtrols_engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
-        logger.info("eControls database initialized successfully")
-        
-        async with mykri_engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
-        logger.info("MyKRI database initialized successfully")
+        models_fingerprint = fingerprint(metadata_statements(Base.metadata))
+        await asyncio.gather(*(
+            _init_database(target, models_fingerprint) for target in registry.targets()
+        ))
         
     except Exception as e:
         logger.error(f"Database initialization error: {str(e)}")
         raise
 
+async def _prewarm(name: str, engine: AsyncEngine, count: int) -> int:
+    results = await asyncio.gather(*(engine.connect() for _ in range(count)), return_exceptions=True)
+    opened = [conn for conn in results if not isinstance(conn, BaseException)]
+    # Closing returns them to the pool, where the next requests pick them up
+    for conn in opened:
+        await conn.close()
+    if len(opened) < count:
+        logger.warning(f"Pre-warmed {len(opened)}/{count} connections for {name}")
+    return len(opened)
+
+async def prewarm_pools() -> Dict[str, int]:
+    """Open DATABASE_POOL_PREWARM connections on every engine so first requests skip the connect"""
+    engines = registry.engines()
+    counts = await asyncio.gather(*(
+        _prewarm(name, engine, min(settings.DATABASE_POOL_PREWARM, engine.pool.size()))
+        for name, engine in engines.items()
+    ))
+    return dict(zip(engines, counts))
+
 async def close_databases():
     """Close database connections"""
-    await econtrols_engine.dispose()
-    await mykri_engine.dispose()
-    logger.info("Database connections closed")
\ No newline at end of file
+    await registry.dispose()
+    logger.info("Database connections closed")
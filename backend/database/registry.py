@@ -0,0 +1,166 @@
+"""
+Configuration-driven registry of risk applications and their databases.
+
+Each application has a default database and, optionally, shards selected by
+a key from the user's context (e.g. ``country``) plus read replicas for each
+database. Adding an application, a shard or a replica is a configuration
+change (``DATABASE_APPLICATIONS``); callers only ever ask for "the database
+application X uses for this user".
+
+The default database of each application also holds its ``users`` table,
+since a user's context (and so their shard) is not known before it is read.
+"""
+from itertools import cycle
+from typing import Dict, List, Optional
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from config import settings
+from services.admission import admission
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class UnknownApplication(ValueError):
+    def __init__(self, application: str):
+        super().__init__(f"Unknown application: {application}")
+        self.application = application
+
+
+def _create_engine(url: str, pool_size: int, max_overflow: int) -> AsyncEngine:
+    return create_async_engine(
+        url,
+        echo=settings.DATABASE_ECHO,
+        pool_pre_ping=True,
+        pool_size=pool_size,
+        max_overflow=max_overflow
+    )
+
+
+class DatabaseTarget:
+    """One database: its primary engine, read replicas and admission resource"""
+
+    def __init__(self, resource: str, config: dict):
+        self.resource = resource
+        pool_size = config.get("pool_size", settings.DATABASE_POOL_SIZE)
+        max_overflow = config.get("max_overflow", settings.DATABASE_MAX_OVERFLOW)
+
+        self.engine = _create_engine(config["url"], pool_size, max_overflow)
+        self.replicas = [
+            _create_engine(url, pool_size, max_overflow) for url in config.get("replicas", [])
+        ]
+        self._replica_cycle = cycle(self.replicas) if self.replicas else None
+        self.session_factory = async_sessionmaker(
+            self.engine,
+            class_=AsyncSession,
+            expire_on_commit=False
+        )
+
+        # Keep admission below what the pool can actually hand out
+        capacity = config.get("admission_capacity") or max(1, int((pool_size + max_overflow) * 0.8))
+        admission.register(resource, capacity)
+
+    def read_engine(self) -> AsyncEngine:
+        """A replica (round-robin) for unaudited reads, or the primary if there are none"""
+        return next(self._replica_cycle) if self._replica_cycle else self.engine
+
+    def engines(self) -> Dict[str, AsyncEngine]:
+        engines = {self.resource: self.engine}
+        for index, replica in enumerate(self.replicas, start=1):
+            engines[f"{self.resource}/replica-{index}"] = replica
+        return engines
+
+
+class ApplicationDatabases:
+    def __init__(self, name: str, config: dict):
+        self.name = name
+        self.shard_key: Optional[str] = config.get("shard_key")
+        resource = config.get("resource", f"{name.lower()}_db")
+
+        self.default = DatabaseTarget(resource, config)
+        # Shards inherit pool settings from the application unless they override them
+        inherited = {key: value for key, value in config.items() if key not in ("url", "replicas", "shards")}
+        self.shards: Dict[str, DatabaseTarget] = {
+            str(value): DatabaseTarget(f"{resource}/{value}", {**inherited, **shard})
+            for value, shard in config.get("shards", {}).items()
+        }
+
+    def target(self, user_context: Optional[dict] = None) -> DatabaseTarget:
+        if self.shard_key and user_context:
+            shard = self.shards.get(str(user_context.get(self.shard_key)))
+            if shard is not None:
+                return shard
+        return self.default
+
+    def targets(self) -> List[DatabaseTarget]:
+        return [self.default, *self.shards.values()]
+
+
+class DatabaseRegistry:
+    def __init__(self, config: Dict[str, dict]):
+        self._applications = {
+            name: ApplicationDatabases(name, app_config) for name, app_config in config.items()
+        }
+        for name, app in self._applications.items():
+            logger.info(
+                f"Registered {name}: {len(app.shards)} shard(s)"
+                + (f" by {app.shard_key}" if app.shard_key else "")
+            )
+
+    @classmethod
+    def from_settings(cls) -> "DatabaseRegistry":
+        return cls(settings.DATABASE_APPLICATIONS or {
+            "eControls": {
+                "url": settings.econtrols_database_url,
+                "admission_capacity": settings.ADMISSION_ECONTROLS_DB_CAPACITY
+            },
+            "MyKRI": {
+                "url": settings.mykri_database_url,
+                "admission_capacity": settings.ADMISSION_MYKRI_DB_CAPACITY
+            }
+        })
+
+    @property
+    def applications(self) -> List[str]:
+        return list(self._applications)
+
+    def __contains__(self, application: str) -> bool:
+        return application in self._applications
+
+    def application(self, application: str) -> ApplicationDatabases:
+        try:
+            return self._applications[application]
+        except KeyError:
+            raise UnknownApplication(application)
+
+    def target(self, application: str, user_context: Optional[dict] = None) -> DatabaseTarget:
+        """The database ``application`` uses for this user (its default without a context)"""
+        return self.application(application).target(user_context)
+
+    def session_factory(self, application: str, user_context: Optional[dict] = None) -> async_sessionmaker:
+        return self.target(application, user_context).session_factory
+
+    def read_engine(self, application: str, user_context: Optional[dict] = None) -> AsyncEngine:
+        return self.target(application, user_context).read_engine()
+
+    def resource(self, application: str, user_context: Optional[dict] = None) -> str:
+        """Admission resource guarding the database this user is routed to"""
+        return self.target(application, user_context).resource
+
+    def targets(self, application: Optional[str] = None) -> List[DatabaseTarget]:
+        applications = [self.application(application)] if application else self._applications.values()
+        return [target for app in applications for target in app.targets()]
+
+    def default_engines(self) -> Dict[str, AsyncEngine]:
+        """Each application's default database, where its users live"""
+        return {name: app.default.engine for name, app in self._applications.items()}
+
+    def engines(self) -> Dict[str, AsyncEngine]:
+        """Every primary and replica engine, by admission resource name"""
+        engines = {}
+        for target in self.targets():
+            engines.update(target.engines())
+        return engines
+
+    async def dispose(self):
+        for engine in self.engines().values():
+            await engine.dispose()
@@ -0,0 +1,103 @@
+"""
+Schema fingerprints, so start-up only runs DDL when it has changed.
+
+Each component that installs DDL (the ORM models, triggers, rollup tables)
+hashes its statements and keeps the hash in ``schema_fingerprints`` in every
+database it manages. On boot a matching fingerprint costs one SELECT; only a
+new or changed schema takes the advisory lock and runs the DDL, so pods
+starting together apply it once.
+"""
+from typing import Awaitable, Callable, Iterable, List, Optional
+from sqlalchemy import MetaData, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from sqlalchemy.schema import CreateIndex, CreateTable
+from config import settings
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS schema_fingerprints (
+        component VARCHAR(100) PRIMARY KEY,
+        fingerprint VARCHAR(64) NOT NULL,
+        applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+FINGERPRINT_TABLE_EXISTS = text("SELECT to_regclass('schema_fingerprints') IS NOT NULL")
+
+STORED_FINGERPRINT = text("""
+    SELECT fingerprint FROM schema_fingerprints WHERE component = :component
+""")
+
+SAVE_FINGERPRINT = text("""
+    INSERT INTO schema_fingerprints (component, fingerprint)
+    VALUES (:component, :fingerprint)
+    ON CONFLICT (component)
+    DO UPDATE SET fingerprint = EXCLUDED.fingerprint, applied_at = CURRENT_TIMESTAMP
+""")
+
+
+def fingerprint(statements: Iterable[str]) -> str:
+    """Hash of the statements, insensitive to whitespace and formatting"""
+    digest = hashlib.sha256()
+    for statement in statements:
+        digest.update(" ".join(statement.split()).encode())
+        digest.update(b";")
+    return digest.hexdigest()
+
+
+def metadata_statements(metadata: MetaData) -> List[str]:
+    """The CREATE statements ``create_all`` would issue on Postgres"""
+    dialect = postgresql.dialect()
+    statements = []
+    for table in metadata.sorted_tables:
+        statements.append(str(CreateTable(table).compile(dialect=dialect)))
+        statements.extend(
+            str(CreateIndex(index).compile(dialect=dialect))
+            for index in sorted(table.indexes, key=lambda index: index.name or "")
+        )
+    return statements
+
+
+async def _stored(conn: AsyncConnection, component: str) -> Optional[str]:
+    # First boot against this database: nothing stored yet
+    if not (await conn.execute(FINGERPRINT_TABLE_EXISTS)).scalar():
+        return None
+    return (await conn.execute(STORED_FINGERPRINT, {"component": component})).scalar()
+
+
+async def ensure_schema(
+    engine: AsyncEngine,
+    component: str,
+    schema_fingerprint: str,
+    apply: Callable[[AsyncConnection], Awaitable[None]]
+) -> bool:
+    """Run ``apply`` unless ``component`` is already at ``schema_fingerprint``; True if it ran"""
+    if settings.STARTUP_SCHEMA_FINGERPRINT:
+        async with engine.connect() as conn:
+            if await _stored(conn, component) == schema_fingerprint:
+                return False
+
+    async with engine.begin() as conn:
+        # Serializes pods racing to apply the same change; the loser re-checks
+        await conn.execute(text("SELECT pg_advisory_xact_lock(hashtext(:component))"), {"component": component})
+        await conn.execute(text(FINGERPRINT_TABLE_DDL))
+        if settings.STARTUP_SCHEMA_FINGERPRINT and await _stored(conn, component) == schema_fingerprint:
+            return False
+        await apply(conn)
+        await conn.execute(SAVE_FINGERPRINT, {"component": component, "fingerprint": schema_fingerprint})
+
+    logger.info(f"Schema for {component} applied on {engine.url.database}")
+    return True
+
+
+async def ensure_statements(engine: AsyncEngine, component: str, statements: List[str]) -> bool:
+    """``ensure_schema`` for a list of idempotent SQL statements"""
+    async def apply(conn: AsyncConnection):
+        for statement in statements:
+            await conn.execute(text(statement))
+
+    return await ensure_schema(engine, component, fingerprint(statements), apply)
@@ -1,27 +1,55 @@
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Request
+from fastapi import FastAPI, Depends, Header, HTTPException, UploadFile, File, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from sqlalchemy import text
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from pydantic import BaseModel
+from datetime import datetime
 import logging
 import json
 import asyncio
+import hmac
 import tempfile
 import os
 
 from config import settings
-from database.connection import get_econtrols_db, get_mykri_db, init_databases, close_databases
+from database.connection import (
+    SessionRouter, get_sessions, init_databases, close_databases, prewarm_pools, registry
+)
 from agents.sql_agent import RAGBasedAgent
 from services.rag_client import RAGClient
-from services.audit_service import AuditService
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from services.audit_service import AuditService, InvalidCursor
+from services.audit_archive import AuditArchive
+from services.audit_partitions import AuditPartitionManager
+from services.batch_chat import BatchChatRunner
+from services.cache_warmup import CacheWarmer
+from services.jobs import SUCCEEDED, JobManager
+from services.result_store import ResultStore
+from services.conversation import ConversationStore
+from services.direct_fetch import fetch_columns
+from services.export import MEDIA_TYPES, ExportService, parquet_available
+from services.kri_ingestion import IngestionError, detect_format, ingest_kri_values
+from services.kri_breach import KRIBreachEngine
+from services.rollups import RollupService
+from services.federation import FederatedExecutor
+from services.health_monitor import HealthMonitor
+from services.startup import StartupTimer
+from services.log_pipeline import configure_logging
+from services.user_context_cache import UserContextCache
+from services.metrics import metrics
+from services.profiling import Profiler, ProfilingMiddleware
+from services.prompt_budget import prompt_budget
+from services.admission import (
+    BULK, INTERACTIVE, AdmissionRejected, admission, admission_scope
 )
+from services.cancellation import ClientDisconnected, StreamCancellation
+from services.deadline import (
+    DeadlineExceeded, apply_statement_timeout, current_deadline, deadline_expired,
+    deadline_scope, resolve_budget
+)
+
+# Configure logging (queued, structured and sampled; see services/log_pipeline.py)
+log_listener = configure_logging()
 logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
@@ -41,9 +69,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Opt-in per-request stack profiles (see services/profiling.py)
+profiler = Profiler()
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
 # Initialize services
 rag_agent = RAGBasedAgent()
 rag_client = RAGClient()
+batch_runner = BatchChatRunner(rag_agent, rag_client)
+result_store = ResultStore()
+conversation_store = ConversationStore()
+export_service = ExportService(registry)
+breach_engine = KRIBreachEngine(registry)
+federated_executor = FederatedExecutor(rag_agent, registry)
+rollup_service = RollupService(registry)
+audit_partitions = AuditPartitionManager(registry)
+job_manager = JobManager(rag_agent, rag_client, registry)
+health_monitor = HealthMonitor(rag_client, registry.engines())
+user_context_cache = UserContextCache(registry.default_engines())
+cache_warmer = CacheWarmer(rag_agent, registry, user_context_cache)
+startup_timer = StartupTimer()
 
 # ==================== Pydantic Models ====================
 
@@ -60,6 +105,23 @@ class ChatRequest(BaseModel):
     query: str
     user_context: UserContext
     use_streaming: bool = False
+    timeout_seconds: Optional[float] = None  # capped by CHAT_MAX_DEADLINE_SECONDS
+    conversation_id: Optional[str] = None  # returned by the first answer; enables local follow-ups
+
+class BatchChatRequest(BaseModel):
+    queries: List[str]
+    user_context: UserContext
+    timeout_seconds: Optional[float] = None  # per question, capped like ChatRequest
+
+class JobRequest(BaseModel):
+    query: str
+    user_context: UserContext
+
+class ExportRequest(BaseModel):
+    user_context: UserContext
+    format: str = "csv"  # "csv", "ndjson" or "parquet"
+    conversation_id: Optional[str] = None  # export the conversation's last READ query
+    job_id: Optional[str] = None  # or a finished job's query
 
 class DocumentUploadRequest(BaseModel):
     document_name: str
@@ -72,51 +134,138 @@ class QueryExecutionRequest(BaseModel):
     user_context: UserContext
     confirmed: bool = False
 
+# ==================== Exception Handlers ====================
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    """Shed load with 429 + Retry-After instead of queueing without bound"""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 # ==================== Startup/Shutdown Events ====================
 
 @app.on_event("startup")
 async def startup_event():
-    """Initialize databases on startup"""
+    """Initialize databases on startup, overlapping phases that do not depend on each other"""
     logger.info("Starting application...")
-    await init_databases()
     
-    # Test RAG connectivity
-    is_healthy = await rag_client.health_check()
-    if is_healthy:
-        logger.info("RAG API connection successful")
-    else:
-        logger.warning("RAG API connection failed - some features may not work")
+    profiler.install(asyncio.get_running_loop())
+    
+    # RAG and database connectivity are probed (and logged) in the background
+    health_monitor.start()
     
-    logger.info("Application started successfully")
+    # Every database at once: DDL only if its schema fingerprint changed, plus pool warm-up
+    await asyncio.gather(
+        startup_timer.run("schema", init_databases()),
+        startup_timer.run("pool_prewarm", prewarm_pools())
+    )
+    
+    # These only need the base tables
+    await asyncio.gather(
+        startup_timer.run("kri_breach", breach_engine.install()),
+        startup_timer.run("rollups", rollup_service.install()),
+        startup_timer.run("audit_partitions", audit_partitions.install()),
+        startup_timer.run("user_context_cache", user_context_cache.start())
+    )
+    
+    rollup_service.start()
+    audit_partitions.start()
+    job_manager.start()
+    cache_warmer.start()
+    
+    startup_timer.finish()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Close database connections on shutdown"""
     logger.info("Shutting down application...")
+    await health_monitor.stop()
+    await cache_warmer.stop()
+    await job_manager.stop()
+    await rollup_service.stop()
+    await audit_partitions.stop()
+    result_store.clear()
+    await user_context_cache.stop()
     await close_databases()
     logger.info("Application shut down successfully")
+    if log_listener is not None:
+        # Flushes whatever is still queued
+        log_listener.stop()
 
 # ==================== Health Check ====================
 
 @app.get("/api/health")
 async def health_check():
-    """Health check endpoint"""
-    rag_healthy = await rag_client.health_check()
-    
+    """Health check endpoint (served from the background monitor's cached state)"""
     return {
         "status": "healthy",
         "version": settings.APP_VERSION,
-        "rag_api_connected": rag_healthy,
-        "timestamp": "2024-01-01T00:00:00Z"
+        "rag_api_connected": health_monitor.is_healthy("rag_api"),
+        "checks": health_monitor.snapshot(),
+        "timestamp": datetime.utcnow().isoformat() + "Z"
     }
 
+@app.get("/api/health/deep")
+async def deep_health_check():
+    """Probe all dependencies now and report pool utilization"""
+    result = await health_monitor.deep_check()
+    all_healthy = all(check["healthy"] for check in result["checks"].values())
+    
+    return {
+        "status": "healthy" if all_healthy else "degraded",
+        "version": settings.APP_VERSION,
+        **result,
+        "admission": admission.snapshot(),
+        "jobs": job_manager.snapshot(),
+        "rollups": rollup_service.snapshot(),
+        "audit_partitions": audit_partitions.snapshot(),
+        "cache_warmup": cache_warmer.snapshot(),
+        "startup": startup_timer.snapshot(),
+        "timestamp": datetime.utcnow().isoformat() + "Z"
+    }
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """In-process counters and histograms"""
+    return metrics.snapshot()
+
+# ==================== Profiles ====================
+
+def _require_profiling_token(x_profile_token: Optional[str] = Header(None)):
+    if not settings.PROFILING_TOKEN or not x_profile_token or not hmac.compare_digest(
+        x_profile_token, settings.PROFILING_TOKEN
+    ):
+        raise HTTPException(status_code=403, detail="Profiling token required")
+
+@app.get("/api/admin/profiles", dependencies=[Depends(_require_profiling_token)])
+async def list_profiles():
+    """Recently captured request profiles, newest first"""
+    return {"profiles": profiler.list()}
+
+@app.get("/api/admin/profiles/{profile_id}", dependencies=[Depends(_require_profiling_token)])
+async def get_profile(profile_id: str):
+    """One profile as folded stacks (flamegraph.pl, speedscope, inferno)"""
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found or evicted")
+    return PlainTextResponse(
+        profile.folded(),
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.folded"'}
+    )
+
 # ==================== Chat Endpoint ====================
 
+def _db_priority(intent: str) -> str:
+    # Interactive READs go ahead of writes/deletes competing for the same pool
+    return INTERACTIVE if intent == "READ" else BULK
+
 @app.post("/api/chat")
 async def chat(
     request: ChatRequest,
-    econtrols_db: AsyncSession = Depends(get_econtrols_db),
-    mykri_db: AsyncSession = Depends(get_mykri_db)
+    sessions: SessionRouter = Depends(get_sessions)
 ):
     """
     Main chat endpoint - handles all queries
@@ -128,158 +277,91 @@ async def chat(
     4. Execute query (if safe or confirmed)
     5. Log to audit
     6. Generate response using RAG
+    
+    Follow-ups that only filter/sort/group/limit the conversation's last
+    result are answered from memory without any of the above.
     """
-    try:
-        # Step 1: Classify intent
-        classification = await rag_agent.classify_intent(
-            request.query,
-            request.user_context.dict()
-        )
-        
-        logger.info(f"Query classified: {classification}")
-        
-        # Step 2: Handle RAG-only queries (no database)
-        if classification["application"] == "RAG_ONLY":
-            # Query only RAG documents
-            rag_result = await rag_client.query_rag(
-                query=request.query,
-                top_k=5
-            )
-            
-            response_text = await rag_agent.generate_response(
-                query_result=None,
-                original_query=request.query,
-                rag_context=rag_result.get("context", "")
-            )
-            
-            return {
-                "response": response_text,
-                "sources": rag_result.get("sources", []),
-                "classification": classification
-            }
-        
-        # Step 3: Generate SQL query with user context
-        sql_info = await rag_agent.generate_sql_query(
-            user_query=request.query,
-            application=classification["application"],
-            user_context=request.user_context.dict(),
-            intent=classification["intent"]
-        )
-        
-        # Step 4: Check if confirmation needed (CRITICAL SAFETY CHECK)
-        if classification.get("requires_confirmation") and classification["intent"] in ["WRITE", "DELETE"]:
-            logger.info(f"Query requires confirmation: {sql_info['sql_query']}")
-            return {
-                "requires_confirmation": True,
-                "sql_query": sql_info["sql_query"],
-                "application": classification["application"],
-                "message": f"This operation will modify data in {classification['application']}. Please confirm to proceed.",
-                "classification": classification
-            }
-        
-        # Step 5: Execute query (auto-execute for READ, or if already confirmed)
-        db_session = econtrols_db if classification["application"] == "eControls" else mykri_db
-        
+    conversation_id = request.conversation_id or conversation_store.new_id()
+    
+    with deadline_scope(resolve_budget(request.timeout_seconds)), \
+            admission_scope(request.user_context.user_id):
         try:
-            result = await db_session.execute(text(sql_info["sql_query"]))
+            if request.conversation_id:
+                local = conversation_store.answer_locally(
+                    conversation_id, request.user_context.user_id, request.query
+                )
+                if local is not None:
+                    return await _follow_up_response(conversation_id, request.user_context.user_id, *local)
             
-            if classification["intent"] == "READ":
-                rows = result.fetchall()
-                query_result = [dict(row._mapping) for row in rows]
-            else:
-                await db_session.commit()
-                query_result = {"affected_rows": result.rowcount}
-            
-            # Step 6: Log audit (successful operation)
-            await AuditService.log_operation(
-                session=db_session,
-                user_id=request.user_context.user_id,
-                username=request.user_context.username,
-                application=classification["application"],
-                operation=classification["intent"],
-                table_name="multi_table_query",
-                query_executed=sql_info["sql_query"],
-                success=True
-            )
-            
-        except Exception as db_error:
-            logger.error(f"Database error: {db_error}")
+            # "Which KRIs are in breach" is evaluated directly on the typed KRI columns
+            if breach_engine.is_breach_question(request.query):
+                async with admission.slot(registry.resource("MyKRI", request.user_context.dict())):
+                    report = await breach_engine.breaches(request.user_context.dict())
+                return {
+                    "response": breach_engine.summarize(report),
+                    "data": report["breaches"],
+                    "row_count": report["breached"],
+                    "classification": {
+                        "application": "MyKRI",
+                        "intent": "READ",
+                        "requires_confirmation": False
+                    },
+                    "conversation_id": conversation_id
+                }
             
-            # Log failed operation
-            await AuditService.log_operation(
-                session=db_session,
-                user_id=request.user_context.user_id,
-                username=request.user_context.username,
-                application=classification["application"],
-                operation=classification["intent"],
-                table_name="multi_table_query",
-                query_executed=sql_info["sql_query"],
-                success=False,
-                error_message=str(db_error)
-            )
-            
-            raise HTTPException(status_code=500, detail=f"Database error: {str(db_error)}")
-        
-        # Step 7: Get additional RAG context (optional)
-        rag_result = await rag_client.query_rag(
-            query=request.query,
-            top_k=3
-        )
-        
-        # Step 8: Generate natural language response
-        response_text = await rag_agent.generate_response(
-            query_result=query_result,
-            original_query=request.query,
-            rag_context=rag_result.get("context", "")
-        )
-        
-        return {
-            "response": response_text,
-            "data": query_result if classification["intent"] == "READ" else None,
-            "sql_executed": sql_info["sql_query"],
-            "sources": rag_result.get("sources", []),
-            "classification": classification
-        }
-        
-    except Exception as e:
-        logger.error(f"Chat error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-# ==================== Streaming Chat Endpoint ====================
-
-@app.post("/api/chat/stream")
-async def chat_stream(
-    request: ChatRequest,
-    econtrols_db: AsyncSession = Depends(get_econtrols_db),
-    mykri_db: AsyncSession = Depends(get_mykri_db)
-):
-    """Streaming chat endpoint"""
-    
-    async def generate_stream():
-        try:
-            # Classify intent
-            yield f"data: {json.dumps({'type': 'status', 'message': 'Analyzing query...'})}\n\n"
+            # Scope-level counts are read from the incrementally maintained rollups
+            rollup = rollup_service.match(request.query, request.user_context.dict())
+            if rollup is not None:
+                answer = await rollup_service.answer(rollup, request.query, request.user_context.dict())
+                return {
+                    "response": answer["response"],
+                    "data": answer["data"],
+                    "row_count": answer["row_count"],
+                    "classification": {
+                        "application": answer["application"],
+                        "intent": "READ",
+                        "requires_confirmation": False
+                    },
+                    "rollup": rollup,
+                    "refreshed_at": answer["refreshed_at"],
+                    "conversation_id": conversation_id
+                }
             
+            # Step 1: Classify intent
             classification = await rag_agent.classify_intent(
                 request.query,
                 request.user_context.dict()
             )
             
-            yield f"data: {json.dumps({'type': 'classification', 'data': classification})}\n\n"
+            logger.info("Query classified: %s", classification, extra={"category": "classification"})
             
-            # Handle RAG only
+            # Step 2: Handle RAG-only queries (no database)
             if classification["application"] == "RAG_ONLY":
-                yield f"data: {json.dumps({'type': 'status', 'message': 'Searching documents...'})}\n\n"
+                # Query only RAG documents
+                retrieval = prompt_budget.retrieval(request.query, default_top_k=5)
+                rag_result = await rag_client.query_rag(
+                    query=retrieval.text,
+                    top_k=retrieval.top_k
+                )
                 
-                async for chunk in rag_client.query_rag_stream(request.query):
-                    yield f"data: {json.dumps({'type': 'content', 'chunk': chunk})}\n\n"
+                response_text = await rag_agent.generate_response(
+                    query_result=None,
+                    original_query=request.query,
+                    rag_context=rag_result.get("context", "")
+                )
                 
-                yield "data: [DONE]\n\n"
-                return
+                return {
+                    "response": response_text,
+                    "sources": rag_result.get("sources", []),
+                    "classification": classification,
+                    "conversation_id": conversation_id
+                }
             
-            # Generate SQL
-            yield f"data: {json.dumps({'type': 'status', 'message': 'Generating query...'})}\n\n"
+            # Questions spanning both applications run on both databases at once
+            if federated_executor.is_federated(classification):
+                return await _federated_response(request, classification, conversation_id)
             
+            # Step 3: Generate SQL query with user context
             sql_info = await rag_agent.generate_sql_query(
                 user_query=request.query,
                 application=classification["application"],
@@ -287,46 +369,484 @@ async def chat_stream(
                 intent=classification["intent"]
             )
             
-            # Execute query
-            yield f"data: {json.dumps({'type': 'status', 'message': 'Executing query...'})}\n\n"
+            # Step 4: Check if confirmation needed (CRITICAL SAFETY CHECK)
+            if classification.get("requires_confirmation") and classification["intent"] in ["WRITE", "DELETE"]:
+                logger.info("Query requires confirmation: %s", sql_info["sql_query"], extra={"category": "sql"})
+                return {
+                    "requires_confirmation": True,
+                    "sql_query": sql_info["sql_query"],
+                    "application": classification["application"],
+                    "message": f"This operation will modify data in {classification['application']}. Please confirm to proceed.",
+                    "classification": classification,
+                    "conversation_id": conversation_id
+                }
             
-            db_session = econtrols_db if classification["application"] == "eControls" else mykri_db
-            result = await db_session.execute(text(sql_info["sql_query"]))
+            # Step 5: Execute query (auto-execute for READ, or if already confirmed)
+            # Routed by application, then by the user's shard key
+            user_context = request.user_context.dict()
+            db_session = sessions.get(classification["application"], user_context)
             
+            try:
+                async with admission.slot(
+                    registry.resource(classification["application"], user_context),
+                    priority=_db_priority(classification["intent"])
+                ):
+                    await apply_statement_timeout(db_session, "database query")
+                    
+                    if classification["intent"] == "READ":
+                        fetched = await fetch_columns(db_session, sql_info["sql_query"])
+                    else:
+                        result = await db_session.execute(text(sql_info["sql_query"]))
+                        await db_session.commit()
+                        query_result = {"affected_rows": result.rowcount}
+                
+                # Step 6: Log audit (successful operation)
+                await AuditService.log_operation(
+                    session=db_session,
+                    user_id=request.user_context.user_id,
+                    username=request.user_context.username,
+                    application=classification["application"],
+                    operation=classification["intent"],
+                    table_name="multi_table_query",
+                    query_executed=sql_info["sql_query"],
+                    question=request.query,
+                    success=True
+                )
+                
+            except (DeadlineExceeded, AdmissionRejected):
+                raise
+            except Exception as db_error:
+                logger.error(f"Database error: {db_error}")
+                
+                # The failed statement aborted the transaction; audit in a fresh one
+                await db_session.rollback()
+                
+                # Log failed operation
+                await AuditService.log_operation(
+                    session=db_session,
+                    user_id=request.user_context.user_id,
+                    username=request.user_context.username,
+                    application=classification["application"],
+                    operation=classification["intent"],
+                    table_name="multi_table_query",
+                    query_executed=sql_info["sql_query"],
+                    question=request.query,
+                    success=False,
+                    error_message=str(db_error)
+                )
+                
+                # statement_timeout fired because the request budget ran out
+                current_deadline().check("database query")
+                raise HTTPException(status_code=500, detail=f"Database error: {str(db_error)}")
+            
+            # Only the first page goes back inline; the rest is kept behind a handle
+            result_handle = None
+            total_rows = None
             if classification["intent"] == "READ":
-                rows = result.fetchall()
-                query_result = [dict(row._mapping) for row in rows]
+                conversation_store.remember_result(
+                    conversation_id,
+                    request.user_context.user_id,
+                    classification,
+                    sql_info["sql_query"],
+                    fetched
+                )
+                total_rows = fetched.row_count
+                query_result, result_handle = await result_store.paginate(
+                    request.user_context.user_id, fetched.columns, fetched.encoded_rows(), settings.RESULT_PAGE_SIZE
+                )
+                del fetched
             else:
-                await db_session.commit()
-                query_result = {"affected_rows": result.rowcount}
-            
-            # Generate response
-            yield f"data: {json.dumps({'type': 'status', 'message': 'Generating response...'})}\n\n"
-            
-            response_text = await rag_agent.generate_response(
-                query_result=query_result,
-                original_query=request.query
-            )
+                # The cached result may no longer match the data
+                conversation_store.forget(conversation_id)
             
-            # Stream response in chunks
-            words = response_text.split()
-            for i in range(0, len(words), 5):
-                chunk = ' '.join(words[i:i+5])
-                yield f"data: {json.dumps({'type': 'content', 'chunk': chunk + ' '})}\n\n"
-                await asyncio.sleep(0.05)
+            # Steps 7-8 only dress up data we already have: if the budget runs
+            # out here, return the data with a plain summary instead of a 504
+            partial = False
+            try:
+                # Step 7: Get additional RAG context (optional)
+                retrieval = prompt_budget.retrieval(request.query, default_top_k=3)
+                rag_result = await rag_client.query_rag(
+                    query=retrieval.text,
+                    top_k=retrieval.top_k
+                )
+                
+                # Step 8: Generate natural language response
+                response_text = await rag_agent.generate_response(
+                    query_result=query_result,
+                    original_query=request.query,
+                    rag_context=rag_result.get("context", ""),
+                    total_rows=total_rows
+                )
+            except DeadlineExceeded as e:
+                logger.warning(f"Returning partial answer: {e}")
+                partial = True
+                rag_result = {}
+                response_text = RAGBasedAgent.fallback_response(query_result, total_rows)
             
-            yield f"data: {json.dumps({'type': 'data', 'result': query_result})}\n\n"
-            yield "data: [DONE]\n\n"
+            return {
+                "response": response_text,
+                "data": query_result if classification["intent"] == "READ" else None,
+                "total_rows": total_rows,
+                "result_handle": result_handle,
+                "sql_executed": sql_info["sql_query"],
+                "sources": rag_result.get("sources", []),
+                "classification": classification,
+                "partial": partial,
+                "conversation_id": conversation_id
+            }
             
+        except (HTTPException, AdmissionRejected):
+            raise
+        except DeadlineExceeded as e:
+            logger.warning(f"Chat timed out: {e}")
+            raise HTTPException(status_code=504, detail=str(e))
         except Exception as e:
-            logger.error(f"Streaming error: {e}")
-            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+            logger.error(f"Chat error: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+async def _follow_up_response(conversation_id: str, user_id: int, state, refined) -> dict:
+    refinements = state.describe()
+    data, result_handle = await result_store.paginate(
+        user_id, refined.columns, refined.rows(), settings.RESULT_PAGE_SIZE
+    )
+    return {
+        "response": (
+            f"Applied {', '.join(refinements)} to the previous result: "
+            f"{refined.row_count} row(s)."
+        ),
+        "data": data,
+        "total_rows": refined.row_count,
+        "result_handle": result_handle,
+        "sql_executed": state.sql_query,
+        "sources": [],
+        "classification": state.classification,
+        "partial": False,
+        "conversation_id": conversation_id,
+        "refinements": refinements,
+        "answered_locally": True
+    }
+
+async def _federated_response(request: ChatRequest, classification: dict, conversation_id: str) -> dict:
+    if classification["intent"] != "READ":
+        raise HTTPException(
+            status_code=400,
+            detail="Changes must target one application at a time; ask about controls and KRIs separately"
+        )
+    
+    user_id = request.user_context.user_id
+    federated = await federated_executor.run(request.query, classification, request.user_context.dict())
+    
+    # Follow-ups refine the merged rows; there is no single statement to export
+    conversation_store.remember(
+        conversation_id, user_id, classification, None, federated.columns, federated.rows
+    )
+    total_rows = len(federated.rows)
+    query_result, result_handle = await result_store.paginate(
+        user_id, federated.columns, federated.rows, settings.RESULT_PAGE_SIZE
+    )
+    
+    partial = False
+    try:
+        retrieval = prompt_budget.retrieval(request.query, default_top_k=3)
+        rag_result = await rag_client.query_rag(query=retrieval.text, top_k=retrieval.top_k)
+        response_text = await rag_agent.generate_response(
+            query_result=query_result,
+            original_query=request.query,
+            rag_context=rag_result.get("context", ""),
+            total_rows=total_rows
+        )
+    except DeadlineExceeded as e:
+        logger.warning(f"Returning partial answer: {e}")
+        partial = True
+        rag_result = {}
+        response_text = RAGBasedAgent.fallback_response(query_result, total_rows)
+    
+    return {
+        "response": response_text,
+        "data": query_result,
+        "total_rows": total_rows,
+        "result_handle": result_handle,
+        "sql_executed": federated.statements,
+        "join_keys": federated.join_keys,
+        "merge_mode": federated.mode,
+        "sources": rag_result.get("sources", []),
+        "classification": classification,
+        "partial": partial,
+        "conversation_id": conversation_id
+    }
+
+# ==================== Streaming Chat Endpoint ====================
+
+@app.post("/api/chat/stream")
+async def chat_stream(
+    request: ChatRequest,
+    http_request: Request,
+    sessions: SessionRouter = Depends(get_sessions)
+):
+    """Streaming chat endpoint (upstream work is cancelled if the client disconnects)"""
+    
+    async def generate_stream():
+        with deadline_scope(resolve_budget(request.timeout_seconds)), \
+                admission_scope(request.user_context.user_id):
+            async with StreamCancellation(http_request) as cancellation:
+                try:
+                    # Classify intent
+                    yield f"data: {json.dumps({'type': 'status', 'message': 'Analyzing query...'})}\n\n"
+                    
+                    classification = await cancellation.run(
+                        "classification",
+                        rag_agent.classify_intent(request.query, request.user_context.dict())
+                    )
+                    
+                    yield f"data: {json.dumps({'type': 'classification', 'data': classification})}\n\n"
+                    
+                    # Handle RAG only
+                    if classification["application"] == "RAG_ONLY":
+                        yield f"data: {json.dumps({'type': 'status', 'message': 'Searching documents...'})}\n\n"
+                        
+                        async for chunk in cancellation.iterate("RAG stream", rag_client.query_rag_stream(request.query)):
+                            yield f"data: {json.dumps({'type': 'content', 'chunk': chunk})}\n\n"
+                        
+                        yield "data: [DONE]\n\n"
+                        return
+                    
+                    if federated_executor.is_federated(classification):
+                        yield f"data: {json.dumps({'type': 'status', 'message': 'Querying eControls and MyKRI...'})}\n\n"
+                        
+                        federated = await cancellation.run("federated query", federated_executor.run(
+                            request.query, classification, request.user_context.dict()
+                        ))
+                        total_rows = len(federated.rows)
+                        query_result, result_handle = await result_store.paginate(
+                            request.user_context.user_id, federated.columns, federated.rows, settings.RESULT_PAGE_SIZE
+                        )
+                    else:
+                        # Generate SQL
+                        yield f"data: {json.dumps({'type': 'status', 'message': 'Generating query...'})}\n\n"
+                        
+                        sql_info = await cancellation.run("SQL generation", rag_agent.generate_sql_query(
+                            user_query=request.query,
+                            application=classification["application"],
+                            user_context=request.user_context.dict(),
+                            intent=classification["intent"]
+                        ))
+                        
+                        # Execute query
+                        yield f"data: {json.dumps({'type': 'status', 'message': 'Executing query...'})}\n\n"
+                        
+                        user_context = request.user_context.dict()
+                        db_session = sessions.get(classification["application"], user_context)
+                        async with admission.slot(
+                            registry.resource(classification["application"], user_context),
+                            priority=_db_priority(classification["intent"])
+                        ):
+                            await apply_statement_timeout(db_session, "database query")
+                        
+                            if classification["intent"] == "READ":
+                                fetched = await cancellation.fetch_columns(db_session, sql_info["sql_query"])
+                            else:
+                                result = await cancellation.execute(db_session, sql_info["sql_query"])
+                                await db_session.commit()
+                                query_result = {"affected_rows": result.rowcount}
+                        
+                        result_handle = None
+                        total_rows = None
+                        if classification["intent"] == "READ":
+                            total_rows = fetched.row_count
+                            query_result, result_handle = await result_store.paginate(
+                                request.user_context.user_id, fetched.columns, fetched.encoded_rows(),
+                                settings.RESULT_PAGE_SIZE
+                            )
+                            del fetched
+                    
+                    # Generate response
+                    yield f"data: {json.dumps({'type': 'status', 'message': 'Generating response...'})}\n\n"
+                    
+                    try:
+                        response_text = await cancellation.run("response generation", rag_agent.generate_response(
+                            query_result=query_result,
+                            original_query=request.query,
+                            total_rows=total_rows
+                        ))
+                    except DeadlineExceeded as e:
+                        logger.warning(f"Streaming partial answer: {e}")
+                        response_text = RAGBasedAgent.fallback_response(query_result, total_rows)
+                    
+                    # Stream response in chunks
+                    words = response_text.split()
+                    for i in range(0, len(words), 5):
+                        cancellation.check()
+                        chunk = ' '.join(words[i:i+5])
+                        yield f"data: {json.dumps({'type': 'content', 'chunk': chunk + ' '})}\n\n"
+                        await asyncio.sleep(0.05)
+                    
+                    yield f"data: {json.dumps({'type': 'data', 'result': query_result, 'total_rows': total_rows, 'result_handle': result_handle}, default=str)}\n\n"
+                    yield "data: [DONE]\n\n"
+                    
+                except ClientDisconnected:
+                    # Handled (and suppressed) by StreamCancellation
+                    raise
+                except DeadlineExceeded as e:
+                    logger.warning(f"Streaming timed out: {e}")
+                    yield f"data: {json.dumps({'type': 'error', 'message': str(e), 'timeout': True})}\n\n"
+                except AdmissionRejected as e:
+                    logger.warning(f"Streaming request shed: {e}")
+                    yield f"data: {json.dumps({'type': 'error', 'message': str(e), 'retry_after': e.retry_after})}\n\n"
+                except Exception as e:
+                    logger.error(f"Streaming error: {e}")
+                    error = {'type': 'error', 'message': str(e)}
+                    if deadline_expired():
+                        # e.g. statement_timeout fired because the request budget ran out
+                        error['timeout'] = True
+                    yield f"data: {json.dumps(error)}\n\n"
     
     return StreamingResponse(
         generate_stream(),
         media_type="text/event-stream"
     )
 
+# ==================== Batch Chat Endpoint ====================
+
+@app.post("/api/chat/batch")
+async def chat_batch(
+    request: BatchChatRequest,
+    sessions: SessionRouter = Depends(get_sessions)
+):
+    """
+    Answer a list of questions for one user, streamed back as NDJSON
+    
+    Each line carries the ``indices`` of the submitted questions it answers
+    (duplicates are answered once); the last line is a summary.
+    """
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="No queries provided")
+    if len(request.queries) > settings.BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.BATCH_MAX_QUESTIONS} queries per batch"
+        )
+    
+    async def generate_results():
+        # Scripted work queues behind interactive requests for shared capacity
+        with admission_scope(request.user_context.user_id, BULK):
+            async for result in batch_runner.run(
+                request.queries,
+                request.user_context.dict(),
+                sessions,
+                resolve_budget(request.timeout_seconds)
+            ):
+                yield json.dumps(result, default=str) + "\n"
+    
+    return StreamingResponse(
+        generate_results(),
+        media_type="application/x-ndjson"
+    )
+
+# ==================== Async Jobs ====================
+
+@app.post("/api/jobs", status_code=202)
+async def submit_job(request: JobRequest):
+    """Queue a long-running question; poll its status and fetch the result later"""
+    job = job_manager.submit(request.query, request.user_context.dict())
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/api/jobs/{job.id}",
+        "result_url": f"/api/jobs/{job.id}/result"
+    }
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, user_id: int):
+    """Job status"""
+    job = job_manager.get(job_id, user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job.to_dict()
+
+@app.get("/api/jobs/{job_id}/result")
+async def get_job_result(
+    job_id: str,
+    user_id: int,
+    offset: int = 0,
+    limit: int = settings.RESULT_PAGE_SIZE
+):
+    """One page of a finished job's rows, plus the generated answer"""
+    job = job_manager.get(job_id, user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    if job.status != SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    
+    page = await job.result.page_response(offset, limit) if job.result else {"data": None}
+    
+    return {
+        "job_id": job.id,
+        "response": job.response,
+        "sql_executed": job.sql_query,
+        "sources": job.sources,
+        "classification": job.classification,
+        **page
+    }
+
+# ==================== Result Pages ====================
+
+@app.get("/api/results/{handle}")
+async def get_result_page(
+    handle: str,
+    user_id: int,
+    offset: int = 0,
+    limit: int = settings.RESULT_PAGE_SIZE
+):
+    """Further pages of a chat answer that was returned with a result_handle"""
+    stored = result_store.get(handle, user_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Result not found or expired")
+    return {"result_handle": handle, **await stored.page_response(offset, limit)}
+
+# ==================== Export ====================
+
+@app.post("/api/export")
+async def export_results(request: ExportRequest):
+    """
+    Stream the full result of an earlier READ query as CSV, NDJSON or Parquet
+    
+    The query is re-executed through a server-side cursor, so the download
+    is not limited to the rows that were returned in the chat answer.
+    """
+    export_format = request.format.lower()
+    if export_format not in MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format: {request.format}")
+    if export_format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export requires pyarrow")
+    
+    user_id = request.user_context.user_id
+    if request.job_id:
+        job = job_manager.get(request.job_id, user_id)
+        source = (job.classification, job.sql_query) if job and job.sql_query else None
+    elif request.conversation_id:
+        state = conversation_store.get(request.conversation_id, user_id)
+        source = (state.classification, state.sql_query) if state and state.sql_query else None
+    else:
+        raise HTTPException(status_code=400, detail="conversation_id or job_id is required")
+    
+    if source is None:
+        raise HTTPException(status_code=404, detail="No exportable query found (it may have expired)")
+    classification, sql_query = source
+    if classification.get("intent") != "READ":
+        raise HTTPException(status_code=400, detail="Only READ queries can be exported")
+    
+    filename = f"export-{datetime.utcnow():%Y%m%d-%H%M%S}.{export_format}"
+    return StreamingResponse(
+        export_service.stream(
+            classification["application"],
+            sql_query,
+            export_format,
+            request.user_context.dict()
+        ),
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 # ==================== Document Upload ====================
 
 @app.post("/api/documents/upload")
@@ -363,40 +883,145 @@ async def upload_document(
         logger.error(f"Document upload error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# ==================== KRI Bulk Ingestion ====================
+
+@app.post("/api/kri/values/bulk")
+async def bulk_ingest_kri_values(
+    user_id: int,
+    file: UploadFile = File(...),
+    format: Optional[str] = None,
+    strict: bool = False,
+    sessions: SessionRouter = Depends(get_sessions)
+):
+    """
+    Load many KRI values from a CSV or NDJSON upload
+    
+    Columns/keys: kri_ref (or kri_id), kri_value, optional entry_date and
+    comments. Rows for KRIs outside the uploader's ou/lre/country are
+    rejected; with ``strict`` any rejection aborts the whole upload.
+    """
+    user = await user_context_cache.get("MyKRI", user_id, sessions.get("MyKRI"))
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    try:
+        upload_format = detect_format(file.filename, format)
+    except IngestionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    with admission_scope(user_id, BULK):
+        async with admission.slot(registry.resource("MyKRI", user), weight=settings.ADMISSION_INGEST_WEIGHT):
+            report = await ingest_kri_values(
+                sessions.get("MyKRI", user), file.file, upload_format, file.filename, user, strict
+            )
+    
+    if not report["success"]:
+        raise HTTPException(status_code=422, detail=report)
+    return report
+
+# ==================== KRI Breaches ====================
+
+@app.get("/api/kri/breaches")
+async def get_kri_breaches(user_id: int, sessions: SessionRouter = Depends(get_sessions)):
+    """Active KRIs in the user's scope whose latest value breaches its threshold"""
+    user = await user_context_cache.get("MyKRI", user_id, sessions.get("MyKRI"))
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    with admission_scope(user_id):
+        async with admission.slot(registry.resource("MyKRI", user)):
+            return await breach_engine.breaches(user)
+
+@app.get("/api/kri/trends")
+async def get_kri_trends(
+    user_id: int,
+    points: int = settings.KRI_TREND_POINTS,
+    sessions: SessionRouter = Depends(get_sessions)
+):
+    """Recent values per KRI with breach flags and whether each is worsening"""
+    user = await user_context_cache.get("MyKRI", user_id, sessions.get("MyKRI"))
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    with admission_scope(user_id):
+        async with admission.slot(registry.resource("MyKRI", user)):
+            trends = await breach_engine.trends(user, points)
+    return {
+        "kris": trends,
+        "worsening": [trend["kri_ref"] for trend in trends if trend["worsening"]]
+    }
+
+# ==================== Audit History ====================
+
+async def _audit_page(user_id: int, application: str, sessions: SessionRouter, query) -> dict:
+    if application not in registry:
+        raise HTTPException(status_code=404, detail=f"Unknown application: {application}")
+    user = await user_context_cache.get(application, user_id, sessions.get(application))
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    resource = registry.resource(application, user)
+    with admission_scope(user_id):
+        async with admission.slot(resource):
+            # Audit records are written where the user's queries run; reads can use a replica
+            async with registry.read_engine(application, user).connect() as conn:
+                try:
+                    return await query(conn, AuditArchive(resource))
+                except InvalidCursor as e:
+                    raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/audit/history")
+async def get_audit_history(
+    user_id: int,
+    application: str = "MyKRI",
+    limit: int = settings.AUDIT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    detail: bool = False,
+    sessions: SessionRouter = Depends(get_sessions)
+):
+    """The user's audited operations, newest first (archived ones included); pass ``next_cursor`` back for the next page"""
+    return await _audit_page(user_id, application, sessions, lambda conn, archive: AuditService.get_user_audit_history(
+        conn, user_id, limit=limit, cursor=cursor, detail=detail, archive=archive
+    ))
+
+@app.get("/api/audit/records")
+async def get_record_audit(
+    user_id: int,
+    application: str,
+    table_name: str,
+    record_id: str,
+    limit: int = settings.AUDIT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    sessions: SessionRouter = Depends(get_sessions)
+):
+    """Audit trail (who changed what) of one record, newest first"""
+    return await _audit_page(user_id, application, sessions, lambda conn, archive: AuditService.get_operation_audit(
+        conn, application, table_name, record_id, limit=limit, cursor=cursor, archive=archive
+    ))
+
 # ==================== Get User Context ====================
 
 @app.get("/api/user/context/{user_id}")
 async def get_user_context(
     user_id: int,
     application: str,
-    econtrols_db: AsyncSession = Depends(get_econtrols_db),
-    mykri_db: AsyncSession = Depends(get_mykri_db)
+    sessions: SessionRouter = Depends(get_sessions)
 ):
-    """Get user context (OU, LRE, Country) from database"""
+    """Get user context (OU, LRE, Country), cached per application and user"""
     try:
-        db_session = econtrols_db if application == "eControls" else mykri_db
-        
-        query = text("""
-            SELECT user_id, username, email, user_ou, user_lre, user_country
-            FROM users
-            WHERE user_id = :user_id AND is_active = true
-        """)
+        if application not in registry:
+            application = "MyKRI"
         
-        result = await db_session.execute(query, {"user_id": user_id})
-        user = result.fetchone()
+        # Users live in each application's default (unsharded) database
+        user = await user_context_cache.get(application, user_id, sessions.get(application))
         
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         
-        return {
-            "user_id": user.user_id,
-            "username": user.username,
-            "email": user.email,
-            "ou": user.user_ou,
-            "lre": user.user_lre,
-            "country": user.user_country
-        }
+        return user
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching user context: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Boolean, JSON, Numeric
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -75,6 +75,10 @@ class KRIIndicator(Base):
     kri_description = Column(Text)
     kri_category = Column(String(100))
     threshold_value = Column(String(100))
+    # Parsed from threshold_value by a trigger, e.g. '>85%' -> '>', 85, '%'
+    threshold_operator = Column(String(2))
+    threshold_bound = Column(Numeric)
+    threshold_unit = Column(String(10))
     ou = Column(String(100), nullable=False)
     lre = Column(String(100), nullable=False)
     country = Column(String(100), nullable=False)
@@ -89,6 +93,9 @@ class KRIValue(Base):
     kri_id = Column(Integer, ForeignKey("kri_indicators.kri_id"))
     entered_by = Column(Integer, ForeignKey("users.user_id"))
     kri_value = Column(String(255), nullable=False)
+    # Parsed from kri_value by a trigger
+    kri_value_numeric = Column(Numeric)
+    kri_value_unit = Column(String(10))
     entry_date = Column(DateTime, default=datetime.utcnow)
     comments = Column(Text)
     
@@ -108,6 +115,7 @@ class AuditLog(Base):
     table_name = Column(String(100), nullable=False)
     record_id = Column(String(100))
     query_executed = Column(Text)
+    question = Column(Text)  # The user's question, for chat-driven operations
     changes = Column(JSON)  # Store before/after values for updates
     timestamp = Column(DateTime, default=datetime.utcnow)
     ip_address = Column(String(50))
@@ -0,0 +1,265 @@
+"""
+Admission control for RAG API and database concurrency.
+
+Each upstream resource has a weighted capacity: an interactive request holds
+one unit, heavy work (bulk ingestion, streaming exports, async jobs) holds
+the ADMISSION_*_WEIGHT configured for it. Requests that cannot start
+immediately wait in per-priority queues that are served round-robin across
+users, so one user scripting the API cannot starve everyone else, and
+interactive READs are admitted ahead of bulk work. When a queue is full the
+caller gets AdmissionRejected, which the API turns into 429 + Retry-After.
+"""
+from collections import OrderedDict, defaultdict, deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Deque, Dict, Iterator, Optional
+from config import settings
+from services.deadline import DeadlineExceeded, current_deadline
+from services.metrics import metrics
+import asyncio
+import math
+import time
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITIES = (INTERACTIVE, BULK)
+
+SYSTEM_USER = "system"
+
+queue_time = metrics.histogram(
+    "admission_queue_seconds",
+    "Time spent waiting for an admission slot"
+)
+rejections = metrics.counter(
+    "admission_rejected_total",
+    "Requests refused by admission control"
+)
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, resource: str, reason: str, retry_after: int):
+        self.resource = resource
+        self.reason = reason
+        self.retry_after = retry_after
+        super().__init__(f"{resource} is busy ({reason}), retry after {retry_after}s")
+
+
+class _Waiter:
+    __slots__ = ("user", "weight", "future")
+
+    def __init__(self, user: str, weight: int, future: asyncio.Future):
+        self.user = user
+        self.weight = weight
+        self.future = future
+
+
+class ResourcePool:
+    """Weighted semaphore with per-user fair queuing and two priority classes"""
+
+    def __init__(
+        self,
+        name: str,
+        capacity: int,
+        max_queue: int,
+        per_user_limit: int,
+        per_user_max_queue: int
+    ):
+        self.name = name
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.per_user_limit = per_user_limit
+        self.per_user_max_queue = per_user_max_queue
+
+        self.in_use = 0
+        self.waiting = 0
+        self._active_by_user: Dict[str, int] = defaultdict(int)
+        self._queued_by_user: Dict[str, int] = defaultdict(int)
+        # priority -> user -> FIFO of that user's waiters (users served round-robin)
+        self._queues: Dict[str, "OrderedDict[str, Deque[_Waiter]]"] = {
+            priority: OrderedDict() for priority in PRIORITIES
+        }
+        self._avg_hold_seconds = 0.5
+
+    def _retry_after(self) -> int:
+        backlog = (self.waiting + 1) * self._avg_hold_seconds / max(1, self.capacity)
+        return max(1, math.ceil(backlog))
+
+    def reject(self, reason: str):
+        rejections.inc(resource=self.name, reason=reason)
+        raise AdmissionRejected(self.name, reason, self._retry_after())
+
+    def _can_start(self, user: str, weight: int) -> bool:
+        return (
+            self.in_use + weight <= self.capacity
+            and self._active_by_user.get(user, 0) < self.per_user_limit
+        )
+
+    def _grant(self, user: str, weight: int):
+        self.in_use += weight
+        self._active_by_user[user] += 1
+
+    async def acquire(self, user: str, weight: int, priority: str, timeout: float):
+        weight = min(weight, self.capacity)
+        if not self.waiting and self._can_start(user, weight):
+            self._grant(user, weight)
+            return
+
+        if self.waiting >= self.max_queue:
+            self.reject("queue full")
+        if self._queued_by_user.get(user, 0) >= self.per_user_max_queue:
+            self.reject("too many queued requests for user")
+
+        waiter = _Waiter(user, weight, asyncio.get_running_loop().create_future())
+        self._queues[priority].setdefault(user, deque()).append(waiter)
+        self.waiting += 1
+        self._queued_by_user[user] += 1
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(waiter.future, timeout)
+        except BaseException:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Granted just as we gave up: hand the slot back
+                self.release(user, weight, 0.0)
+            else:
+                self._dequeue(priority, waiter)
+                self._dispatch()
+            raise
+
+    def _dequeue(self, priority: str, waiter: _Waiter):
+        users = self._queues[priority]
+        queue = users.get(waiter.user)
+        if queue is None or waiter not in queue:
+            return
+        queue.remove(waiter)
+        if not queue:
+            del users[waiter.user]
+        self._forget_waiter(waiter.user)
+
+    def _forget_waiter(self, user: str):
+        self.waiting -= 1
+        self._queued_by_user[user] -= 1
+        if not self._queued_by_user[user]:
+            del self._queued_by_user[user]
+
+    def _dispatch(self):
+        for priority in PRIORITIES:
+            users = self._queues[priority]
+            progressed = True
+            while users and progressed:
+                progressed = False
+                for user in list(users.keys()):
+                    queue = users[user]
+                    waiter = queue[0]
+                    if self._active_by_user.get(user, 0) >= self.per_user_limit:
+                        continue
+                    if self.in_use + waiter.weight > self.capacity:
+                        # Capacity is the bottleneck: nothing lower may jump the line
+                        return
+
+                    queue.popleft()
+                    if queue:
+                        users.move_to_end(user)
+                    else:
+                        del users[user]
+                    self._forget_waiter(user)
+
+                    self._grant(user, waiter.weight)
+                    waiter.future.set_result(None)
+                    progressed = True
+
+    def release(self, user: str, weight: int, held_seconds: float):
+        self.in_use -= weight
+        self._active_by_user[user] -= 1
+        if not self._active_by_user[user]:
+            del self._active_by_user[user]
+        if held_seconds:
+            self._avg_hold_seconds = 0.9 * self._avg_hold_seconds + 0.1 * held_seconds
+        self._dispatch()
+
+    def snapshot(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "waiting_by_priority": {
+                priority: sum(len(queue) for queue in users.values())
+                for priority, users in self._queues.items()
+            },
+            "active_users": len(self._active_by_user),
+            "avg_hold_ms": round(self._avg_hold_seconds * 1000, 1)
+        }
+
+
+class _Scope:
+    __slots__ = ("user", "priority")
+
+    def __init__(self, user: str, priority: str):
+        self.user = user
+        self.priority = priority
+
+
+_current_scope: ContextVar[Optional[_Scope]] = ContextVar("admission_scope", default=None)
+
+
+@contextmanager
+def admission_scope(user_id, priority: str = INTERACTIVE) -> Iterator[None]:
+    """Attribute every slot acquired below this point to ``user_id``"""
+    token = _current_scope.set(_Scope(str(user_id), priority))
+    try:
+        yield
+    finally:
+        _current_scope.reset(token)
+
+
+class AdmissionController:
+    def __init__(self):
+        self.pools: Dict[str, ResourcePool] = {}
+
+    def register(self, resource: str, capacity: int):
+        self.pools[resource] = ResourcePool(
+            resource,
+            capacity=capacity,
+            max_queue=settings.ADMISSION_MAX_QUEUE,
+            per_user_limit=settings.ADMISSION_PER_USER_CONCURRENCY,
+            per_user_max_queue=settings.ADMISSION_PER_USER_MAX_QUEUE
+        )
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        resource: str,
+        weight: int = 1,
+        priority: Optional[str] = None
+    ) -> AsyncIterator[None]:
+        """Hold ``weight`` units of ``resource`` (at most its capacity) for the duration of the block"""
+        pool = self.pools[resource]
+        scope = _current_scope.get()
+        user = scope.user if scope else SYSTEM_USER
+        priority = priority or (scope.priority if scope else INTERACTIVE)
+
+        deadline = current_deadline()
+        timeout = deadline.remaining() if deadline else settings.ADMISSION_QUEUE_TIMEOUT_SECONDS
+
+        started = time.monotonic()
+        try:
+            await pool.acquire(user, weight, priority, timeout)
+        except asyncio.TimeoutError:
+            if deadline is not None:
+                raise DeadlineExceeded(f"queue for {resource}", deadline.budget)
+            pool.reject("queue timeout")
+        queue_time.observe(time.monotonic() - started, resource=resource, priority=priority)
+
+        acquired = time.monotonic()
+        try:
+            yield
+        finally:
+            pool.release(user, min(weight, pool.capacity), time.monotonic() - acquired)
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {name: pool.snapshot() for name, pool in self.pools.items()}
+
+
+admission = AdmissionController()
+admission.register("rag_api", settings.ADMISSION_RAG_CAPACITY)
+# Database resources are registered by database.registry, one per database
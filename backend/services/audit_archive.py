@@ -0,0 +1,161 @@
+"""
+Compressed Parquet archives of audit partitions past retention.
+
+Each database gets a directory under AUDIT_ARCHIVE_DIR holding one file per
+archived partition, named by its time range, so a search can skip files
+that are entirely newer than its cursor and stop at the first files that
+satisfy it. Files are written next to their final name and only renamed
+into place once the partition has been dropped, so a row is never visible
+both live and archived. Without pyarrow nothing is archived (and partitions
+are kept).
+"""
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+from config import settings
+import asyncio
+import json
+import logging
+import os
+import re
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Archival is disabled without pyarrow
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLUMNS = (
+    "audit_id", "user_id", "username", "application", "operation", "table_name", "record_id",
+    "query_executed", "changes", "timestamp", "ip_address", "success", "error_message", "question"
+)
+
+_FILE_NAME = re.compile(r"^audit_logs_(min|\d{8})_(\d{8})\.parquet$")
+_DATE_FORMAT = "%Y%m%d"
+
+
+def archive_available() -> bool:
+    return pa is not None
+
+
+def _schema():
+    return pa.schema([
+        ("audit_id", pa.int64()),
+        ("user_id", pa.int64()),
+        ("username", pa.string()),
+        ("application", pa.string()),
+        ("operation", pa.string()),
+        ("table_name", pa.string()),
+        ("record_id", pa.string()),
+        ("query_executed", pa.string()),
+        ("changes", pa.string()),  # JSON text
+        ("timestamp", pa.timestamp("us")),
+        ("ip_address", pa.string()),
+        ("success", pa.bool_()),
+        ("error_message", pa.string()),
+        ("question", pa.string())
+    ])
+
+
+class AuditArchive:
+    """Archived audit partitions of one database (by admission resource name)"""
+
+    def __init__(self, resource: str):
+        self.directory = os.path.join(settings.AUDIT_ARCHIVE_DIR, resource.replace("/", "__"))
+
+    def files(self) -> List[Tuple[Optional[datetime], datetime, str]]:
+        """(lower, upper, path) of every archive, newest first; ``lower`` is None for the oldest"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        files = []
+        for name in names:
+            match = _FILE_NAME.match(name)
+            if match:
+                lower = None if match.group(1) == "min" else datetime.strptime(match.group(1), _DATE_FORMAT)
+                upper = datetime.strptime(match.group(2), _DATE_FORMAT)
+                files.append((lower, upper, os.path.join(self.directory, name)))
+        return sorted(files, key=lambda file: file[1], reverse=True)
+
+    def _path(self, lower: Optional[datetime], upper: datetime) -> str:
+        start = lower.strftime(_DATE_FORMAT) if lower else "min"
+        return os.path.join(self.directory, f"audit_logs_{start}_{upper.strftime(_DATE_FORMAT)}.parquet")
+
+    async def write(
+        self,
+        lower: Optional[datetime],
+        upper: datetime,
+        batches: AsyncIterator[Sequence[Sequence[Any]]]
+    ) -> Optional[str]:
+        """Write rows (in ARCHIVE_COLUMNS order) to an unpublished file; None if there were none"""
+        os.makedirs(self.directory, exist_ok=True)
+        partial = self._path(lower, upper) + ".partial"
+        schema = _schema()
+        writer = pq.ParquetWriter(partial, schema, compression=settings.AUDIT_ARCHIVE_COMPRESSION)
+        written = 0
+        try:
+            async for rows in batches:
+                columns = list(zip(*rows))
+                table = pa.table(
+                    {name: list(columns[i]) for i, name in enumerate(ARCHIVE_COLUMNS)},
+                    schema=schema
+                )
+                await asyncio.to_thread(writer.write_table, table)
+                written += len(rows)
+        except BaseException:
+            writer.close()
+            os.remove(partial)
+            raise
+        writer.close()
+
+        if not written:
+            os.remove(partial)
+            return None
+        return partial
+
+    @staticmethod
+    def publish(partial: str):
+        os.replace(partial, partial[:-len(".partial")])
+
+    async def search(
+        self,
+        filters: Dict[str, Any],
+        columns: Sequence[str],
+        before: Optional[Tuple[datetime, int]],
+        limit: int
+    ) -> List[dict]:
+        """Archived rows matching ``filters`` older than ``before``, newest first"""
+        if pq is None or limit <= 0:
+            return []
+        return await asyncio.to_thread(self._search, filters, columns, before, limit)
+
+    def _search(self, filters, columns, before, limit) -> List[dict]:
+        read_columns = list(dict.fromkeys([*columns, "timestamp", "audit_id"]))
+        found: List[dict] = []
+        for lower, _, path in self.files():
+            # Everything in this file is newer than the cursor
+            if before and lower is not None and lower > before[0]:
+                continue
+
+            predicate = [(name, "=", value) for name, value in filters.items()]
+            if before:
+                predicate.append(("timestamp", "<=", before[0]))
+            rows = pq.read_table(path, columns=read_columns, filters=predicate or None).to_pylist()
+            if before:
+                rows = [row for row in rows if (row["timestamp"], row["audit_id"]) < before]
+            rows.sort(key=lambda row: (row["timestamp"], row["audit_id"]), reverse=True)
+            found.extend(rows)
+            # Files do not overlap in time, so older files cannot have newer rows
+            if len(found) >= limit:
+                break
+
+        entries = []
+        for row in found[:limit]:
+            entry = {name: row[name] for name in columns}
+            if entry.get("changes") is not None:
+                entry["changes"] = json.loads(entry["changes"])
+            entries.append(entry)
+        return entries
@@ -0,0 +1,256 @@
+"""
+Monthly range partitions of ``audit_logs`` and their archival.
+
+The first start-up after upgrading turns ``audit_logs`` into a table
+partitioned by ``timestamp``: the existing table becomes its first
+partition (everything up to the end of the current month) and new monthly
+partitions follow it. A maintenance loop keeps AUDIT_PARTITIONS_AHEAD
+months of future partitions ready, and partitions whose range ended more
+than AUDIT_RETENTION_DAYS ago are written to compressed Parquet (see
+services.audit_archive), then detached and dropped. Inserts and index
+maintenance only ever touch the small current partition, and expiring a
+month is a metadata change instead of a huge DELETE and vacuum.
+"""
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+from config import settings
+from database.registry import DatabaseRegistry, DatabaseTarget
+from database.schema import ensure_statements
+from services.audit_archive import ARCHIVE_COLUMNS, AuditArchive, archive_available
+from services.audit_service import AUDIT_INDEX_DDL
+from services.metrics import metrics
+import asyncio
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Idempotent, and only re-run when it changes (see database.schema)
+AUDIT_PARTITION_DDL = [
+    """
+    DO $$
+    DECLARE
+        serial_sequence TEXT;
+        legacy_index RECORD;
+    BEGIN
+        IF EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('audit_logs')) THEN
+            RETURN;
+        END IF;
+
+        ALTER TABLE audit_logs RENAME TO audit_logs_legacy;
+        -- Frees the index names for the partitioned table's own indexes
+        FOR legacy_index IN
+            SELECT indexname FROM pg_indexes
+            WHERE schemaname = current_schema() AND tablename = 'audit_logs_legacy'
+        LOOP
+            EXECUTE format('ALTER INDEX %I RENAME TO %I', legacy_index.indexname, 'legacy_' || legacy_index.indexname);
+        END LOOP;
+
+        CREATE TABLE audit_logs (LIKE audit_logs_legacy INCLUDING DEFAULTS) PARTITION BY RANGE ("timestamp");
+        ALTER TABLE audit_logs ALTER COLUMN "timestamp" SET NOT NULL;
+
+        -- audit_id keeps counting from the same sequence, which must outlive the legacy table
+        serial_sequence := pg_get_serial_sequence('audit_logs_legacy', 'audit_id');
+        IF serial_sequence IS NOT NULL THEN
+            EXECUTE format('ALTER SEQUENCE %s OWNED BY audit_logs.audit_id', serial_sequence);
+        END IF;
+
+        IF EXISTS (SELECT 1 FROM audit_logs_legacy) THEN
+            UPDATE audit_logs_legacy SET "timestamp" = 'epoch' WHERE "timestamp" IS NULL;
+            ALTER TABLE audit_logs_legacy ALTER COLUMN "timestamp" SET NOT NULL;
+            EXECUTE format(
+                'ALTER TABLE audit_logs ATTACH PARTITION audit_logs_legacy FOR VALUES FROM (MINVALUE) TO (%L)',
+                date_trunc('month', now() AT TIME ZONE 'UTC') + INTERVAL '1 month'
+            );
+        ELSE
+            DROP TABLE audit_logs_legacy;
+        END IF;
+    END
+    $$
+    """
+]
+
+PARTITIONS = text("""
+    SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = to_regclass('audit_logs')
+""")
+
+# One pod maintains each database at a time
+TRY_LOCK = text("SELECT pg_try_advisory_lock(hashtext('audit_partitions'))")
+UNLOCK = text("SELECT pg_advisory_unlock(hashtext('audit_partitions'))")
+
+_RANGE = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+# (name, lower, upper); lower is None for the partition starting at MINVALUE
+Partition = Tuple[str, Optional[datetime], datetime]
+
+archived_partitions = metrics.counter(
+    "audit_partitions_archived_total", "Audit partitions archived and dropped, by database"
+)
+
+
+def _bound(value: str) -> Optional[datetime]:
+    value = value.strip()
+    if value.upper() == "MINVALUE":
+        return None
+    return datetime.fromisoformat(value.strip("'"))
+
+
+def _add_months(moment: datetime, months: int) -> datetime:
+    years, month = divmod(moment.month - 1 + months, 12)
+    return moment.replace(
+        year=moment.year + years, month=month + 1, day=1, hour=0, minute=0, second=0, microsecond=0
+    )
+
+
+class AuditPartitionManager:
+    def __init__(self, registry: DatabaseRegistry):
+        self.registry = registry
+        self.interval = settings.AUDIT_PARTITION_CHECK_SECONDS
+        # Keyed by database (admission resource name)
+        self._partitioned: Dict[str, bool] = {}
+        self._partitions: Dict[str, List[Partition]] = {}
+        self._maintained_at: Dict[str, datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._warned_unarchivable = False
+
+    async def install(self):
+        """Partition audit_logs on every database and make sure this month's partitions exist"""
+        await asyncio.gather(*(self._install(target) for target in self.registry.targets()))
+
+    async def _install(self, target: DatabaseTarget):
+        try:
+            if await ensure_statements(target.engine, "audit_logs", AUDIT_PARTITION_DDL + AUDIT_INDEX_DDL):
+                logger.info(f"audit_logs partitioned on {target.resource}")
+            # Inserts fail without a partition for now, so this cannot wait for the loop
+            async with target.engine.connect() as conn:
+                await self._create_ahead(conn, target)
+        except Exception as e:
+            logger.warning(f"audit_logs partitioning not installed on {target.resource}: {e}")
+            return
+        self._partitioned[target.resource] = True
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            for target in self.registry.targets():
+                if not self._partitioned.get(target.resource):
+                    continue
+                try:
+                    await self._maintain(target)
+                except Exception as e:
+                    logger.error(f"Audit partition maintenance failed for {target.resource}: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _maintain(self, target: DatabaseTarget):
+        async with target.engine.connect() as conn:
+            if not (await conn.execute(TRY_LOCK)).scalar():
+                return
+            try:
+                await conn.commit()
+                await self._create_ahead(conn, target)
+                await self._archive_expired(conn, target)
+            finally:
+                await conn.rollback()
+                await conn.execute(UNLOCK)
+                await conn.commit()
+        self._maintained_at[target.resource] = datetime.utcnow()
+
+    async def _list(self, conn: AsyncConnection, target: DatabaseTarget) -> List[Partition]:
+        partitions = []
+        for name, bound in (await conn.execute(PARTITIONS)).fetchall():
+            match = _RANGE.search(bound or "")
+            if match:
+                partitions.append((name, _bound(match.group(1)), _bound(match.group(2))))
+        partitions.sort(key=lambda partition: partition[2])
+        self._partitions[target.resource] = partitions
+        return partitions
+
+    async def _create_ahead(self, conn: AsyncConnection, target: DatabaseTarget):
+        """Monthly partitions from the end of the last one through AUDIT_PARTITIONS_AHEAD months from now"""
+        partitions = await self._list(conn, target)
+        this_month = _add_months(datetime.utcnow(), 0)
+        start = partitions[-1][2] if partitions else this_month
+        horizon = _add_months(this_month, settings.AUDIT_PARTITIONS_AHEAD)
+
+        created = False
+        while start <= horizon:
+            end = _add_months(start, 1)
+            await conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS audit_logs_p{start:%Y%m} PARTITION OF audit_logs "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            ))
+            created = True
+            start = end
+        await conn.commit()
+
+        if created:
+            await self._list(conn, target)
+
+    async def _archive_expired(self, conn: AsyncConnection, target: DatabaseTarget):
+        cutoff = datetime.utcnow() - timedelta(days=settings.AUDIT_RETENTION_DAYS)
+        expired = [partition for partition in self._partitions[target.resource] if partition[2] <= cutoff]
+        if not expired:
+            return
+        if not archive_available():
+            if not self._warned_unarchivable:
+                logger.warning("pyarrow is not installed; expired audit partitions are kept, not archived")
+                self._warned_unarchivable = True
+            return
+
+        archive = AuditArchive(target.resource)
+        for name, lower, upper in expired:
+            partial = await archive.write(lower, upper, self._batches(conn, name))
+            # Do not queue every audit insert behind the detach for long
+            await conn.execute(text(f"SET LOCAL lock_timeout = '{settings.AUDIT_DETACH_LOCK_TIMEOUT_MS}ms'"))
+            await conn.execute(text(f'ALTER TABLE audit_logs DETACH PARTITION "{name}"'))
+            await conn.execute(text(f'DROP TABLE "{name}"'))
+            # If publishing fails the drop rolls back, so no row is ever only in an unpublished file
+            if partial:
+                archive.publish(partial)
+            await conn.commit()
+
+            archived_partitions.inc(database=target.resource)
+            logger.info(f"Archived audit partition {name} of {target.resource}")
+        await self._list(conn, target)
+
+    @staticmethod
+    async def _batches(conn: AsyncConnection, name: str) -> AsyncIterator[list]:
+        columns = ", ".join(
+            '"changes"::text' if column == "changes" else f'"{column}"' for column in ARCHIVE_COLUMNS
+        )
+        result = await conn.stream(text(
+            f'SELECT {columns} FROM "{name}" ORDER BY "timestamp" DESC, audit_id DESC'
+        ))
+        async for rows in result.partitions(settings.AUDIT_ARCHIVE_BATCH_ROWS):
+            yield rows
+
+    def snapshot(self) -> dict:
+        snapshot = {}
+        for target in self.registry.targets():
+            partitions = self._partitions.get(target.resource, [])
+            maintained = self._maintained_at.get(target.resource)
+            snapshot[target.resource] = {
+                "partitioned": self._partitioned.get(target.resource, False),
+                "partitions": len(partitions),
+                "covered_until": partitions[-1][2].isoformat() + "Z" if partitions else None,
+                "archives": len(AuditArchive(target.resource).files()),
+                "maintained_at": maintained.isoformat() + "Z" if maintained else None
+            }
+        return snapshot
@@ -1,11 +1,74 @@
+"""
+Audit trail writes and queries.
+
+History and record-trail queries select only the columns they return
+(``query_executed`` and ``changes`` can be large) and page by keyset on
+(timestamp, audit_id) rather than OFFSET, so page N costs the same as page 1.
+AUDIT_INDEX_DDL adds the composite indexes those queries walk; the history
+index carries its projected columns so it is served by an index-only scan.
+Once a page runs past the live partitions it continues into the archived
+ones (see services.audit_partitions).
+"""
+from sqlalchemy import select, tuple_
 from sqlalchemy.ext.asyncio import AsyncSession
 from models.database import AuditLog
-from typing import Dict, Optional
+from services.audit_archive import AuditArchive
+from services.deadline import apply_statement_timeout
+from config import settings
+from typing import Any, Dict, Optional, Sequence, Tuple
+import base64
+import json
 import logging
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# Installed with the partitioning by services.audit_partitions
+AUDIT_INDEX_DDL = [
+    """
+    CREATE INDEX IF NOT EXISTS idx_audit_user_ts
+    ON audit_logs (user_id, timestamp DESC, audit_id DESC)
+    INCLUDE (application, operation, table_name, success)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_audit_record_ts
+    ON audit_logs (application, table_name, record_id, timestamp DESC, audit_id DESC)
+    """,
+    # Leading prefix of idx_audit_user_ts; one less index to maintain on every audit write
+    "DROP INDEX IF EXISTS idx_audit_user_id"
+]
+
+HISTORY_COLUMNS = (
+    AuditLog.audit_id, AuditLog.operation, AuditLog.application,
+    AuditLog.table_name, AuditLog.timestamp, AuditLog.success
+)
+HISTORY_DETAIL_COLUMNS = (
+    AuditLog.record_id, AuditLog.query_executed, AuditLog.error_message
+)
+RECORD_COLUMNS = (
+    AuditLog.audit_id, AuditLog.username, AuditLog.operation,
+    AuditLog.changes, AuditLog.timestamp, AuditLog.success
+)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(timestamp: datetime, audit_id: int) -> str:
+    raw = json.dumps([timestamp.isoformat(), audit_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        timestamp, audit_id = json.loads(raw)
+        return datetime.fromisoformat(timestamp), int(audit_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid audit cursor: {cursor}") from e
+
+
 class AuditService:
     @staticmethod
     async def log_operation(
@@ -17,13 +80,25 @@ class AuditService:
         table_name: str,
         query_executed: str,
         record_id: Optional[str] = None,
+        question: Optional[str] = None,
         changes: Optional[Dict] = None,
         ip_address: Optional[str] = None,
         success: bool = True,
-        error_message: Optional[str] = None
+        error_message: Optional[str] = None,
+        raise_errors: bool = False
     ):
-        """Log database operation to audit table"""
+        """
+        Log database operation to audit table, committing the session
+
+        Failures are logged and rolled back; with ``raise_errors`` they are
+        re-raised too, for callers whose own changes ride on this commit.
+        """
         try:
+            # Audit records are written even when the request budget is spent
+            await apply_statement_timeout(
+                session, "audit write", floor=settings.AUDIT_MIN_TIMEOUT_SECONDS
+            )
+            
             audit_entry = AuditLog(
                 user_id=user_id,
                 username=username,
@@ -32,6 +107,7 @@ class AuditService:
                 table_name=table_name,
                 record_id=record_id,
                 query_executed=query_executed,
+                question=question,
                 changes=changes,
                 timestamp=datetime.utcnow(),
                 ip_address=ip_address,
@@ -43,83 +119,76 @@ class AuditService:
             await session.commit()
             
             logger.info(
-                f"Audit logged - User: {username}, App: {application}, "
-                f"Operation: {operation}, Table: {table_name}"
+                "Audit logged - User: %s, App: %s, Operation: %s, Table: %s",
+                username, application, operation, table_name,
+                extra={"category": "audit"}
             )
             
         except Exception as e:
             logger.error(f"Failed to log audit entry: {e}")
             await session.rollback()
+            if raise_errors:
+                raise
     
+    @staticmethod
+    async def _page(
+        conn,
+        columns: Sequence,
+        filters: Dict[str, Any],
+        limit: int,
+        cursor: Optional[str],
+        archive: Optional[AuditArchive]
+    ) -> dict:
+        """Newest first, one keyset page; ``next_cursor`` is None on the last page"""
+        limit = max(1, min(limit, settings.AUDIT_MAX_PAGE_SIZE))
+        before = decode_cursor(cursor) if cursor else None
+
+        stmt = select(*columns).where(*(getattr(AuditLog, name) == value for name, value in filters.items()))
+        if before:
+            # Row comparison, so Postgres seeks straight to the cursor in the index
+            stmt = stmt.where(tuple_(AuditLog.timestamp, AuditLog.audit_id) < before)
+        stmt = stmt.order_by(AuditLog.timestamp.desc(), AuditLog.audit_id.desc()).limit(limit + 1)
+
+        await apply_statement_timeout(conn, "audit query")
+        rows = [dict(row) for row in (await conn.execute(stmt)).mappings()]
+
+        if archive is not None and len(rows) <= limit:
+            # Archived partitions are all older than the live ones, so continue where these end
+            if rows:
+                before = (rows[-1]["timestamp"], rows[-1]["audit_id"])
+            rows += await archive.search(
+                filters, [column.name for column in columns], before, limit + 1 - len(rows)
+            )
+
+        last = rows[limit - 1] if len(rows) > limit else None
+        return {
+            "entries": [{**row, "timestamp": row["timestamp"].isoformat()} for row in rows[:limit]],
+            "next_cursor": encode_cursor(last["timestamp"], last["audit_id"]) if last else None
+        }
+
     @staticmethod
     async def get_user_audit_history(
-        session: AsyncSession,
+        conn,
         user_id: int,
-        limit: int = 100
-    ) -> list:
-        """Get audit history for a specific user"""
-        try:
-            from sqlalchemy import select
-            
-            stmt = select(AuditLog).where(
-                AuditLog.user_id == user_id
-            ).order_by(
-                AuditLog.timestamp.desc()
-            ).limit(limit)
-            
-            result = await session.execute(stmt)
-            audit_logs = result.scalars().all()
-            
-            return [
-                {
-                    "audit_id": log.audit_id,
-                    "operation": log.operation,
-                    "application": log.application,
-                    "table_name": log.table_name,
-                    "timestamp": log.timestamp.isoformat(),
-                    "success": log.success
-                }
-                for log in audit_logs
-            ]
-            
-        except Exception as e:
-            logger.error(f"Failed to retrieve audit history: {e}")
-            return []
-    
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        detail: bool = False,
+        archive: Optional[AuditArchive] = None
+    ) -> dict:
+        """A page of a user's audit history; ``detail`` adds the record id, SQL and error"""
+        columns = HISTORY_COLUMNS + (HISTORY_DETAIL_COLUMNS if detail else ())
+        return await AuditService._page(conn, columns, {"user_id": user_id}, limit, cursor, archive)
+
     @staticmethod
     async def get_operation_audit(
-        session: AsyncSession,
+        conn,
         application: str,
         table_name: str,
-        record_id: str
-    ) -> list:
-        """Get audit trail for a specific record"""
-        try:
-            from sqlalchemy import select
-            
-            stmt = select(AuditLog).where(
-                AuditLog.application == application,
-                AuditLog.table_name == table_name,
-                AuditLog.record_id == record_id
-            ).order_by(
-                AuditLog.timestamp.desc()
-            )
-            
-            result = await session.execute(stmt)
-            audit_logs = result.scalars().all()
-            
-            return [
-                {
-                    "audit_id": log.audit_id,
-                    "username": log.username,
-                    "operation": log.operation,
-                    "changes": log.changes,
-                    "timestamp": log.timestamp.isoformat(),
-                    "success": log.success
-                }
-                for log in audit_logs
-            ]
-            
-        except Exception as e:
-            logger.error(f"Failed to retrieve operation audit: {e}")
-            return []
\ No newline at end of file
+        record_id: str,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+        archive: Optional[AuditArchive] = None
+    ) -> dict:
+        """A page of the audit trail of a specific record"""
+        filters = {"application": application, "table_name": table_name, "record_id": record_id}
+        return await AuditService._page(conn, RECORD_COLUMNS, filters, limit, cursor, archive)
@@ -0,0 +1,230 @@
+"""
+Batch execution of chat questions for scripted reporting workloads.
+
+Identical questions are answered once; classification, SQL generation and
+response generation run concurrently under BATCH_CONCURRENCY, while all
+queries for one database take turns on that database's single session
+(one pooled connection per database for the whole batch).
+Results are yielded as each question completes.
+"""
+from collections import defaultdict
+from typing import AsyncIterator, Dict, List
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from database.connection import SessionRouter
+from services.admission import AdmissionRejected, admission
+from services.audit_service import AuditService
+from services.deadline import (
+    DeadlineExceeded, apply_statement_timeout, current_deadline, deadline_scope
+)
+from services.metrics import metrics
+from services.prompt_budget import prompt_budget
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+batch_questions = metrics.counter(
+    "batch_questions_total",
+    "Questions received by /api/chat/batch, by outcome"
+)
+
+
+def dedupe_questions(queries: List[str]) -> Dict[str, List[int]]:
+    """Map each distinct question (whitespace-normalized) to its positions"""
+    unique: Dict[str, List[int]] = {}
+    for index, query in enumerate(queries):
+        unique.setdefault(" ".join(query.split()), []).append(index)
+    return unique
+
+
+class BatchChatRunner:
+    def __init__(self, rag_agent, rag_client):
+        self.rag_agent = rag_agent
+        self.rag_client = rag_client
+
+    async def run(
+        self,
+        queries: List[str],
+        user_context: dict,
+        sessions: SessionRouter,
+        budget: float
+    ) -> AsyncIterator[dict]:
+        """Yield one result per distinct question, in completion order"""
+        unique = dedupe_questions(queries)
+        limiter = asyncio.Semaphore(settings.BATCH_CONCURRENCY)
+        session_locks: Dict[AsyncSession, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+        tasks = [
+            asyncio.create_task(self._answer(
+                query, indices, user_context, sessions, session_locks, limiter, budget
+            ))
+            for query, indices in unique.items()
+        ]
+
+        failed = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                failed += result["type"] == "error"
+                batch_questions.inc(len(result["indices"]), outcome=result["type"])
+                yield result
+        finally:
+            # Client went away (or the generator was closed): stop remaining work
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        yield {
+            "type": "summary",
+            "total": len(queries),
+            "unique": len(unique),
+            "failed": failed
+        }
+
+    async def _answer(
+        self,
+        query: str,
+        indices: List[int],
+        user_context: dict,
+        sessions: SessionRouter,
+        session_locks: Dict[AsyncSession, asyncio.Lock],
+        limiter: asyncio.Semaphore,
+        budget: float
+    ) -> dict:
+        base = {"indices": indices, "query": query}
+        with deadline_scope(budget):
+            try:
+                async with limiter:
+                    classification = await self.rag_agent.classify_intent(query, user_context)
+
+                    if classification["application"] == "RAG_ONLY":
+                        retrieval = prompt_budget.retrieval(query, default_top_k=5)
+                        rag_result = await self.rag_client.query_rag(query=retrieval.text, top_k=retrieval.top_k)
+                        response_text = await self.rag_agent.generate_response(
+                            query_result=None,
+                            original_query=query,
+                            rag_context=rag_result.get("context", "")
+                        )
+                        return {
+                            **base,
+                            "type": "result",
+                            "response": response_text,
+                            "sources": rag_result.get("sources", []),
+                            "classification": classification
+                        }
+
+                    sql_info = await self.rag_agent.generate_sql_query(
+                        user_query=query,
+                        application=classification["application"],
+                        user_context=user_context,
+                        intent=classification["intent"]
+                    )
+
+                # Batches are unattended, so nothing that modifies data runs here
+                if classification["intent"] != "READ":
+                    return {
+                        **base,
+                        "type": "requires_confirmation",
+                        "sql_query": sql_info["sql_query"],
+                        "application": classification["application"],
+                        "message": "Batch mode only runs READ queries. Submit this one through /api/chat to confirm it.",
+                        "classification": classification
+                    }
+
+                application = classification["application"]
+                session = sessions.get(application, user_context)
+                query_result = await self._execute(
+                    sql_info["sql_query"],
+                    query,
+                    application,
+                    user_context,
+                    session,
+                    session_locks[session],
+                    sessions.registry.resource(application, user_context)
+                )
+
+                partial = False
+                try:
+                    async with limiter:
+                        retrieval = prompt_budget.retrieval(query, default_top_k=3)
+                        rag_result = await self.rag_client.query_rag(query=retrieval.text, top_k=retrieval.top_k)
+                        response_text = await self.rag_agent.generate_response(
+                            query_result=query_result,
+                            original_query=query,
+                            rag_context=rag_result.get("context", "")
+                        )
+                except DeadlineExceeded as e:
+                    logger.warning(f"Batch question returning partial answer: {e}")
+                    partial = True
+                    rag_result = {}
+                    response_text = self.rag_agent.fallback_response(query_result)
+
+                return {
+                    **base,
+                    "type": "result",
+                    "response": response_text,
+                    "data": query_result,
+                    "sql_executed": sql_info["sql_query"],
+                    "sources": rag_result.get("sources", []),
+                    "classification": classification,
+                    "partial": partial
+                }
+
+            except DeadlineExceeded as e:
+                return {**base, "type": "error", "message": str(e), "timeout": True}
+            except AdmissionRejected as e:
+                return {**base, "type": "error", "message": str(e), "retry_after": e.retry_after}
+            except Exception as e:
+                logger.error(f"Batch question failed: {e}")
+                return {**base, "type": "error", "message": str(e)}
+
+    async def _execute(
+        self,
+        sql_query: str,
+        question: str,
+        application: str,
+        user_context: dict,
+        session: AsyncSession,
+        lock: asyncio.Lock,
+        resource: str
+    ) -> list:
+        # An AsyncSession runs one statement at a time; queue on its lock
+        async with lock, admission.slot(resource):
+            try:
+                await apply_statement_timeout(session, "database query")
+                result = await session.execute(text(sql_query))
+                query_result = [dict(row._mapping) for row in result.fetchall()]
+            except Exception as db_error:
+                logger.error(f"Database error: {db_error}")
+                await session.rollback()
+                await AuditService.log_operation(
+                    session=session,
+                    user_id=user_context["user_id"],
+                    username=user_context["username"],
+                    application=application,
+                    operation="READ",
+                    table_name="multi_table_query",
+                    query_executed=sql_query,
+                    question=question,
+                    success=False,
+                    error_message=str(db_error)
+                )
+                # statement_timeout fired because the question's budget ran out
+                current_deadline().check("database query")
+                raise
+
+            # Commits, which also ends the transaction and its statement_timeout
+            await AuditService.log_operation(
+                session=session,
+                user_id=user_context["user_id"],
+                username=user_context["username"],
+                application=application,
+                operation="READ",
+                table_name="multi_table_query",
+                query_executed=sql_query,
+                question=question,
+                success=True
+            )
+            return query_result
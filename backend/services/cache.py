@@ -0,0 +1,90 @@
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional, Tuple
+import time
+
+
+class TTLCache:
+    """
+    Bounded in-process cache with LRU eviction and per-entry expiry
+
+    Expired entries are treated as misses and dropped lazily on access, by
+    LRU eviction or by ``purge_expired``. ``on_evict`` is called for every
+    entry dropped that way (or by ``clear``), e.g. to release resources it
+    holds; entries removed with ``pop`` are the caller's responsibility.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttl_seconds: float = 300.0,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.on_evict = on_evict
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, count=False) is not None
+
+    def get(self, key: Hashable, count: bool = True) -> Optional[Any]:
+        """Return a fresh entry or None"""
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+            del self._entries[key]
+            self._evicted(key, entry[1])
+            entry = None
+        if entry is None:
+            if count:
+                self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        if count:
+            self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            oldest, (_, evicted) = self._entries.popitem(last=False)
+            self._evicted(oldest, evicted)
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.pop(key, None)
+        return entry[1] if entry else None
+
+    def clear(self):
+        entries = list(self._entries.items())
+        self._entries.clear()
+        for key, (_, value) in entries:
+            self._evicted(key, value)
+
+    def purge_expired(self) -> int:
+        """Drop every expired entry now instead of waiting for an access"""
+        cutoff = time.monotonic() - self.ttl_seconds
+        expired = [key for key, (stored_at, _) in self._entries.items() if stored_at < cutoff]
+        for key in expired:
+            self._evicted(key, self._entries.pop(key)[1])
+        return len(expired)
+
+    def _evicted(self, key: Hashable, value: Any):
+        if self.on_evict is not None:
+            self.on_evict(key, value)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
@@ -0,0 +1,235 @@
+"""
+Scheduled warm-up of the chat caches ahead of peak hours.
+
+Chat questions are recorded with their audit entries, so recent
+``audit_logs`` show which questions each application is asked most, and by
+whom. At every WARMUP_TIMES (UTC) the warmer takes, per application, the
+WARMUP_MAX_QUESTIONS most repeated (user, question) pairs of the last
+WARMUP_LOOKBACK_DAYS and replays the front of /api/chat for each: the
+user's context goes into the user context cache, and classifying the
+question and generating its SQL fills the RAG answer cache (see
+services.rag_client) for that user's scope. READ statements are then run
+once, read-only and counted instead of fetched, so the pages they touch are
+in the database's buffer cache when the user asks again; result rows are
+not cached, since answers must reflect the data at question time.
+
+Everything runs as BULK work, so interactive requests keep priority. Each
+pod warms its own in-process caches. The report of the last run (how much
+of the mined traffic was warmed and the time spent per phase) is part of
+/api/health/deep.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import text
+from config import settings
+from database.registry import DatabaseRegistry
+from services.admission import BULK, admission, admission_scope
+from services.deadline import apply_statement_timeout, deadline_scope
+from services.metrics import metrics
+from services.rag_client import RAGClient
+from services.user_context_cache import UserContextCache
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# (user_id, question, times asked) and the application's total asked questions
+FREQUENT_QUESTIONS = text("""
+    SELECT user_id, question, count(*) AS asked, sum(count(*)) OVER () AS total
+    FROM audit_logs
+    WHERE application = :application
+      AND question IS NOT NULL
+      AND success
+      AND "timestamp" >= :since
+    GROUP BY user_id, question
+    ORDER BY asked DESC
+    LIMIT :limit
+""")
+
+# Outcome of warming one (user, question) pair, from least to most complete
+SKIPPED = "skipped"  # the user is no longer active
+CLASSIFIED = "classified"  # now classified for another application (or documents only)
+GENERATED = "generated"  # SQL generated; not a READ, or reads are not executed
+EXECUTED = "executed"
+FAILED = "failed"
+
+warmed_questions = metrics.counter(
+    "cache_warmup_questions_total", "Questions replayed by the cache warm-up, by application and outcome"
+)
+
+
+def _next_run(now: datetime, times: List[str]) -> Optional[datetime]:
+    """The first of the daily ``HH:MM`` times after ``now``"""
+    runs = []
+    for value in times:
+        hour, minute = (int(part) for part in value.split(":"))
+        run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        runs.append(run if run > now else run + timedelta(days=1))
+    return min(runs) if runs else None
+
+
+class CacheWarmer:
+    def __init__(self, rag_agent, registry: DatabaseRegistry, user_contexts: UserContextCache):
+        self.rag_agent = rag_agent
+        self.registry = registry
+        self.user_contexts = user_contexts
+        self._task: Optional[asyncio.Task] = None
+        self._next_run: Optional[datetime] = None
+        self._running = False
+        self._report: Optional[dict] = None
+
+    def start(self):
+        if self._task is None and (settings.WARMUP_TIMES or settings.WARMUP_ON_STARTUP):
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        if settings.WARMUP_ON_STARTUP:
+            await self._warm_safely("startup")
+        while True:
+            self._next_run = _next_run(datetime.utcnow(), settings.WARMUP_TIMES)
+            if self._next_run is None:
+                return
+            await asyncio.sleep((self._next_run - datetime.utcnow()).total_seconds())
+            await self._warm_safely("scheduled")
+
+    async def _warm_safely(self, trigger: str):
+        try:
+            await self.warm(trigger)
+        except Exception as e:
+            logger.error(f"Cache warm-up failed: {e}")
+
+    async def warm(self, trigger: str = "manual") -> dict:
+        """Mine and replay the most asked questions of every application; returns the report"""
+        self._running = True
+        started_at = datetime.utcnow()
+        start = time.perf_counter()
+        try:
+            applications = await asyncio.gather(*(
+                self._warm_application(application) for application in self.registry.applications
+            ))
+        finally:
+            self._running = False
+
+        self._report = {
+            "trigger": trigger,
+            "started_at": started_at.isoformat() + "Z",
+            "duration_seconds": round(time.perf_counter() - start, 3),
+            "rag_answer_cache_entries": RAGClient.answer_cache_size(),
+            "applications": dict(zip(self.registry.applications, applications))
+        }
+        logger.info(
+            "Cache warm-up (%s) done in %.1fs: %s", trigger, self._report["duration_seconds"],
+            ", ".join(
+                f"{application} {report['coverage']:.0%} of {report['asked']} questions"
+                for application, report in self._report["applications"].items()
+            )
+        )
+        return self._report
+
+    async def _warm_application(self, application: str) -> dict:
+        report: Dict[str, object] = {outcome: 0 for outcome in (SKIPPED, CLASSIFIED, GENERATED, EXECUTED, FAILED)}
+
+        mine_start = time.perf_counter()
+        questions, total = await self._frequent_questions(application)
+        report["mine_seconds"] = round(time.perf_counter() - mine_start, 3)
+
+        semaphore = asyncio.Semaphore(settings.WARMUP_CONCURRENCY)
+        warmed_asked = 0
+
+        async def replay(user_id: int, question: str, asked: int):
+            nonlocal warmed_asked
+            async with semaphore:
+                outcome = await self._replay(application, user_id, question)
+            report[outcome] += 1
+            warmed_questions.inc(application=application, outcome=outcome)
+            if outcome not in (SKIPPED, FAILED):
+                warmed_asked += asked
+
+        replay_start = time.perf_counter()
+        await asyncio.gather(*(replay(*question) for question in questions))
+        report["replay_seconds"] = round(time.perf_counter() - replay_start, 3)
+
+        report.update({
+            "questions": len(questions),
+            "users": len({user_id for user_id, _, _ in questions}),
+            "asked": total,
+            # Share of the lookback window's questions whose repeat would now hit the caches
+            "coverage": round(warmed_asked / total, 4) if total else 0.0
+        })
+        return report
+
+    async def _frequent_questions(self, application: str) -> Tuple[List[Tuple[int, str, int]], int]:
+        """The most asked (user_id, question, asked) over every database of ``application``"""
+        since = datetime.utcnow() - timedelta(days=settings.WARMUP_LOOKBACK_DAYS)
+        questions: List[Tuple[int, str, int]] = []
+        total = 0
+        for target in self.registry.targets(application):
+            try:
+                async with target.read_engine().connect() as conn:
+                    rows = (await conn.execute(FREQUENT_QUESTIONS, {
+                        "application": application,
+                        "since": since,
+                        "limit": settings.WARMUP_MAX_QUESTIONS
+                    })).fetchall()
+            except Exception as e:
+                logger.warning(f"Cache warm-up could not read audit_logs on {target.resource}: {e}")
+                continue
+            questions.extend((row.user_id, row.question, row.asked) for row in rows)
+            total += int(rows[0].total) if rows else 0
+        questions.sort(key=lambda question: question[2], reverse=True)
+        return questions[:settings.WARMUP_MAX_QUESTIONS], total
+
+    async def _replay(self, application: str, user_id: int, question: str) -> str:
+        with deadline_scope(settings.CHAT_DEADLINE_SECONDS), admission_scope(user_id, BULK):
+            try:
+                async with self.registry.session_factory(application)() as session:
+                    user = await self.user_contexts.get(application, user_id, session)
+                if user is None:
+                    return SKIPPED
+
+                classification = await self.rag_agent.classify_intent(question, user)
+                if classification.get("application") != application:
+                    return CLASSIFIED
+
+                sql_info = await self.rag_agent.generate_sql_query(
+                    user_query=question,
+                    application=application,
+                    user_context=user,
+                    intent=classification["intent"]
+                )
+                if classification["intent"] != "READ" or not settings.WARMUP_EXECUTE_READS:
+                    return GENERATED
+
+                await self._execute(application, user, sql_info["sql_query"])
+                return EXECUTED
+            except Exception as e:
+                logger.warning(f"Cache warm-up of {application} question for user {user_id} failed: {e}")
+                return FAILED
+
+    async def _execute(self, application: str, user_context: dict, sql_query: str):
+        """Run a generated READ once without fetching its rows"""
+        target = self.registry.target(application, user_context)
+        async with target.read_engine().connect() as conn:
+            async with admission.slot(target.resource, weight=settings.ADMISSION_BULK_READ_WEIGHT):
+                # Generated SQL never gets to change anything from here
+                await conn.execute(text("SET TRANSACTION READ ONLY"))
+                await apply_statement_timeout(conn, "cache warm-up query")
+                await conn.execute(text(f"SELECT count(*) FROM ({sql_query.strip().rstrip(';')}) AS warmup"))
+            await conn.rollback()
+
+    def snapshot(self) -> dict:
+        return {
+            "running": self._running,
+            "next_run": self._next_run.isoformat() + "Z" if self._next_run else None,
+            "last_run": self._report
+        }
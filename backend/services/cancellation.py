@@ -0,0 +1,165 @@
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, Optional, Tuple, TypeVar
+from fastapi import Request
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from config import settings
+from services.direct_fetch import FetchedResult, fetch_columns
+from services.metrics import metrics
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+stream_cancellations = metrics.counter(
+    "stream_cancellations_total",
+    "Streaming requests abandoned by the client, by the stage that was cut short"
+)
+server_side_cancels = metrics.counter(
+    "stream_server_side_cancels_total",
+    "Postgres statements cancelled because the streaming client went away"
+)
+
+# Only cancel the backend while it is still inside our transaction, so a late
+# cancel can never hit a query issued after the connection went back to the pool.
+# (pg_stat_activity.query is truncated to track_activity_query_size, so long
+# generated statements cannot be matched by their text.)
+TRANSACTION_START = text("SELECT now()")
+CANCEL_BACKEND_QUERY = text("""
+    SELECT pg_cancel_backend(pid)
+    FROM pg_stat_activity
+    WHERE pid = :pid AND state = 'active' AND xact_start = :xact_start
+""")
+
+
+class ClientDisconnected(Exception):
+    def __init__(self, stage: str):
+        self.stage = stage
+        super().__init__(f"Client disconnected during {stage}")
+
+
+class StreamCancellation:
+    """
+    Ties the upstream work of a streaming response to its client connection
+
+    Stages run through ``run``/``execute``/``fetch_columns``/``iterate`` race against a
+    disconnect watcher; when the client goes away the in-flight RAG call or
+    RAG stream is cancelled, a running Postgres statement is cancelled on the
+    server, and ClientDisconnected is raised so no further stages start.
+    """
+
+    def __init__(self, request: Request):
+        self.request = request
+        self.stage = "starting"
+        self._disconnected = asyncio.Event()
+        self._watcher: Optional[asyncio.Task] = None
+        self._statement: Optional[Tuple[AsyncEngine, int, datetime]] = None
+
+    async def __aenter__(self) -> "StreamCancellation":
+        self._watcher = asyncio.create_task(self._watch())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> bool:
+        self._watcher.cancel()
+        # CancelledError: the server noticed the disconnect first and cancelled us
+        if exc_type is not None and issubclass(exc_type, (ClientDisconnected, asyncio.CancelledError)):
+            stream_cancellations.inc(stage=self.stage)
+            logger.info(f"Streaming client went away during {self.stage}, upstream work cancelled")
+            self._cancel_statement()
+        # Nobody is listening any more, so a disconnect just ends the stream
+        return exc_type is not None and issubclass(exc_type, ClientDisconnected)
+
+    @property
+    def disconnected(self) -> bool:
+        return self._disconnected.is_set()
+
+    def check(self):
+        if self._disconnected.is_set():
+            raise ClientDisconnected(self.stage)
+
+    async def _watch(self):
+        while not await self.request.is_disconnected():
+            await asyncio.sleep(settings.STREAM_DISCONNECT_POLL_SECONDS)
+        self._disconnected.set()
+
+    async def run(self, stage: str, awaitable: Awaitable[T]) -> T:
+        """Await ``awaitable`` unless the client disconnects first"""
+        self.stage = stage
+        self.check()
+
+        task = asyncio.ensure_future(awaitable)
+        waiter = asyncio.ensure_future(self._disconnected.wait())
+        try:
+            await asyncio.wait({task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+            if not task.done():
+                task.cancel()
+
+        if task.done():
+            return task.result()
+        raise ClientDisconnected(stage)
+
+    async def execute(self, session: AsyncSession, statement: str):
+        """Execute SQL on ``session``, cancelling it server-side on disconnect"""
+        return await self._run_statement(session, lambda: session.execute(text(statement)))
+
+    async def fetch_columns(self, session: AsyncSession, statement: str) -> FetchedResult:
+        """Like ``execute``, for a READ fetched column-wise (see services.direct_fetch)"""
+        return await self._run_statement(session, lambda: fetch_columns(session, statement))
+
+    async def _run_statement(self, session: AsyncSession, start: Callable[[], Awaitable[T]]) -> T:
+        connection = await session.connection()
+        raw_connection = await connection.get_raw_connection()
+        pid = raw_connection.driver_connection.get_server_pid()
+        # Also opens the transaction if nothing has yet, so the statement runs in it
+        xact_start = (await session.execute(TRANSACTION_START)).scalar()
+
+        self._statement = (connection.engine, pid, xact_start)
+        try:
+            result = await self.run("database query", start())
+        except ClientDisconnected:
+            raise
+        except Exception:
+            self._statement = None
+            raise
+
+        # Left in place on disconnect/cancellation so __aexit__ can cancel it
+        self._statement = None
+        return result
+
+    async def iterate(self, stage: str, chunks: AsyncIterator[T]) -> AsyncIterator[T]:
+        """Relay an async iterator (e.g. a RAG stream), closing it on disconnect"""
+        iterator = chunks.__aiter__()
+        try:
+            while True:
+                try:
+                    chunk = await self.run(stage, iterator.__anext__())
+                except StopAsyncIteration:
+                    return
+                yield chunk
+        finally:
+            aclose = getattr(iterator, "aclose", None)
+            if aclose is not None and not self.disconnected:
+                await aclose()
+
+    def _cancel_statement(self):
+        if self._statement is None:
+            return
+        engine, pid, xact_start = self._statement
+        self._statement = None
+        # Our own task may be cancelled; issue the cancel from an independent task
+        asyncio.ensure_future(_cancel_backend(engine, pid, xact_start))
+
+
+async def _cancel_backend(engine: AsyncEngine, pid: int, xact_start: datetime):
+    try:
+        async with engine.connect() as conn:
+            result = await conn.execute(CANCEL_BACKEND_QUERY, {"pid": pid, "xact_start": xact_start})
+            if result.scalar():
+                server_side_cancels.inc()
+                logger.info(f"Cancelled Postgres backend {pid} after client disconnect")
+    except Exception as e:
+        logger.error(f"Failed to cancel Postgres backend {pid}: {e}")
@@ -0,0 +1,467 @@
+"""
+Conversation memory and in-process follow-up answers.
+
+The last READ result of a conversation is kept column-wise together with
+its classification and SQL. Follow-ups that only refine that result
+("now only the ones in Germany", "sort that by date", "top 5 by score",
+"count by status") are parsed into filter/group/sort/limit operations and
+applied to the cached columns, so they skip classification, SQL generation,
+the database and response generation. Anything the parser does not fully
+understand returns None and goes through the normal pipeline.
+"""
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from config import settings
+from services.cache import TTLCache
+from services.metrics import metrics
+import re
+import uuid
+
+follow_ups = metrics.counter(
+    "conversation_follow_ups_total",
+    "Questions asked in a conversation with a cached result, by how they were answered"
+)
+
+
+class Unanswerable(Exception):
+    """A refinement cannot be applied to the cached result"""
+
+
+class ColumnarResult:
+    """Query result stored as one list per column"""
+
+    __slots__ = ("columns", "data", "row_count")
+
+    def __init__(self, columns: Sequence[str], data: List[list]):
+        self.columns = list(columns)
+        self.data = data
+        self.row_count = len(data[0]) if data else 0
+
+    @classmethod
+    def from_rows(cls, columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> "ColumnarResult":
+        if not rows:
+            return cls(columns, [[] for _ in columns])
+        return cls(columns, [list(values) for values in zip(*rows)])
+
+    def column(self, name: str) -> list:
+        return self.data[self.columns.index(name)]
+
+    def take(self, indices: Sequence[int]) -> "ColumnarResult":
+        return ColumnarResult(self.columns, [[values[i] for i in indices] for values in self.data])
+
+    def rows(self) -> List[tuple]:
+        return list(zip(*self.data))
+
+
+def _normalize(name: str) -> str:
+    return re.sub(r"[\s\-]+", "_", name.strip().lower())
+
+
+def resolve_column(name: str, columns: Sequence[str]) -> Optional[str]:
+    """Exact (normalized) column name, else the first column containing it"""
+    wanted = _normalize(name)
+    if not wanted:
+        return None
+    for column in columns:
+        if _normalize(column) == wanted:
+            return column
+    for column in columns:
+        if wanted in _normalize(column).split("_"):
+            return column
+    for column in columns:
+        if wanted in _normalize(column):
+            return column
+    return None
+
+
+def _sample(values: list) -> Any:
+    return next((value for value in values if value is not None), None)
+
+
+def _coerce(text: str, sample: Any) -> Any:
+    """Parse a literal from the question into the column's value type"""
+    try:
+        if isinstance(sample, bool):
+            return text in ("true", "yes", "1")
+        if isinstance(sample, (int, float, Decimal)):
+            # Decimal compares exactly with int, float and Decimal values
+            return Decimal(text.replace(",", ""))
+        if isinstance(sample, datetime):
+            return datetime.fromisoformat(text)
+        if isinstance(sample, date):
+            return date.fromisoformat(text)
+    except (ValueError, InvalidOperation) as e:
+        raise Unanswerable(f"Cannot compare {text!r} with {type(sample).__name__} values") from e
+    return text.casefold()
+
+
+COMPARATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "=": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b
+}
+
+
+class FilterOp:
+    kind = "filter"
+
+    def __init__(self, column: str, operator: str, value: str):
+        self.column = column
+        self.operator = operator
+        self.value = value
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return (self.kind, self.column)
+
+    def apply(self, result: ColumnarResult) -> ColumnarResult:
+        values = result.column(self.column)
+        sample = _sample(values)
+        target = _coerce(self.value, sample)
+        compare = COMPARATORS[self.operator]
+
+        if isinstance(target, str):
+            keep = [
+                i for i, value in enumerate(values)
+                if value is not None and compare(str(value).casefold(), target)
+            ]
+        else:
+            keep = [i for i, value in enumerate(values) if value is not None and compare(value, target)]
+        return result.take(keep)
+
+    def describe(self) -> str:
+        return f"{self.column} {self.operator} {self.value}"
+
+
+class GroupOp:
+    kind = "group"
+    key = ("group",)
+
+    def __init__(self, column: str, aggregate: str = "count", measure: Optional[str] = None):
+        self.column = column
+        self.aggregate = aggregate
+        self.measure = measure
+
+    @property
+    def output_column(self) -> str:
+        return "count" if self.aggregate == "count" else f"{self.aggregate}_{self.measure}"
+
+    def apply(self, result: ColumnarResult) -> ColumnarResult:
+        keys = result.column(self.column)
+        measures = result.column(self.measure) if self.measure else None
+
+        groups: Dict[Any, list] = {}
+        for i, key in enumerate(keys):
+            groups.setdefault(key, []).append(i)
+
+        def summarize(indices: List[int]) -> Any:
+            if self.aggregate == "count":
+                return len(indices)
+            numbers = [measures[i] for i in indices if measures[i] is not None]
+            if not numbers:
+                return None
+            if self.aggregate == "sum":
+                return sum(numbers)
+            if self.aggregate == "avg":
+                return sum(numbers) / len(numbers)
+            return max(numbers) if self.aggregate == "max" else min(numbers)
+
+        try:
+            summary = [(key, summarize(indices)) for key, indices in groups.items()]
+        except TypeError as e:
+            raise Unanswerable(f"Cannot {self.aggregate} {self.measure}") from e
+        # Largest groups first, groups without a value last
+        summary.sort(key=lambda item: (item[1] is not None, item[1] or 0), reverse=True)
+        return ColumnarResult.from_rows([self.column, self.output_column], summary)
+
+    def describe(self) -> str:
+        if self.aggregate == "count":
+            return f"count by {self.column}"
+        return f"{self.aggregate} of {self.measure} by {self.column}"
+
+
+class SortOp:
+    kind = "sort"
+    key = ("sort",)
+
+    def __init__(self, column: str, descending: bool):
+        self.column = column
+        self.descending = descending
+
+    def apply(self, result: ColumnarResult) -> ColumnarResult:
+        column = resolve_column(self.column, result.columns)
+        if column is None:
+            raise Unanswerable(f"No column matching {self.column!r}")
+        values = result.column(column)
+        present = [i for i, value in enumerate(values) if value is not None]
+        missing = [i for i, value in enumerate(values) if value is None]
+        try:
+            present.sort(key=values.__getitem__, reverse=self.descending)
+        except TypeError as e:
+            raise Unanswerable(f"Cannot sort by {column}") from e
+        # Missing values last in either direction
+        return result.take(present + missing)
+
+    def describe(self) -> str:
+        return f"sorted by {self.column} ({'descending' if self.descending else 'ascending'})"
+
+
+class LimitOp:
+    kind = "limit"
+    key = ("limit",)
+
+    def __init__(self, count: int, from_end: bool = False):
+        self.count = count
+        self.from_end = from_end
+
+    def apply(self, result: ColumnarResult) -> ColumnarResult:
+        if self.from_end:
+            start = max(0, result.row_count - self.count)
+            return result.take(range(start, result.row_count))
+        return result.take(range(min(self.count, result.row_count)))
+
+    def describe(self) -> str:
+        return f"{'last' if self.from_end else 'first'} {self.count}"
+
+
+# Filters see the raw columns; sort and limit may refer to grouped output
+APPLY_ORDER = {"filter": 0, "group": 1, "sort": 2, "limit": 3}
+
+DESCENDING_WORDS = {"desc", "descending", "newest", "latest", "highest", "largest", "biggest", "most", "recent"}
+AGGREGATES = {"sum": "sum", "total": "sum", "average": "avg", "avg": "avg", "mean": "avg", "max": "max",
+              "maximum": "max", "highest": "max", "min": "min", "minimum": "min", "lowest": "min"}
+
+_LEADING_FILLER = re.compile(
+    r"^(?:(?:now|then|and|also|ok|okay|please|can you|could you|show me|show|give me|list)\s+)+"
+)
+_OBJECT = r"(?:\s+(?:that|those|these|them|it|this|the results|results|the list|the data))?"
+_CLAUSE_SPLIT = re.compile(r"\s*(?:,|;|\band then\b|\bthen\b|\band\b)\s*")
+
+_SORT = re.compile(
+    rf"^(?:sort|order|sorted|ordered|rank|ranked){_OBJECT}\s+by\s+(?P<column>[\w\s]+?)"
+    r"(?:\s+(?P<direction>asc|ascending|desc|descending|(?:newest|oldest|latest|earliest|highest|lowest|largest|smallest|most recent)(?: first)?))?$"
+)
+_LIMIT = re.compile(
+    r"^(?:only\s+)?(?:the\s+)?(?P<which>top|first|bottom|last)\s+(?P<count>\d+)"
+    r"(?:\s+(?:rows|records|results|ones))?(?:\s+by\s+(?P<column>[\w\s]+))?$"
+)
+_GROUP = re.compile(
+    rf"^(?:group|grouped|break\s*down|breakdown|split|count|counts){_OBJECT}\s+(?:by|per)\s+(?P<column>[\w\s]+)$"
+)
+_AGGREGATE = re.compile(
+    r"^(?:the\s+)?(?P<aggregate>" + "|".join(AGGREGATES) + r")(?:\s+of)?\s+(?P<measure>[\w\s]+?)\s+(?:by|per|for each)\s+(?P<column>[\w\s]+)$"
+)
+_COMPARISON = re.compile(
+    r"^(?:only\s+)?(?:the\s+ones\s+|rows\s+|records\s+)?(?:where|with)\s+(?P<column>[\w\s]+?)\s*"
+    r"(?P<operator>>=|<=|!=|=|>|<|is not|is|equals|above|over|greater than|more than|after|below|under|less than|before)\s+"
+    r"(?P<value>.+)$"
+)
+_MEMBERSHIP = re.compile(
+    r"^(?:only|just|filter(?:\s+to)?|keep|limit(?:\s+it)?\s+to)?\s*(?:the\s+)?(?:ones|rows|records|those|results)?\s*"
+    r"(?:in|for|from|at|with|of|that are|which are)\s+(?P<value>.+)$"
+)
+_BARE_VALUE = re.compile(
+    r"^(?:only|just)\s+(?:the\s+)?(?P<value>.+?)(?:\s+(?:ones|rows|records|results))?$"
+)
+_OPERATOR_WORDS = {
+    "is": "=", "equals": "=", "is not": "!=", "above": ">", "over": ">", "greater than": ">",
+    "more than": ">", "after": ">", "below": "<", "under": "<", "less than": "<", "before": "<"
+}
+
+
+def _is_descending(direction: Optional[str]) -> bool:
+    return bool(direction) and any(word in DESCENDING_WORDS for word in direction.split())
+
+
+def _find_value_column(value: str, base: ColumnarResult) -> Optional[Tuple[str, str]]:
+    """Column holding ``value`` (case-insensitive), with the stored spelling"""
+    wanted = value.strip().strip("'\"").casefold()
+    for column, values in zip(base.columns, base.data):
+        if not isinstance(_sample(values), str):
+            continue
+        for candidate in values:
+            if candidate is not None and candidate.casefold() == wanted:
+                return column, candidate
+    return None
+
+
+def _parse_clause(clause: str, base: ColumnarResult) -> Optional[object]:
+    match = _SORT.match(clause)
+    if match:
+        return SortOp(match["column"].strip(), _is_descending(match["direction"]))
+
+    match = _LIMIT.match(clause)
+    if match:
+        which = match["which"]
+        # "top 5 by score" ranks before it cuts; plain "first 5" keeps the order
+        if match["column"]:
+            return [
+                SortOp(match["column"].strip(), descending=which in ("top", "first")),
+                LimitOp(int(match["count"]))
+            ]
+        return LimitOp(int(match["count"]), from_end=which in ("bottom", "last"))
+
+    match = _AGGREGATE.match(clause)
+    if match:
+        column = resolve_column(match["column"], base.columns)
+        measure = resolve_column(match["measure"], base.columns)
+        if column and measure:
+            return GroupOp(column, AGGREGATES[match["aggregate"]], measure)
+        return None
+
+    match = _GROUP.match(clause)
+    if match:
+        column = resolve_column(match["column"], base.columns)
+        return GroupOp(column) if column else None
+
+    match = _COMPARISON.match(clause)
+    if match:
+        column = resolve_column(match["column"], base.columns)
+        operator = _OPERATOR_WORDS.get(match["operator"], match["operator"])
+        if column:
+            return FilterOp(column, operator, match["value"].strip().strip("'\""))
+        return None
+
+    for pattern in (_MEMBERSHIP, _BARE_VALUE):
+        match = pattern.match(clause)
+        if match:
+            found = _find_value_column(match["value"], base)
+            if found:
+                return FilterOp(found[0], "=", found[1])
+    return None
+
+
+def parse_follow_up(query: str, base: ColumnarResult) -> Optional[list]:
+    """Refinement operations for ``query``, or None if it needs the full pipeline"""
+    text = _LEADING_FILLER.sub("", query.strip().lower().rstrip("?.! "))
+    if not text:
+        return None
+
+    operations = []
+    for clause in _CLAUSE_SPLIT.split(text):
+        clause = _LEADING_FILLER.sub("", clause)
+        if not clause:
+            continue
+        parsed = _parse_clause(clause, base)
+        if parsed is None:
+            return None
+        operations.extend(parsed if isinstance(parsed, list) else [parsed])
+    return operations or None
+
+
+class ConversationState:
+    def __init__(
+        self,
+        user_id: int,
+        classification: dict,
+        sql_query: str,
+        base: Optional[ColumnarResult]
+    ):
+        self.user_id = user_id
+        self.classification = classification
+        self.sql_query = sql_query
+        self.base = base
+        self.refinements: list = []
+
+    def refine(self, operations: list) -> ColumnarResult:
+        """Merge ``operations`` into the current refinements and apply them to the base result"""
+        replaced = {operation.key for operation in operations}
+        if GroupOp.key in replaced:
+            # A new grouping changes the rows that earlier sorts/limits referred to
+            replaced.update((SortOp.key, LimitOp.key))
+        refinements = [op for op in self.refinements if op.key not in replaced] + operations
+        refinements.sort(key=lambda op: APPLY_ORDER[op.kind])
+
+        result = self.base
+        for operation in refinements:
+            result = operation.apply(result)
+
+        self.refinements = refinements
+        return result
+
+    def describe(self) -> List[str]:
+        return [operation.describe() for operation in self.refinements]
+
+
+class ConversationStore:
+    def __init__(self):
+        self.conversations = TTLCache(
+            max_size=settings.CONVERSATION_CACHE_SIZE,
+            ttl_seconds=settings.CONVERSATION_TTL_SECONDS
+        )
+
+    @staticmethod
+    def new_id() -> str:
+        return uuid.uuid4().hex
+
+    def remember(
+        self,
+        conversation_id: str,
+        user_id: int,
+        classification: dict,
+        sql_query: str,
+        columns: Sequence[str],
+        rows: Sequence[Sequence[Any]]
+    ):
+        base = None
+        if len(rows) <= settings.CONVERSATION_MAX_ROWS:
+            base = ColumnarResult.from_rows(columns, rows)
+        self.remember_result(conversation_id, user_id, classification, sql_query, base)
+
+    def remember_result(
+        self,
+        conversation_id: str,
+        user_id: int,
+        classification: dict,
+        sql_query: str,
+        result: Optional[ColumnarResult]
+    ):
+        """Like ``remember``, for a result that is already column-wise"""
+        # Too large to keep in memory: the SQL is still kept (e.g. for export),
+        # but follow-ups on it go back to the database
+        base = result if result is not None and result.row_count <= settings.CONVERSATION_MAX_ROWS else None
+        self.conversations.set(
+            conversation_id,
+            ConversationState(user_id, classification, sql_query, base)
+        )
+
+    def forget(self, conversation_id: str):
+        self.conversations.pop(conversation_id)
+
+    def get(self, conversation_id: str, user_id: int) -> Optional[ConversationState]:
+        state = self.conversations.get(conversation_id)
+        if state is None or state.user_id != user_id:
+            return None
+        return state
+
+    def answer_locally(
+        self,
+        conversation_id: str,
+        user_id: int,
+        query: str
+    ) -> Optional[Tuple[ConversationState, ColumnarResult]]:
+        """Refined result for a follow-up, or None if it needs the full pipeline"""
+        state = self.get(conversation_id, user_id)
+        if state is None:
+            return None
+        if state.base is None:
+            follow_ups.inc(answered="pipeline")
+            return None
+
+        operations = parse_follow_up(query, state.base)
+        if operations is None:
+            follow_ups.inc(answered="pipeline")
+            return None
+
+        try:
+            result = state.refine(operations)
+        except Unanswerable:
+            follow_ups.inc(answered="pipeline")
+            return None
+
+        follow_ups.inc(answered="local")
+        return state, result
@@ -0,0 +1,102 @@
+"""
+Per-request deadlines for the chat pipeline.
+
+A ``Deadline`` is bound to the current task with ``deadline_scope`` and read
+back anywhere below it (RAG calls, DB statements, audit writes) through
+``current_deadline``, so every stage shares one end-to-end budget instead of
+stacking its own fixed timeout.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+import time
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the request's time budget is used up"""
+
+    def __init__(self, stage: str, budget: float):
+        self.stage = stage
+        self.budget = budget
+        super().__init__(f"Request deadline of {budget:.1f}s exceeded during {stage}")
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.budget = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+    def check(self, stage: str):
+        if self.expired:
+            raise DeadlineExceeded(stage, self.budget)
+
+    def clamp(self, timeout: float, stage: str) -> float:
+        """Shrink ``timeout`` to the remaining budget, raising if none is left"""
+        self.check(stage)
+        return min(timeout, self.remaining())
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("request_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+def resolve_budget(requested: Optional[float]) -> float:
+    """Client-supplied budget capped by CHAT_MAX_DEADLINE_SECONDS, else the default"""
+    if requested is None or requested <= 0:
+        return settings.CHAT_DEADLINE_SECONDS
+    return min(requested, settings.CHAT_MAX_DEADLINE_SECONDS)
+
+
+@contextmanager
+def deadline_scope(seconds: float) -> Iterator[Deadline]:
+    deadline = Deadline(seconds)
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def clamp_timeout(timeout: float, stage: str) -> float:
+    """Timeout for an operation under the current deadline, if any"""
+    deadline = current_deadline()
+    if deadline is None:
+        return timeout
+    return deadline.clamp(timeout, stage)
+
+
+def deadline_expired() -> bool:
+    deadline = current_deadline()
+    return deadline is not None and deadline.expired
+
+
+async def apply_statement_timeout(session: AsyncSession, stage: str, floor: float = 0.0):
+    """
+    Bound the rest of the session's transaction by the remaining budget
+
+    ``floor`` keeps a minimum allowance for work that must still happen after
+    the budget is gone (e.g. writing the audit record of a timed-out query).
+    """
+    deadline = current_deadline()
+    if deadline is None:
+        return
+
+    remaining = deadline.remaining()
+    if remaining <= 0.0 and floor <= 0.0:
+        raise DeadlineExceeded(stage, deadline.budget)
+
+    timeout_ms = max(1, int(max(remaining, floor) * 1000))
+    await session.execute(text(f"SET LOCAL statement_timeout = {timeout_ms}"))
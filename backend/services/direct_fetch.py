@@ -0,0 +1,112 @@
+"""
+READ results fetched on the raw asyncpg connection, column by column.
+
+The SQLAlchemy path builds a ``Row`` per record and then a dict per row,
+and the response encoder inspects every value's type again. Here the
+generated statement is prepared on the session's asyncpg connection (same
+transaction, so statement_timeout still applies) and read in batches of
+DIRECT_FETCH_BATCH_ROWS records, which are transposed straight into one
+list per column. The column types are known from the prepared statement,
+so dates and numerics get one JSON codec per column instead of a type check
+per value, and ``encoded_rows`` hands result_store plain JSON values.
+DIRECT_FETCH_ENABLED=false falls back to the SQLAlchemy path (e.g. behind a
+connection pooler that does not support prepared statements).
+"""
+from typing import Any, Callable, List, Optional, Sequence
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from services.conversation import ColumnarResult
+
+# Postgres type name -> JSON codec, matching services.result_store.encode_value;
+# other types are already JSON values (or encoded further down, e.g. arrays)
+Codec = Callable[[Any], Any]
+
+
+def _isoformat(value: Any) -> str:
+    return value.isoformat()
+
+
+CODECS = {
+    "numeric": float,
+    "date": _isoformat,
+    "time": _isoformat,
+    "timetz": _isoformat,
+    "timestamp": _isoformat,
+    "timestamptz": _isoformat,
+    "interval": str,
+    "uuid": str,
+    "inet": str,
+    "cidr": str,
+    "macaddr": str
+}
+
+
+class FetchedResult(ColumnarResult):
+    """A READ result held column-wise, with the JSON codec of each column"""
+
+    __slots__ = ("codecs",)
+
+    def __init__(self, columns: Sequence[str], data: List[list], codecs: Sequence[Optional[Codec]]):
+        super().__init__(columns, data)
+        self.codecs = list(codecs)
+
+    @classmethod
+    def from_rows(cls, columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> "FetchedResult":
+        """From SQLAlchemy rows; values are left for the response encoder"""
+        base = ColumnarResult.from_rows(columns, rows)
+        return cls(base.columns, base.data, [None] * len(base.columns))
+
+    @classmethod
+    def for_statement(cls, statement) -> "FetchedResult":
+        attributes = statement.get_attributes()
+        return cls(
+            [attribute.name for attribute in attributes],
+            [[] for _ in attributes],
+            [CODECS.get(attribute.type.name) for attribute in attributes]
+        )
+
+    def extend(self, records: Sequence[Sequence[Any]]):
+        if not records:
+            return
+        for values, column in zip(self.data, zip(*records)):
+            values.extend(column)
+        self.row_count += len(records)
+
+    def encoded_columns(self) -> List[list]:
+        return [
+            values if codec is None else [None if value is None else codec(value) for value in values]
+            for values, codec in zip(self.data, self.codecs)
+        ]
+
+    def encoded_rows(self) -> List[tuple]:
+        """Row tuples of JSON values, for result_store and the response"""
+        if not self.columns:
+            return [()] * self.row_count
+        return list(zip(*self.encoded_columns()))
+
+
+async def fetch_columns(session: AsyncSession, statement: str) -> FetchedResult:
+    """Run a READ statement in ``session``'s transaction, fetching it into columns"""
+    if not settings.DIRECT_FETCH_ENABLED:
+        executed = await session.execute(text(statement))
+        return FetchedResult.from_rows(list(executed.keys()), executed.fetchall())
+
+    connection = await session.connection()
+    raw_connection = (await connection.get_raw_connection()).driver_connection
+
+    prepared = await raw_connection.prepare(statement)
+    result = FetchedResult.for_statement(prepared)
+    batch_rows = settings.DIRECT_FETCH_BATCH_ROWS
+
+    if not raw_connection.is_in_transaction():
+        # Cursors need a transaction, and nothing has opened one (no statement_timeout was set)
+        result.extend(await prepared.fetch())
+        return result
+
+    cursor = await prepared.cursor()
+    while True:
+        records = await cursor.fetch(batch_rows)
+        result.extend(records)
+        if len(records) < batch_rows:
+            return result
@@ -0,0 +1,264 @@
+"""
+Streaming export of READ query results as CSV, NDJSON or Parquet.
+
+Rows come from a server-side cursor in EXPORT_BATCH_ROWS partitions and are
+encoded and sent one partition at a time, so memory stays flat however many
+rows the query returns. Only SQL the chat pipeline already generated (and
+scoped to the user) is exported; clients never supply SQL here.
+"""
+from typing import Any, AsyncIterator, List, Sequence
+from sqlalchemy import text
+from config import settings
+from database.registry import DatabaseRegistry
+from services.admission import BULK, admission, admission_scope
+from services.audit_service import AuditService
+from services.metrics import metrics
+from services.result_store import encode_value
+import csv
+import io
+import json
+import logging
+import time
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is unavailable without pyarrow
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet"
+}
+
+exported_rows = metrics.counter("export_rows_total", "Rows streamed by /api/export, by format")
+
+
+def parquet_available() -> bool:
+    return pa is not None
+
+
+class _CsvEncoder:
+    def __init__(self, columns: Sequence[str]):
+        self.columns = columns
+        self.header_written = False
+
+    def encode(self, rows: Sequence[Sequence[Any]]) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if not self.header_written:
+            writer.writerow(self.columns)
+            self.header_written = True
+        writer.writerows(
+            [value.isoformat() if hasattr(value, "isoformat") else value for value in row]
+            for row in rows
+        )
+        return buffer.getvalue().encode()
+
+    def finish(self) -> bytes:
+        # An empty result still gets its header row
+        return b"" if self.header_written else self.encode([])
+
+
+class _NdjsonEncoder:
+    def __init__(self, columns: Sequence[str]):
+        self.columns = columns
+
+    def encode(self, rows: Sequence[Sequence[Any]]) -> bytes:
+        return "".join(
+            json.dumps(dict(zip(self.columns, row)), default=encode_value) + "\n"
+            for row in rows
+        ).encode()
+
+    def finish(self) -> bytes:
+        return b""
+
+
+class _ChunkSink:
+    """Write-only file object whose contents are handed out as they are written"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        chunk = bytes(data)
+        self._chunks.append(chunk)
+        self._position += len(chunk)
+        return len(chunk)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+# Postgres type name -> Arrow type; anything else is exported as text. NUMERIC
+# has no fixed scale (e.g. the unconstrained KRI value columns), so it is
+# written as float64, the same value the JSON formats carry.
+def _arrow_type(type_name: str):
+    return {
+        "bool": pa.bool_(),
+        "int2": pa.int16(),
+        "int4": pa.int32(),
+        "int8": pa.int64(),
+        "oid": pa.int64(),
+        "float4": pa.float32(),
+        "float8": pa.float64(),
+        "numeric": pa.float64(),
+        "date": pa.date32(),
+        "time": pa.time64("us"),
+        "timestamp": pa.timestamp("us"),
+        "timestamptz": pa.timestamp("us", tz="UTC"),
+        "interval": pa.duration("us"),
+        "bytea": pa.binary()
+    }.get(type_name, pa.string())
+
+
+def _as_text(value: Any) -> Any:
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        # json/jsonb and arrays
+        return json.dumps(value, default=encode_value)
+    return str(value)
+
+
+async def _column_types(session, sql_query: str) -> List[str]:
+    """Postgres type names of the query's result columns, without running it"""
+    connection = await session.connection()
+    raw_connection = (await connection.get_raw_connection()).driver_connection
+    prepared = await raw_connection.prepare(sql_query)
+    return [attribute.type.name for attribute in prepared.get_attributes()]
+
+
+class _ParquetEncoder:
+    """One row group per partition, typed from the query's columns before any row is read"""
+
+    def __init__(self, columns: Sequence[str], types: Sequence[str]):
+        self.columns = list(columns)
+        self.schema = pa.schema([pa.field(name, _arrow_type(type_name)) for name, type_name in zip(columns, types)])
+        self.converters = [
+            float if type_name == "numeric" else _as_text if pa.types.is_string(field.type) else None
+            for type_name, field in zip(types, self.schema)
+        ]
+        self.sink = _ChunkSink()
+        self.writer = pq.ParquetWriter(self.sink, self.schema)
+
+    def encode(self, rows: Sequence[Sequence[Any]]) -> bytes:
+        if not rows:
+            return b""
+        data = {}
+        for i, (field, convert) in enumerate(zip(self.schema, self.converters)):
+            values = [row[i] for row in rows]
+            if convert is not None:
+                values = [None if value is None else convert(value) for value in values]
+            data[field.name] = values
+        self.writer.write_table(pa.table(data, schema=self.schema))
+        return self.sink.drain()
+
+    def finish(self) -> bytes:
+        self.writer.close()
+        return self.sink.drain()
+
+
+ENCODERS = {"csv": _CsvEncoder, "ndjson": _NdjsonEncoder}
+
+
+class ExportService:
+    def __init__(self, registry: DatabaseRegistry):
+        self.registry = registry
+
+    async def stream(
+        self,
+        application: str,
+        sql_query: str,
+        export_format: str,
+        user_context: dict
+    ) -> AsyncIterator[bytes]:
+        """Encoded export of ``sql_query``'s rows, audited once the stream ends"""
+        started = time.monotonic()
+        row_count = 0
+        error = None
+
+        target = self.registry.target(application, user_context)
+        with admission_scope(user_context["user_id"], BULK):
+            async with target.session_factory() as session:
+                try:
+                    async with admission.slot(target.resource, weight=settings.ADMISSION_EXPORT_WEIGHT):
+                        # Parquet columns are typed from the query, not from the rows that come first
+                        types = await _column_types(session, sql_query) if export_format == "parquet" else None
+                        # Server-side cursor: rows arrive a partition at a time
+                        result = await session.stream(
+                            text(sql_query),
+                            execution_options={"yield_per": settings.EXPORT_BATCH_ROWS}
+                        )
+                        if types is not None:
+                            encoder = _ParquetEncoder(list(result.keys()), types)
+                        else:
+                            encoder = ENCODERS[export_format](list(result.keys()))
+                        async for partition in result.partitions():
+                            row_count += len(partition)
+                            chunk = encoder.encode(partition)
+                            if chunk:
+                                yield chunk
+                        chunk = encoder.finish()
+                        if chunk:
+                            yield chunk
+                except Exception as e:
+                    error = str(e)
+                    logger.error(f"Export failed after {row_count} rows: {e}")
+                    await session.rollback()
+                    raise
+                except BaseException:
+                    # Client went away mid-download; the audit commit closes the cursor
+                    error = f"Export interrupted after {row_count} rows"
+                    raise
+                finally:
+                    exported_rows.inc(row_count, format=export_format)
+                    await self._audit(
+                        session, application, sql_query, export_format,
+                        user_context, row_count, time.monotonic() - started, error
+                    )
+
+    @staticmethod
+    async def _audit(
+        session,
+        application: str,
+        sql_query: str,
+        export_format: str,
+        user_context: dict,
+        row_count: int,
+        elapsed: float,
+        error: str
+    ):
+        await AuditService.log_operation(
+            session=session,
+            user_id=user_context["user_id"],
+            username=user_context["username"],
+            application=application,
+            operation="EXPORT",
+            table_name="multi_table_query",
+            query_executed=sql_query,
+            changes={
+                "format": export_format,
+                "rows": row_count,
+                "seconds": round(elapsed, 3)
+            },
+            success=error is None,
+            error_message=error
+        )
@@ -0,0 +1,232 @@
+"""
+Federated READ questions that span eControls and MyKRI.
+
+When classification targets both applications ("BOTH", or an explicit
+``applications`` list), SQL is generated for each in parallel, the statements
+run concurrently on their own engines, and the results are combined in
+process before a single response is generated.
+
+Results are joined on the scope/user columns they share (ou, lre, country,
+user_id, username) when that key is unique on at least one side, which is
+the case for per-scope or per-user aggregates. Two entity listings would
+multiply out on such a key, so they are stacked instead, tagged with the
+application each row came from.
+"""
+from typing import Dict, List, Sequence, Tuple
+from sqlalchemy import text
+from database.registry import DatabaseRegistry
+from services.admission import admission
+from services.audit_service import AuditService
+from services.deadline import apply_statement_timeout, current_deadline
+from services.metrics import metrics
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+FEDERATED = "BOTH"
+FEDERATED_APPLICATIONS = ("eControls", "MyKRI")
+JOIN_KEYS = ("ou", "lre", "country", "user_id", "username")
+
+federated_queries = metrics.counter("federated_queries_total", "Questions answered from both applications, by merge mode")
+
+
+def target_applications(classification: dict, registered: Sequence[str]) -> List[str]:
+    """Registered applications a classification asks for, in registry order"""
+    requested = classification.get("applications")
+    if not requested:
+        application = classification.get("application")
+        requested = FEDERATED_APPLICATIONS if application == FEDERATED else [application]
+    return [application for application in registered if application in requested]
+
+
+class FederatedResult:
+    def __init__(self, columns: List[str], rows: List[tuple], join_keys: List[str], statements: Dict[str, str]):
+        self.columns = columns
+        self.rows = rows
+        self.join_keys = join_keys
+        self.statements = statements
+
+    @property
+    def mode(self) -> str:
+        return "joined" if self.join_keys else "stacked"
+
+
+def _unique(rows: Sequence[Sequence], positions: List[int]) -> bool:
+    seen = set()
+    for row in rows:
+        key = tuple(row[i] for i in positions)
+        if key in seen:
+            return False
+        seen.add(key)
+    return True
+
+
+def _join(
+    left: Tuple[List[str], Sequence[Sequence]],
+    right: Tuple[List[str], Sequence[Sequence]],
+    keys: List[str],
+    right_prefix: str
+) -> Tuple[List[str], List[tuple]]:
+    """Full outer hash join of ``right`` onto ``left`` on ``keys``"""
+    left_columns, left_rows = left
+    right_columns, right_rows = right
+    left_keys = [left_columns.index(key) for key in keys]
+    right_keys = [right_columns.index(key) for key in keys]
+    right_rest = [i for i, name in enumerate(right_columns) if name not in keys]
+
+    columns = list(left_columns) + [
+        f"{right_prefix}_{right_columns[i]}" if right_columns[i] in left_columns else right_columns[i]
+        for i in right_rest
+    ]
+
+    index: Dict[tuple, List[Sequence]] = {}
+    for row in right_rows:
+        index.setdefault(tuple(row[i] for i in right_keys), []).append(row)
+
+    rows = []
+    matched = set()
+    missing_right = (None,) * len(right_rest)
+    for row in left_rows:
+        key = tuple(row[i] for i in left_keys)
+        partners = index.get(key)
+        if partners:
+            matched.add(key)
+            rows.extend(tuple(row) + tuple(partner[i] for i in right_rest) for partner in partners)
+        else:
+            rows.append(tuple(row) + missing_right)
+
+    for key, partners in index.items():
+        if key in matched:
+            continue
+        values = [None] * len(left_columns)
+        for position, value in zip(left_keys, key):
+            values[position] = value
+        rows.extend(tuple(values) + tuple(partner[i] for i in right_rest) for partner in partners)
+
+    return columns, rows
+
+
+def _stack(results: Dict[str, Tuple[List[str], Sequence[Sequence]]]) -> Tuple[List[str], List[tuple]]:
+    """Rows from every application under the union of their columns"""
+    columns: List[str] = []
+    for result_columns, _ in results.values():
+        columns.extend(name for name in result_columns if name not in columns)
+
+    rows = []
+    for application, (result_columns, result_rows) in results.items():
+        positions = {name: i for i, name in enumerate(result_columns)}
+        picks = [positions.get(name) for name in columns]
+        rows.extend(
+            (application,) + tuple(row[i] if i is not None else None for i in picks)
+            for row in result_rows
+        )
+    return ["application"] + columns, rows
+
+
+def merge_results(results: Dict[str, Tuple[List[str], Sequence[Sequence]]]) -> Tuple[List[str], List[tuple], List[str]]:
+    """Combine per-application results; returns columns, rows and the join keys used"""
+    if len(results) != 2:
+        columns, rows = _stack(results)
+        return columns, rows, []
+
+    (left_app, left), (right_app, right) = results.items()
+    keys = [key for key in JOIN_KEYS if key in left[0] and key in right[0]]
+    if keys and (
+        _unique(left[1], [left[0].index(key) for key in keys])
+        or _unique(right[1], [right[0].index(key) for key in keys])
+    ):
+        columns, rows = _join(left, right, keys, right_app.lower())
+        return columns, rows, keys
+
+    columns, rows = _stack(results)
+    return columns, rows, []
+
+
+class FederatedExecutor:
+    def __init__(self, rag_agent, registry: DatabaseRegistry):
+        self.rag_agent = rag_agent
+        self.registry = registry
+
+    def is_federated(self, classification: dict) -> bool:
+        return len(target_applications(classification, self.registry.applications)) > 1
+
+    async def run(self, query: str, classification: dict, user_context: dict) -> FederatedResult:
+        # Two databases cannot change atomically, so only READs are federated
+        if classification["intent"] != "READ":
+            raise ValueError("Changes must target one application at a time")
+
+        applications = target_applications(classification, self.registry.applications)
+        sql_infos = await self._gather(
+            self.rag_agent.generate_sql_query(
+                user_query=query,
+                application=application,
+                user_context=user_context,
+                intent="READ"
+            )
+            for application in applications
+        )
+        statements = {
+            application: sql_info["sql_query"]
+            for application, sql_info in zip(applications, sql_infos)
+        }
+
+        results = await self._gather(
+            self._execute(application, statements[application], user_context, query)
+            for application in applications
+        )
+        columns, rows, keys = merge_results(dict(zip(applications, results)))
+
+        result = FederatedResult(columns, rows, keys, statements)
+        federated_queries.inc(mode=result.mode)
+        logger.info(
+            "Federated query over %s: %d rows (%s)", ", ".join(applications), len(rows), result.mode,
+            extra={"category": "sql"}
+        )
+        return result
+
+    @staticmethod
+    async def _gather(coroutines) -> list:
+        # Let every branch finish (and audit) before surfacing the first failure
+        results = await asyncio.gather(*coroutines, return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return results
+
+    async def _execute(
+        self, application: str, sql_query: str, user_context: dict, question: str
+    ) -> Tuple[List[str], list]:
+        target = self.registry.target(application, user_context)
+        async with target.session_factory() as session:
+            async with admission.slot(target.resource):
+                try:
+                    await apply_statement_timeout(session, "database query")
+                    result = await session.execute(text(sql_query))
+                    columns = list(result.keys())
+                    rows = result.fetchall()
+                except Exception as db_error:
+                    await session.rollback()
+                    await self._audit(session, application, sql_query, user_context, question, False, str(db_error))
+                    current_deadline().check("database query")
+                    raise
+
+            await self._audit(session, application, sql_query, user_context, question, True)
+        return columns, rows
+
+    @staticmethod
+    async def _audit(
+        session, application: str, sql_query: str, user_context: dict, question: str, success: bool, error: str = None
+    ):
+        await AuditService.log_operation(
+            session=session,
+            user_id=user_context["user_id"],
+            username=user_context["username"],
+            application=application,
+            operation="READ",
+            table_name="multi_table_query",
+            query_executed=sql_query,
+            question=question,
+            success=success,
+            error_message=error
+        )
@@ -0,0 +1,130 @@
+from datetime import datetime
+from typing import Dict, Optional
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from config import settings
+from services.rag_client import RAGClient
+from services.resilience import guard_snapshots
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class HealthMonitor:
+    """
+    Periodically probes the RAG API and database engines in the background
+
+    /api/health reads the cached results instead of calling upstream, so
+    Kubernetes probes cost a dict copy no matter how slow the dependencies are.
+    """
+
+    def __init__(self, rag_client: RAGClient, engines: Dict[str, AsyncEngine]):
+        self.rag_client = rag_client
+        self.engines = engines
+        self.interval = settings.HEALTH_CHECK_INTERVAL_SECONDS
+        self.timeout = settings.HEALTH_CHECK_TIMEOUT_SECONDS
+        self._checks: Dict[str, dict] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Health refresh failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def refresh(self):
+        """Probe every dependency concurrently and update the cached state"""
+        probes = {"rag_api": self._probe_rag()}
+        for name, engine in self.engines.items():
+            probes[name] = self._probe_database(engine)
+
+        results = await asyncio.gather(*probes.values())
+        for name, result in zip(probes.keys(), results):
+            self._record(name, *result)
+
+    async def _timed_probe(self, probe) -> tuple:
+        started = time.perf_counter()
+        try:
+            healthy = await asyncio.wait_for(probe, timeout=self.timeout)
+            error = None if healthy else "unhealthy response"
+        except asyncio.TimeoutError:
+            healthy, error = False, f"timed out after {self.timeout}s"
+        except Exception as e:
+            healthy, error = False, str(e)
+        return healthy, (time.perf_counter() - started) * 1000, error
+
+    async def _probe_rag(self) -> tuple:
+        return await self._timed_probe(self.rag_client.health_check())
+
+    async def _probe_database(self, engine: AsyncEngine) -> tuple:
+        async def ping() -> bool:
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+            return True
+
+        return await self._timed_probe(ping())
+
+    def _record(self, name: str, healthy: bool, latency_ms: float, error: Optional[str]):
+        previous = self._checks.get(name)
+        if previous is None or previous["healthy"] != healthy:
+            if healthy:
+                logger.info(f"Health: {name} is up")
+            else:
+                logger.warning(f"Health: {name} is down ({error})")
+
+        self._checks[name] = {
+            "healthy": healthy,
+            "latency_ms": round(latency_ms, 1),
+            "checked_at": datetime.utcnow().isoformat() + "Z",
+            "error": error
+        }
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Last known state of every dependency, without probing"""
+        return {name: dict(check) for name, check in self._checks.items()}
+
+    def is_healthy(self, name: str) -> bool:
+        check = self._checks.get(name)
+        return bool(check and check["healthy"])
+
+    def pool_status(self) -> Dict[str, dict]:
+        status = {}
+        for name, engine in self.engines.items():
+            pool = engine.pool
+            size = pool.size()
+            checked_out = pool.checkedout()
+            capacity = size + getattr(pool, "_max_overflow", 0)
+            status[name] = {
+                "pool_size": size,
+                "checked_out": checked_out,
+                "checked_in": pool.checkedin(),
+                "overflow": pool.overflow(),
+                "utilization": round(checked_out / capacity, 3) if capacity else None
+            }
+        return status
+
+    async def deep_check(self) -> dict:
+        """Probe now and include pool utilization and RAG resilience state"""
+        await self.refresh()
+        return {
+            "checks": self.snapshot(),
+            "pools": self.pool_status(),
+            "rag_resilience": guard_snapshots()
+        }
@@ -0,0 +1,259 @@
+"""
+Asynchronous job mode for long-running analytical questions.
+
+Jobs are queued on a bounded in-process queue and run by a fixed pool of
+workers under JOB_DEADLINE_SECONDS instead of the interactive chat budget.
+Results are kept as a ``StoredResult`` (spilled to disk when large) and read
+back page by page; finished jobs expire after JOB_RESULT_TTL_SECONDS.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+from config import settings
+from database.registry import DatabaseRegistry
+from services.admission import BULK, AdmissionRejected, admission, admission_scope
+from services.audit_service import AuditService
+from services.cache import TTLCache
+from services.deadline import (
+    DeadlineExceeded, apply_statement_timeout, current_deadline, deadline_scope
+)
+from services.direct_fetch import fetch_columns
+from services.metrics import metrics
+from services.prompt_budget import prompt_budget
+from services.result_store import StoredResult
+import asyncio
+import logging
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+job_runtime = metrics.histogram(
+    "job_run_seconds",
+    "Time from a job starting to finishing, by final status",
+    buckets=(1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 900.0)
+)
+jobs_submitted = metrics.counter("jobs_submitted_total", "Jobs accepted onto the queue")
+
+
+class Job:
+    def __init__(self, query: str, user_context: dict):
+        self.id = uuid.uuid4().hex
+        self.query = query
+        self.user_context = user_context
+        self.status = QUEUED
+        self.submitted_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.classification: Optional[dict] = None
+        self.sql_query: Optional[str] = None
+        self.response: Optional[str] = None
+        self.sources: List = []
+        self.result: Optional[StoredResult] = None
+        self.error: Optional[str] = None
+
+    @property
+    def user_id(self) -> int:
+        return self.user_context["user_id"]
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "query": self.query,
+            "submitted_at": self.submitted_at.isoformat() + "Z",
+            "started_at": self.started_at.isoformat() + "Z" if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() + "Z" if self.finished_at else None,
+            "classification": self.classification,
+            "sql_executed": self.sql_query,
+            "row_count": self.result.row_count if self.result else None,
+            "error": self.error
+        }
+
+    def discard(self):
+        if self.result is not None:
+            self.result.discard()
+
+
+class JobManager:
+    def __init__(self, rag_agent, rag_client, registry: DatabaseRegistry):
+        self.rag_agent = rag_agent
+        self.rag_client = rag_client
+        self.registry = registry
+        self.jobs = TTLCache(
+            max_size=settings.JOB_MAX_RETAINED,
+            ttl_seconds=settings.JOB_RESULT_TTL_SECONDS,
+            on_evict=lambda job_id, job: job.discard()
+        )
+        self._queue: "asyncio.Queue[Job]" = asyncio.Queue(maxsize=settings.JOB_QUEUE_SIZE)
+        self._workers: List[asyncio.Task] = []
+        self._active_by_user: Dict[int, int] = {}
+
+    def start(self):
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"job-worker-{index}")
+            for index in range(settings.JOB_WORKERS)
+        ]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        # Spill files do not outlive the process
+        self.jobs.clear()
+
+    def submit(self, query: str, user_context: dict) -> Job:
+        self.jobs.purge_expired()
+
+        user_id = user_context["user_id"]
+        if self._active_by_user.get(user_id, 0) >= settings.JOB_MAX_ACTIVE_PER_USER:
+            raise AdmissionRejected("jobs", "too many active jobs for user", self._retry_after())
+
+        job = Job(query, user_context)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise AdmissionRejected("jobs", "queue full", self._retry_after())
+
+        self.jobs.set(job.id, job)
+        self._active_by_user[user_id] = self._active_by_user.get(user_id, 0) + 1
+        jobs_submitted.inc()
+        return job
+
+    def get(self, job_id: str, user_id: int) -> Optional[Job]:
+        """The job, if it exists and belongs to ``user_id``"""
+        job = self.jobs.get(job_id)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    def _retry_after(self) -> int:
+        return max(1, self._queue.qsize() // max(1, settings.JOB_WORKERS))
+
+    def snapshot(self) -> dict:
+        return {
+            "workers": len(self._workers),
+            "queued": self._queue.qsize(),
+            "queue_size": settings.JOB_QUEUE_SIZE,
+            "retained": len(self.jobs),
+            "active_users": len(self._active_by_user)
+        }
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                # Skip jobs evicted from the store while they were queued
+                if job.id in self.jobs:
+                    await self._run(job)
+            except Exception as e:
+                logger.error(f"Job {job.id} crashed: {e}")
+            finally:
+                self._finished(job.user_id)
+                self._queue.task_done()
+
+    def _finished(self, user_id: int):
+        remaining = self._active_by_user.get(user_id, 0) - 1
+        if remaining > 0:
+            self._active_by_user[user_id] = remaining
+        else:
+            self._active_by_user.pop(user_id, None)
+
+    async def _run(self, job: Job):
+        job.status = RUNNING
+        job.started_at = datetime.utcnow()
+        started = time.monotonic()
+
+        with deadline_scope(settings.JOB_DEADLINE_SECONDS), admission_scope(job.user_id, BULK):
+            try:
+                await self._execute(job)
+                job.status = SUCCEEDED
+            except Exception as e:
+                logger.error(f"Job {job.id} failed: {e}")
+                job.status = FAILED
+                job.error = str(e)
+
+        elapsed = time.monotonic() - started
+        job.finished_at = datetime.utcnow()
+        job_runtime.observe(elapsed, status=job.status)
+        logger.info(f"Job {job.id} {job.status} in {elapsed:.1f}s")
+        # Results stay available for the full TTL after completion
+        if job.id in self.jobs:
+            self.jobs.set(job.id, job)
+        else:
+            job.discard()
+
+    async def _execute(self, job: Job):
+        classification = await self.rag_agent.classify_intent(job.query, job.user_context)
+        job.classification = classification
+
+        if classification["application"] == "RAG_ONLY":
+            retrieval = prompt_budget.retrieval(job.query, default_top_k=5)
+            rag_result = await self.rag_client.query_rag(query=retrieval.text, top_k=retrieval.top_k)
+            job.sources = rag_result.get("sources", [])
+            job.response = await self.rag_agent.generate_response(
+                query_result=None,
+                original_query=job.query,
+                rag_context=rag_result.get("context", "")
+            )
+            return
+
+        # Jobs run unattended, so nothing that modifies data runs here
+        if classification["intent"] != "READ":
+            raise ValueError("Jobs only run READ queries; submit changes through /api/chat")
+
+        application = classification["application"]
+        sql_info = await self.rag_agent.generate_sql_query(
+            user_query=job.query,
+            application=application,
+            user_context=job.user_context,
+            intent=classification["intent"]
+        )
+        job.sql_query = sql_info["sql_query"]
+
+        target = self.registry.target(application, job.user_context)
+        async with target.session_factory() as session:
+            async with admission.slot(target.resource, weight=settings.ADMISSION_BULK_READ_WEIGHT):
+                try:
+                    await apply_statement_timeout(session, "database query")
+                    fetched = await fetch_columns(session, job.sql_query)
+                except Exception as db_error:
+                    await session.rollback()
+                    await self._audit(session, job, application, success=False, error=str(db_error))
+                    current_deadline().check("database query")
+                    raise
+
+            await self._audit(session, job, application, success=True)
+
+        job.result = await asyncio.to_thread(StoredResult.from_rows, fetched.columns, fetched.encoded_rows())
+        del fetched
+
+        # The summary is written from a preview; the full rows are paged separately
+        preview = await job.result.page(0, settings.JOB_RESPONSE_PREVIEW_ROWS)
+        try:
+            job.response = await self.rag_agent.generate_response(
+                query_result=preview,
+                original_query=job.query,
+                total_rows=job.result.row_count
+            )
+        except DeadlineExceeded:
+            job.response = self.rag_agent.fallback_response(preview, job.result.row_count)
+
+    async def _audit(self, session, job: Job, application: str, success: bool, error: str = None):
+        await AuditService.log_operation(
+            session=session,
+            user_id=job.user_id,
+            username=job.user_context["username"],
+            application=application,
+            operation="READ",
+            table_name="multi_table_query",
+            query_executed=job.sql_query,
+            question=job.query,
+            success=success,
+            error_message=error
+        )
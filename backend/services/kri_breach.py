@@ -0,0 +1,328 @@
+"""
+Numeric KRI values and threshold-breach evaluation.
+
+``kri_values.kri_value`` and ``kri_indicators.threshold_value`` stay free
+text, but triggers keep typed companions next to them: the numeric value and
+unit of every entry, and the operator/bound/unit of every threshold (e.g.
+'>85%' -> '>', 85, '%'). Every write path (chat SQL, bulk COPY) goes through
+the triggers, so the engine can evaluate the latest value of every KRI in
+scope with one query and one columnar pass, without asking the RAG API to
+write string-parsing SQL.
+"""
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from sqlalchemy import text
+from config import settings
+from database.registry import DatabaseRegistry, DatabaseTarget
+from database.schema import ensure_statements
+import asyncio
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Idempotent, and only re-run when it changes (see database.schema)
+KRI_NUMERIC_DDL = [
+    "ALTER TABLE kri_values ADD COLUMN IF NOT EXISTS kri_value_numeric NUMERIC",
+    "ALTER TABLE kri_values ADD COLUMN IF NOT EXISTS kri_value_unit VARCHAR(10)",
+    "ALTER TABLE kri_indicators ADD COLUMN IF NOT EXISTS threshold_operator VARCHAR(2)",
+    "ALTER TABLE kri_indicators ADD COLUMN IF NOT EXISTS threshold_bound NUMERIC",
+    "ALTER TABLE kri_indicators ADD COLUMN IF NOT EXISTS threshold_unit VARCHAR(10)",
+    r"""
+    CREATE OR REPLACE FUNCTION parse_kri_number(raw TEXT) RETURNS NUMERIC AS $$
+        SELECT (regexp_match(replace(raw, ',', ''), '[-+]?[0-9]*\.?[0-9]+'))[1]::numeric
+    $$ LANGUAGE sql IMMUTABLE
+    """,
+    r"""
+    CREATE OR REPLACE FUNCTION parse_kri_unit(raw TEXT) RETURNS VARCHAR AS $$
+        SELECT CASE
+            WHEN position('%' in raw) > 0 THEN '%'
+            WHEN raw ~* '[0-9\s]bps\s*$' THEN 'bps'
+            ELSE ''
+        END
+    $$ LANGUAGE sql IMMUTABLE
+    """,
+    r"""
+    CREATE OR REPLACE FUNCTION parse_threshold_operator(raw TEXT) RETURNS VARCHAR AS $$
+        SELECT CASE
+            WHEN raw ~ '^\s*(±|\+/-)' THEN '±'
+            WHEN raw ~ '^\s*(<=|≤)' THEN '<='
+            WHEN raw ~ '^\s*(>=|≥)' THEN '>='
+            WHEN raw ~ '^\s*<' THEN '<'
+            WHEN raw ~ '^\s*>' THEN '>'
+        END
+    $$ LANGUAGE sql IMMUTABLE
+    """,
+    """
+    CREATE OR REPLACE FUNCTION kri_values_parse_numeric() RETURNS trigger AS $$
+    BEGIN
+        NEW.kri_value_numeric := parse_kri_number(NEW.kri_value);
+        NEW.kri_value_unit := parse_kri_unit(NEW.kri_value);
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION kri_indicators_parse_threshold() RETURNS trigger AS $$
+    BEGIN
+        NEW.threshold_operator := parse_threshold_operator(NEW.threshold_value);
+        NEW.threshold_bound := CASE
+            WHEN NEW.threshold_operator = '±' THEN abs(parse_kri_number(NEW.threshold_value))
+            WHEN NEW.threshold_operator IS NOT NULL THEN parse_kri_number(NEW.threshold_value)
+        END;
+        NEW.threshold_unit := parse_kri_unit(NEW.threshold_value);
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS kri_values_numeric ON kri_values",
+    """
+    CREATE TRIGGER kri_values_numeric
+    BEFORE INSERT OR UPDATE OF kri_value ON kri_values
+    FOR EACH ROW EXECUTE FUNCTION kri_values_parse_numeric()
+    """,
+    "DROP TRIGGER IF EXISTS kri_indicators_threshold ON kri_indicators",
+    """
+    CREATE TRIGGER kri_indicators_threshold
+    BEFORE INSERT OR UPDATE OF threshold_value ON kri_indicators
+    FOR EACH ROW EXECUTE FUNCTION kri_indicators_parse_threshold()
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_kri_values_kri_id_entry_date ON kri_values(kri_id, entry_date DESC)",
+    # Backfill rows written before the triggers existed
+    "UPDATE kri_values SET kri_value = kri_value WHERE kri_value_numeric IS NULL AND kri_value ~ '[0-9]'",
+    """
+    UPDATE kri_indicators SET threshold_value = threshold_value
+    WHERE threshold_operator IS NULL AND threshold_value IS NOT NULL
+    """
+]
+
+_SCOPED_VALUES = """
+    SELECT
+        i.kri_id, i.kri_ref, i.kri_name, i.kri_category, i.threshold_value,
+        i.threshold_operator, i.threshold_bound, i.threshold_unit,
+        v.kri_value, v.kri_value_numeric, v.kri_value_unit, v.entry_date,
+        row_number() OVER (
+            PARTITION BY v.kri_id ORDER BY v.entry_date DESC, v.value_id DESC
+        ) AS recency
+    FROM kri_values v
+    JOIN kri_indicators i ON i.kri_id = v.kri_id
+    WHERE i.ou = :ou AND i.lre = :lre AND i.country = :country AND i.status = 'Active'
+"""
+
+LATEST_VALUES_QUERY = text(f"""
+    SELECT * FROM ({_SCOPED_VALUES}) scoped
+    WHERE recency = 1
+    ORDER BY kri_ref
+""")
+
+RECENT_VALUES_QUERY = text(f"""
+    SELECT * FROM ({_SCOPED_VALUES}) scoped
+    WHERE recency <= :points
+    ORDER BY kri_ref, entry_date
+""")
+
+# Threshold operators describe the acceptable range; outside it is a breach
+WITHIN: Dict[str, Callable[[Any, Any], bool]] = {
+    "<": lambda value, bound: value < bound,
+    "<=": lambda value, bound: value <= bound,
+    ">": lambda value, bound: value > bound,
+    ">=": lambda value, bound: value >= bound,
+    "±": lambda value, bound: abs(value) <= bound
+}
+
+# Direction of movement that takes a value towards its breach
+WORSENING = {"<": 1, "<=": 1, ">": -1, ">=": -1}
+
+# Only complete present-tense "which KRIs are in breach" questions are answered
+# directly; anything else (writes, other periods, filters) goes through the RAG API
+_WORDS = re.compile(r"[a-z0-9']+")
+_BREACH_CUE = re.compile(
+    r"\b(?:in breach|breach|breaches|breaching|exceed|exceeds|exceeding"
+    r"|(?:over|above|beyond|outside) (?:the |their |its )?thresholds?)\b"
+)
+_KRI_WORDS = frozenset({"kri", "kris"})
+_BREACH_WORDS = frozenset("""
+    in breach breaches breaching exceed exceeds exceeding over above beyond outside the their its threshold thresholds
+""".split())
+_SHAPE_WORDS = frozenset("""
+    which what what's whats are is do does any all my our me i we of show list give get tell find
+    currently now right today there that
+""".split())
+
+
+def evaluate(
+    operators: Sequence[Optional[str]],
+    bounds: Sequence[Any],
+    values: Sequence[Any],
+    value_units: Sequence[Optional[str]],
+    threshold_units: Sequence[Optional[str]]
+) -> List[Optional[bool]]:
+    """
+    Breach flag per position: True/False, or None when it cannot be judged
+
+    A missing operator, bound or value, or a value whose unit differs from the
+    threshold's (when both have one), cannot be judged.
+    """
+    return [
+        None
+        if operator not in WITHIN or bound is None or value is None
+        or (value_unit and threshold_unit and value_unit != threshold_unit)
+        else not WITHIN[operator](value, bound)
+        for operator, bound, value, value_unit, threshold_unit
+        in zip(operators, bounds, values, value_units, threshold_units)
+    ]
+
+
+def _columns(rows: Sequence[Any], names: Sequence[str]) -> Dict[str, list]:
+    return {name: [getattr(row, name) for row in rows] for name in names}
+
+
+def _margin(operator: str, bound, value):
+    """How far beyond the threshold the value is"""
+    if operator == "±":
+        return abs(value) - bound
+    return value - bound
+
+
+def _number(value) -> Optional[float]:
+    return float(value) if value is not None else None
+
+
+class KRIBreachEngine:
+    def __init__(self, registry: DatabaseRegistry):
+        self.registry = registry
+
+    async def install(self):
+        """Add the typed columns and triggers to every MyKRI database, and backfill existing rows"""
+        await asyncio.gather(*(self._install(target) for target in self.registry.targets("MyKRI")))
+
+    async def _install(self, target: DatabaseTarget):
+        try:
+            if await ensure_statements(target.engine, "kri_numeric", KRI_NUMERIC_DDL):
+                logger.info(f"KRI numeric columns and threshold triggers installed on {target.resource}")
+        except Exception as e:
+            logger.warning(f"KRI breach engine not installed on {target.resource}: {e}")
+
+    @staticmethod
+    def is_breach_question(query: str) -> bool:
+        words = _WORDS.findall(query.lower())
+        if not _KRI_WORDS.intersection(words) or not _BREACH_CUE.search(" ".join(words)):
+            return False
+        return not set(words) - _KRI_WORDS - _BREACH_WORDS - _SHAPE_WORDS
+
+    async def _fetch(self, query, user_context: dict, params: dict) -> list:
+        # Read-only and unaudited, so replicas can serve it
+        async with self.registry.read_engine("MyKRI", user_context).connect() as conn:
+            result = await conn.execute(query, params)
+            return result.fetchall()
+
+    @staticmethod
+    def _scope(user_context: dict) -> dict:
+        return {
+            "ou": user_context["ou"],
+            "lre": user_context["lre"],
+            "country": user_context["country"]
+        }
+
+    async def breaches(self, user_context: dict) -> dict:
+        """Latest value of every active KRI in the user's scope, judged against its threshold"""
+        rows = await self._fetch(LATEST_VALUES_QUERY, user_context, self._scope(user_context))
+        columns = _columns(rows, (
+            "threshold_operator", "threshold_bound", "kri_value_numeric",
+            "kri_value_unit", "threshold_unit"
+        ))
+        flags = evaluate(
+            columns["threshold_operator"],
+            columns["threshold_bound"],
+            columns["kri_value_numeric"],
+            columns["kri_value_unit"],
+            columns["threshold_unit"]
+        )
+
+        breaches = [
+            {
+                "kri_id": row.kri_id,
+                "kri_ref": row.kri_ref,
+                "kri_name": row.kri_name,
+                "kri_category": row.kri_category,
+                "kri_value": row.kri_value,
+                "threshold_value": row.threshold_value,
+                "margin": _number(_margin(row.threshold_operator, row.threshold_bound, row.kri_value_numeric)),
+                "entry_date": row.entry_date.isoformat() if row.entry_date else None
+            }
+            for row, breached in zip(rows, flags) if breached
+        ]
+        unknown = [row.kri_ref for row, breached in zip(rows, flags) if breached is None]
+
+        return {
+            "evaluated": len(rows),
+            "breached": len(breaches),
+            "breaches": breaches,
+            "not_evaluable": unknown,
+            "as_of": datetime.utcnow().isoformat() + "Z"
+        }
+
+    async def trends(self, user_context: dict, points: int) -> List[dict]:
+        """Last ``points`` values per KRI with breach flags and the direction of travel"""
+        points = max(2, min(points, settings.KRI_TREND_MAX_POINTS))
+        rows = await self._fetch(RECENT_VALUES_QUERY, user_context, {**self._scope(user_context), "points": points})
+        columns = _columns(rows, (
+            "threshold_operator", "threshold_bound", "kri_value_numeric",
+            "kri_value_unit", "threshold_unit"
+        ))
+        flags = evaluate(
+            columns["threshold_operator"],
+            columns["threshold_bound"],
+            columns["kri_value_numeric"],
+            columns["kri_value_unit"],
+            columns["threshold_unit"]
+        )
+
+        series: Dict[int, dict] = {}
+        for row, breached in zip(rows, flags):
+            trend = series.get(row.kri_id)
+            if trend is None:
+                trend = series[row.kri_id] = {
+                    "kri_id": row.kri_id,
+                    "kri_ref": row.kri_ref,
+                    "kri_name": row.kri_name,
+                    "threshold_value": row.threshold_value,
+                    "operator": row.threshold_operator,
+                    "points": []
+                }
+            trend["points"].append({
+                "entry_date": row.entry_date.isoformat() if row.entry_date else None,
+                "kri_value": row.kri_value,
+                "numeric": _number(row.kri_value_numeric),
+                "breached": breached
+            })
+
+        for trend in series.values():
+            operator = trend.pop("operator")
+            numbers = [point["numeric"] for point in trend["points"] if point["numeric"] is not None]
+            change = numbers[-1] - numbers[0] if len(numbers) >= 2 else 0.0
+            if operator == "±" and len(numbers) >= 2:
+                worsening = abs(numbers[-1]) > abs(numbers[0])
+            else:
+                worsening = change * WORSENING.get(operator, 0) > 0
+            trend["direction"] = "up" if change > 0 else "down" if change < 0 else "flat"
+            trend["worsening"] = worsening
+            trend["currently_breached"] = trend["points"][-1]["breached"]
+
+        return list(series.values())
+
+    @staticmethod
+    def summarize(report: dict) -> str:
+        """Plain-language answer for breach questions asked in chat"""
+        if not report["evaluated"]:
+            return "There are no KRI values in your scope yet."
+        if not report["breached"]:
+            return f"None of your {report['evaluated']} KRIs are in breach of their thresholds."
+        listed = ", ".join(
+            f"{breach['kri_ref']} {breach['kri_name']} ({breach['kri_value']} vs {breach['threshold_value']})"
+            for breach in report["breaches"]
+        )
+        return (
+            f"{report['breached']} of your {report['evaluated']} KRIs are in breach "
+            f"of their thresholds: {listed}."
+        )
@@ -0,0 +1,267 @@
+"""
+Bulk ingestion of KRI values into MyKRI.
+
+An uploaded CSV or NDJSON file is read in batches of KRI_INGEST_BATCH_ROWS.
+Each batch is validated against ``kri_indicators`` (the indicator must exist,
+be Active and belong to the uploader's ou/lre/country) with one lookup for
+the batch's unseen indicators, and the valid rows are loaded with Postgres
+COPY. The whole upload is one transaction with a single summarized audit
+record.
+"""
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Dict, IO, Iterator, List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import settings
+from services.audit_service import AuditService
+from services.metrics import metrics
+import asyncio
+import csv
+import io
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+KRI_VALUE_COLUMNS = ["kri_id", "entered_by", "kri_value", "entry_date", "comments"]
+
+INDICATOR_LOOKUP = text("""
+    SELECT kri_id, kri_ref, ou, lre, country, status
+    FROM kri_indicators
+    WHERE kri_ref = ANY(:refs) OR kri_id = ANY(:ids)
+""")
+
+ingested_rows = metrics.counter("kri_ingest_rows_total", "KRI value rows in bulk uploads, by outcome")
+
+
+class IngestionError(Exception):
+    """The upload as a whole cannot be processed"""
+
+
+def _csv_rows(stream: IO[bytes]) -> Iterator[dict]:
+    return csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+
+
+def _ndjson_rows(stream: IO[bytes]) -> Iterator[dict]:
+    for line_number, line in enumerate(io.TextIOWrapper(stream, encoding="utf-8-sig"), start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise IngestionError(f"Line {line_number} is not valid JSON: {e}")
+        if not isinstance(record, dict):
+            raise IngestionError(f"Line {line_number} is not a JSON object")
+        yield record
+
+
+READERS = {"csv": _csv_rows, "ndjson": _ndjson_rows}
+
+
+def detect_format(filename: Optional[str], requested: Optional[str]) -> str:
+    if requested:
+        upload_format = requested.lower()
+    elif filename and filename.lower().endswith((".ndjson", ".jsonl")):
+        upload_format = "ndjson"
+    else:
+        upload_format = "csv"
+    if upload_format not in READERS:
+        raise IngestionError(f"Unsupported upload format: {requested}")
+    return upload_format
+
+
+def _parse_entry_date(value) -> datetime:
+    if value in (None, ""):
+        return datetime.utcnow()
+    parsed = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    # kri_values.entry_date is TIMESTAMP WITHOUT TIME ZONE, stored as UTC
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+class KRIIngestion:
+    """One upload: validates and COPYs batches on a single MyKRI session"""
+
+    def __init__(self, session: AsyncSession, user_context: dict):
+        self.session = session
+        self.user_context = user_context
+        self.scope = (user_context["ou"], user_context["lre"], user_context["country"])
+        # kri_ref / kri_id -> (kri_id, allowed, reason)
+        self._indicators: Dict[object, Tuple[int, bool, str]] = {}
+        self.received = 0
+        self.loaded = 0
+        self.rejected = 0
+        self.errors: List[dict] = []
+
+    async def run(self, stream: IO[bytes], upload_format: str):
+        rows = READERS[upload_format](stream)
+        connection = await self.session.connection()
+        raw_connection = (await connection.get_raw_connection()).driver_connection
+
+        while True:
+            # Parsing touches the (possibly disk-backed) upload; keep it off the loop
+            batch = await asyncio.to_thread(lambda: list(islice(rows, settings.KRI_INGEST_BATCH_ROWS)))
+            if not batch:
+                break
+
+            records = await self._validate(batch)
+            if records:
+                await raw_connection.copy_records_to_table(
+                    "kri_values", records=records, columns=KRI_VALUE_COLUMNS
+                )
+            self.loaded += len(records)
+
+    async def _validate(self, batch: List[dict]) -> List[tuple]:
+        await self._load_indicators(batch)
+
+        records = []
+        for record in batch:
+            self.received += 1
+            try:
+                records.append(self._to_record(record))
+            except ValueError as e:
+                self._reject(self.received, str(e))
+        return records
+
+    async def _load_indicators(self, batch: List[dict]):
+        refs, ids = set(), set()
+        for record in batch:
+            ref = str(record.get("kri_ref") or "").strip()
+            if ref and ref not in self._indicators:
+                refs.add(ref)
+            elif not ref and str(record.get("kri_id") or "").strip().isdigit():
+                kri_id = int(record["kri_id"])
+                if kri_id not in self._indicators:
+                    ids.add(kri_id)
+        if not refs and not ids:
+            return
+
+        result = await self.session.execute(INDICATOR_LOOKUP, {"refs": list(refs), "ids": list(ids)})
+        for row in result:
+            if (row.ou, row.lre, row.country) != self.scope:
+                entry = (row.kri_id, False, f"KRI {row.kri_ref} is outside your ou/lre/country")
+            elif row.status != "Active":
+                entry = (row.kri_id, False, f"KRI {row.kri_ref} is {row.status}")
+            else:
+                entry = (row.kri_id, True, "")
+            self._indicators[row.kri_ref] = entry
+            self._indicators[row.kri_id] = entry
+
+    def _to_record(self, record: dict) -> tuple:
+        ref = str(record.get("kri_ref") or "").strip()
+        key = ref or (int(record["kri_id"]) if str(record.get("kri_id") or "").strip().isdigit() else None)
+        if key is None:
+            raise ValueError("kri_ref or kri_id is required")
+        if key not in self._indicators:
+            raise ValueError(f"Unknown KRI {key}")
+        kri_id, allowed, reason = self._indicators[key]
+        if not allowed:
+            raise ValueError(reason)
+
+        value = str(record.get("kri_value") or "").strip()
+        if not value:
+            raise ValueError("kri_value is required")
+        if len(value) > 255:
+            raise ValueError("kri_value is longer than 255 characters")
+
+        try:
+            entry_date = _parse_entry_date(record.get("entry_date"))
+        except ValueError:
+            raise ValueError(f"Invalid entry_date {record.get('entry_date')!r}")
+
+        comments = record.get("comments")
+        return (
+            kri_id,
+            self.user_context["user_id"],
+            value,
+            entry_date,
+            str(comments) if comments not in (None, "") else None
+        )
+
+    def _reject(self, row_number: int, error: str):
+        self.rejected += 1
+        if len(self.errors) < settings.KRI_INGEST_MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row_number, "error": error})
+
+
+async def ingest_kri_values(
+    session: AsyncSession,
+    stream: IO[bytes],
+    upload_format: str,
+    filename: Optional[str],
+    user_context: dict,
+    strict: bool = False
+) -> dict:
+    """
+    Validate and load an upload, committing it with one audit record
+
+    With ``strict`` any rejected row rolls back the whole upload.
+    """
+    ingestion = KRIIngestion(session, user_context)
+    started = time.monotonic()
+    error = None
+
+    try:
+        await ingestion.run(stream, upload_format)
+        if strict and ingestion.rejected:
+            error = f"{ingestion.rejected} row(s) rejected in strict mode"
+    except (IngestionError, UnicodeDecodeError, csv.Error) as e:
+        error = str(e)
+    except Exception as e:
+        logger.error(f"KRI bulk ingestion failed: {e}")
+        error = f"Load failed: {e}"
+
+    if error is not None:
+        await session.rollback()
+
+    elapsed = time.monotonic() - started
+
+    def summarize(loaded: int) -> dict:
+        return {
+            "rows_received": ingestion.received,
+            "rows_loaded": loaded,
+            "rows_rejected": ingestion.rejected,
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(loaded / elapsed, 1) if elapsed > 0 else None,
+            "errors": ingestion.errors
+        }
+
+    async def audit(summary: dict, raise_errors: bool):
+        await AuditService.log_operation(
+            session=session,
+            user_id=user_context["user_id"],
+            username=user_context["username"],
+            application="MyKRI",
+            operation="BULK_INSERT",
+            table_name="kri_values",
+            query_executed=f"COPY kri_values ({', '.join(KRI_VALUE_COLUMNS)}) FROM upload {filename or ''}".strip(),
+            changes={key: value for key, value in summary.items() if key != "errors"},
+            success=error is None,
+            error_message=error,
+            raise_errors=raise_errors
+        )
+
+    loaded = 0
+    if error is None:
+        summary = summarize(ingestion.loaded)
+        try:
+            # Commits the loaded rows together with the audit record
+            await audit(summary, raise_errors=True)
+            loaded = ingestion.loaded
+        except Exception as e:
+            # Rolled back with the audit record: nothing was loaded
+            error = f"Commit failed: {e}"
+    if error is not None:
+        summary = summarize(0)
+        await audit(summary, raise_errors=False)
+
+    ingested_rows.inc(loaded, outcome="loaded")
+    ingested_rows.inc(ingestion.rejected, outcome="rejected")
+    logger.info(
+        f"KRI bulk ingestion by {user_context['username']}: {loaded} loaded, "
+        f"{ingestion.rejected} rejected in {elapsed:.2f}s"
+    )
+    return {**summary, "success": error is None, "error": error}
@@ -0,0 +1,120 @@
+"""
+Non-blocking, structured logging for the request hot path.
+
+Request handlers only put the unformatted ``LogRecord`` on a bounded
+in-memory queue; a background thread formats it (as JSON by default) and
+writes it to stdout. Formatting is deferred until then, so hot-path calls
+should pass arguments ``%``-style instead of building f-strings.
+
+Chatty categories (``extra={"category": ...}``) are sampled per
+LOG_SAMPLE_RATES, long messages are truncated to LOG_MAX_MESSAGE_CHARS, and
+when the queue is full records are dropped and counted rather than blocking
+the event loop. Warnings and errors are never sampled.
+"""
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+from config import settings
+from services.metrics import metrics
+import json
+import logging
+import queue
+import random
+import sys
+
+dropped_records = metrics.counter("log_records_dropped_total", "Log records dropped, by reason")
+
+_TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+
+def truncate(message: str, limit: int) -> str:
+    if limit and len(message) > limit:
+        return f"{message[:limit]}... [{len(message) - limit} more chars]"
+    return message
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a LOG_SAMPLE_RATES fraction of INFO/DEBUG records in each category"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(getattr(record, "category", None), 1.0)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        dropped_records.inc(reason="sampled")
+        return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The record never leaves the process, so formatting can wait for the listener
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped_records.inc(reason="queue_full")
+
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, max_message_chars: int):
+        super().__init__()
+        self.max_message_chars = max_message_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": truncate(record.getMessage(), self.max_message_chars)
+        }
+        category = getattr(record, "category", None)
+        if category:
+            entry["category"] = category
+        if record.exc_info:
+            entry["exception"] = truncate(self.formatException(record.exc_info), self.max_message_chars)
+        return json.dumps(entry, default=str)
+
+
+class TruncatingFormatter(logging.Formatter):
+    def __init__(self, max_message_chars: int):
+        super().__init__(_TEXT_FORMAT)
+        self.max_message_chars = max_message_chars
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        record.message = truncate(record.message, self.max_message_chars)
+        return super().formatMessage(record)
+
+
+def configure_logging(stream=None) -> Optional[QueueListener]:
+    """Route the root logger through the queue; returns the listener to stop at shutdown"""
+    handler = logging.StreamHandler(stream or sys.stdout)
+    if settings.LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter(settings.LOG_MAX_MESSAGE_CHARS))
+    else:
+        handler.setFormatter(TruncatingFormatter(settings.LOG_MAX_MESSAGE_CHARS))
+
+    root = logging.getLogger()
+    root.setLevel(settings.LOG_LEVEL)
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+
+    if not settings.LOG_ASYNC:
+        handler.addFilter(SamplingFilter(settings.LOG_SAMPLE_RATES))
+        root.addHandler(handler)
+        return None
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=settings.LOG_QUEUE_SIZE)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(settings.LOG_SAMPLE_RATES))
+    root.addHandler(queue_handler)
+
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,266 @@
+"""
+Opt-in statistical profiles of individual requests.
+
+A request is profiled when it carries ``X-Profile-Token: <PROFILING_TOKEN>``
+or is picked by PROFILING_SAMPLE_RATE (for paths under PROFILING_PATHS). A
+task factory tags every task the request spawns (gathered branches,
+streaming bodies), and while any profile is active a sampler thread
+records, every PROFILING_INTERVAL_MS, one stack per tagged task:
+
+* the real Python stack when the task is the one running on the loop, so
+  CPU time in parsing, SQL compilation etc. shows up;
+* its chain of awaits otherwise (e.g. RAGClient.query -> httpx -> ... or
+  an SQLAlchemy execute waiting on asyncpg), ending in ``(waiting)``.
+
+The result is a wall-clock profile of the request. The last
+PROFILING_BUFFER_SIZE profiles are kept in memory and rendered as folded
+stacks, which flamegraph.pl, speedscope and inferno read directly.
+"""
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Deque, Dict, List, Optional
+from config import settings
+from services.metrics import metrics
+import asyncio
+import hmac
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+import weakref
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile-token"
+ADMIN_PATHS = "/api/admin/"
+
+profiles_captured = metrics.counter("request_profiles_total", "Requests profiled, by trigger")
+
+_active_profile: ContextVar[Optional["RequestProfile"]] = ContextVar("active_profile", default=None)
+
+_labels: Dict[object, str] = {}
+
+
+def _label(frame) -> str:
+    code = frame.f_code
+    label = _labels.get(code)
+    if label is None:
+        module = os.path.splitext(os.path.basename(code.co_filename))[0]
+        # Folded stacks separate frames with ';' and the count with a space
+        label = _labels[code] = f"{module}.{code.co_qualname}".replace(";", ":").replace(" ", "_")
+    return label
+
+
+def _task_stack(task: asyncio.Task, loop_frame) -> Optional[List[str]]:
+    coro = task.get_coro()
+    root = getattr(coro, "cr_frame", None)
+    if root is None:
+        return None
+
+    if coro.cr_running and loop_frame is not None:
+        # On the loop right now: the thread's stack down to the task's coroutine
+        frames = []
+        frame = loop_frame
+        while frame is not None:
+            frames.append(_label(frame))
+            if frame is root:
+                return frames[::-1]
+            frame = frame.f_back
+
+    stack = []
+    awaitable = coro
+    while awaitable is not None:
+        frame = (
+            getattr(awaitable, "cr_frame", None)
+            or getattr(awaitable, "ag_frame", None)
+            or getattr(awaitable, "gi_frame", None)
+        )
+        if frame is None:
+            break
+        stack.append(_label(frame))
+        awaitable = (
+            getattr(awaitable, "cr_await", None)
+            or getattr(awaitable, "ag_await", None)
+            or getattr(awaitable, "gi_yieldfrom", None)
+        )
+    stack.append("(waiting)")
+    return stack
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str, trigger: str):
+        self.profile_id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.started_at = datetime.utcnow()
+        self.duration: Optional[float] = None
+        self.samples: Counter = Counter()
+        self.tasks: "weakref.WeakSet[asyncio.Task]" = weakref.WeakSet()
+        self._start = time.perf_counter()
+
+    def sample(self, loop_frame):
+        try:
+            tasks = list(self.tasks)
+        except RuntimeError:
+            # A task was tagged mid-copy; catch it next tick
+            return
+        for task in tasks:
+            if task.done():
+                continue
+            try:
+                stack = _task_stack(task, loop_frame)
+            except (AttributeError, ValueError):
+                # The task moved on while we were walking it
+                continue
+            if stack:
+                self.samples[";".join(stack)] += 1
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._start
+
+    def summary(self) -> dict:
+        return {
+            "profile_id": self.profile_id,
+            "method": self.method,
+            "path": self.path,
+            "trigger": self.trigger,
+            "started_at": self.started_at.isoformat() + "Z",
+            "duration_ms": round(self.duration * 1000, 1) if self.duration is not None else None,
+            "samples": sum(self.samples.values())
+        }
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class Profiler:
+    def __init__(self):
+        self.interval = settings.PROFILING_INTERVAL_MS / 1000
+        self._profiles: Deque[RequestProfile] = deque(maxlen=settings.PROFILING_BUFFER_SIZE)
+        self._active: List[RequestProfile] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._loop_thread: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def enabled() -> bool:
+        return bool(settings.PROFILING_TOKEN) or settings.PROFILING_SAMPLE_RATE > 0
+
+    def install(self, loop: asyncio.AbstractEventLoop):
+        """Tag tasks spawned by profiled requests and start the (idle) sampler thread"""
+        if not self.enabled() or self._thread is not None:
+            return
+        previous = loop.get_task_factory()
+
+        def task_factory(loop, coro, **kwargs):
+            if previous is not None:
+                task = previous(loop, coro, **kwargs)
+            else:
+                task = asyncio.Task(coro, loop=loop, **kwargs)
+            context = kwargs.get("context")
+            profile = context.get(_active_profile) if context is not None else _active_profile.get()
+            if profile is not None:
+                profile.tasks.add(task)
+            return task
+
+        loop.set_task_factory(task_factory)
+        self._loop_thread = threading.get_ident()
+        self._thread = threading.Thread(target=self._sample_loop, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def trigger(self, path: str, token: Optional[bytes]) -> Optional[str]:
+        """Why this request should be profiled, or None"""
+        if self._thread is None or path.startswith(ADMIN_PATHS):
+            return None
+        if token is not None and settings.PROFILING_TOKEN and hmac.compare_digest(
+            token, settings.PROFILING_TOKEN.encode()
+        ):
+            return "header"
+        if (
+            settings.PROFILING_SAMPLE_RATE > 0
+            and path.startswith(tuple(settings.PROFILING_PATHS))
+            and random.random() < settings.PROFILING_SAMPLE_RATE
+        ):
+            return "sampled"
+        return None
+
+    def begin(self, method: str, path: str, trigger: str) -> RequestProfile:
+        profile = RequestProfile(method, path, trigger)
+        profile.tasks.add(asyncio.current_task())
+        with self._lock:
+            self._active.append(profile)
+            self._wake.set()
+        profiles_captured.inc(trigger=trigger)
+        return profile
+
+    def end(self, profile: RequestProfile):
+        profile.finish()
+        with self._lock:
+            self._active.remove(profile)
+            self._profiles.append(profile)
+
+    def _sample_loop(self):
+        while True:
+            self._wake.wait()
+            # Held while sampling, so a profile is never read while it is still being written
+            with self._lock:
+                if not self._active:
+                    self._wake.clear()
+                    continue
+                loop_frame = sys._current_frames().get(self._loop_thread)
+                for profile in self._active:
+                    profile.sample(loop_frame)
+                del loop_frame
+            time.sleep(self.interval)
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        with self._lock:
+            return next((profile for profile in self._profiles if profile.profile_id == profile_id), None)
+
+    def list(self) -> List[dict]:
+        with self._lock:
+            profiles = list(self._profiles)
+        return [profile.summary() for profile in reversed(profiles)]
+
+
+class ProfilingMiddleware:
+    """ASGI middleware (not BaseHTTPMiddleware), so the endpoint runs in the profiled task"""
+
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        token = next((value for name, value in scope["headers"] if name == PROFILE_HEADER), None)
+        trigger = self.profiler.trigger(scope["path"], token)
+        if trigger is None:
+            return await self.app(scope, receive, send)
+
+        profile = self.profiler.begin(scope["method"], scope["path"], trigger)
+        reset = _active_profile.set(profile)
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", profile.profile_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            _active_profile.reset(reset)
+            self.profiler.end(profile)
+            logger.info(
+                "Profiled %s %s (%s): %s samples",
+                profile.method, profile.path, profile.profile_id, sum(profile.samples.values())
+            )
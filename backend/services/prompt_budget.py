@@ -0,0 +1,189 @@
+"""
+Size budgets for the prompts sent to the RAG API.
+
+Each stage (classification, SQL generation, response, plain retrieval) has
+a token budget in PROMPT_BUDGET_TOKENS covering both the prompt we send and
+the ``top_k`` chunks the RAG API retrieves and adds to it upstream. A
+``PromptBuilder`` renders the stage template from named sections; if the
+prompt does not leave room for PROMPT_MIN_TOP_K chunks, sections are cut
+lowest priority first (query results are summarized row-wise, other text is
+truncated), and ``top_k`` is then lowered to what still fits.
+
+Tokens are estimated as UTF-8 bytes / PROMPT_BYTES_PER_TOKEN, which is close
+enough for budgeting and needs no tokenizer; chunk sizes are learned from
+the results the RAG API returns, per document type.
+"""
+from typing import Any, Callable, Dict, List, Optional
+from config import settings
+from services.metrics import metrics
+import json
+
+TOKEN_BUCKETS = (128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+prompt_tokens = metrics.histogram(
+    "rag_prompt_tokens", "Estimated tokens of prompts sent to the RAG API, by stage", TOKEN_BUCKETS
+)
+prompt_top_k = metrics.histogram(
+    "rag_prompt_top_k", "top_k requested from the RAG API, by stage", (1, 2, 3, 4, 5, 6, 8, 10)
+)
+sections_cut = metrics.counter(
+    "rag_prompt_sections_cut_total", "Prompt sections truncated or summarized to fit the budget, by stage and section"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text.encode()) // settings.PROMPT_BYTES_PER_TOKEN)
+
+
+def truncate_text(text: str, max_bytes: int) -> str:
+    data = text.encode()
+    if len(data) <= max_bytes:
+        return text
+    marker = f" ...[{len(data) - max_bytes} bytes cut]"
+    keep = max(0, max_bytes - len(marker))
+    # Never split a multi-byte character
+    return data[:keep].decode(errors="ignore") + marker
+
+
+def summarize_rows(rows: Any, max_bytes: int) -> str:
+    """As many whole rows (one JSON object per line) as fit, then how many were left out"""
+    if not isinstance(rows, list):
+        return truncate_text(str(rows), max_bytes)
+
+    lines: List[str] = []
+    used = 0
+    for index, row in enumerate(rows):
+        line = json.dumps(row, default=str)
+        rest = f"... and {len(rows) - index} more rows not shown"
+        if used + len(line.encode()) + 1 + len(rest) > max_bytes:
+            lines.append(rest)
+            break
+        lines.append(line)
+        used += len(line.encode()) + 1
+    return "\n".join(lines)
+
+
+def _chunk_text(item: Any) -> str:
+    if isinstance(item, dict):
+        for key in ("content", "text", "chunk"):
+            if isinstance(item.get(key), str):
+                return item[key]
+        return json.dumps(item, default=str)
+    return str(item)
+
+
+class PromptBudget:
+    """Learned chunk sizes and the resulting top_k, shared by every prompt"""
+
+    def __init__(self):
+        # Moving average of retrieved chunk tokens, by document type ("" for unfiltered)
+        self._chunk_tokens: Dict[str, float] = {}
+
+    def chunk_tokens(self, document_type: str = "") -> float:
+        return self._chunk_tokens.get(document_type, settings.PROMPT_CHUNK_TOKENS)
+
+    def observe(self, document_type: Optional[str], results: List[Any]):
+        """Record the size of the chunks one RAG query returned"""
+        if not results:
+            return
+        size = sum(estimate_tokens(_chunk_text(item)) for item in results) / len(results)
+        key = document_type or ""
+        current = self._chunk_tokens.get(key)
+        self._chunk_tokens[key] = size if current is None else current + 0.2 * (size - current)
+
+    def budget(self, stage: str) -> int:
+        return settings.PROMPT_BUDGET_TOKENS.get(stage, settings.PROMPT_DEFAULT_BUDGET_TOKENS)
+
+    def top_k(self, stage: str, tokens: int, default_top_k: int, document_type: str = "") -> int:
+        """As many chunks as fit next to a prompt of ``tokens``, at most ``default_top_k``"""
+        remaining = self.budget(stage) - tokens
+        fit = int(remaining // max(1.0, self.chunk_tokens(document_type)))
+        return min(default_top_k, max(settings.PROMPT_MIN_TOP_K, fit))
+
+    def retrieval(self, query: str, default_top_k: int) -> "Prompt":
+        """Budget for passing the user's question straight to the RAG API"""
+        return PromptBuilder("retrieval", "{query}", default_top_k).section(
+            "query", query, priority=1, floor=settings.PROMPT_MIN_QUESTION_BYTES
+        ).build()
+
+
+prompt_budget = PromptBudget()
+
+
+class Prompt:
+    def __init__(self, text: str, tokens: int, top_k: int, cut: List[str]):
+        self.text = text
+        self.tokens = tokens
+        self.top_k = top_k
+        self.cut = cut
+
+
+class _Section:
+    def __init__(self, text: str, priority: int, floor: int, compact: Optional[Callable[[int], str]]):
+        self.text = text
+        self.priority = priority
+        self.floor = floor
+        self.compact = compact
+
+
+class PromptBuilder:
+    """
+    Fill ``template`` (``str.format`` placeholders) from named sections
+
+    Sections with the lowest ``priority`` are cut first, never below
+    ``floor`` bytes; ``compact(max_bytes)`` replaces plain truncation for
+    sections that can be summarized.
+    """
+
+    def __init__(self, stage: str, template: str, default_top_k: int, document_type: str = ""):
+        self.stage = stage
+        self.template = template
+        self.default_top_k = default_top_k
+        self.document_type = document_type
+        self._sections: Dict[str, _Section] = {}
+
+    def section(
+        self,
+        name: str,
+        text: str,
+        priority: int = 0,
+        floor: int = 0,
+        compact: Optional[Callable[[int], str]] = None
+    ) -> "PromptBuilder":
+        self._sections[name] = _Section(text, priority, floor, compact)
+        return self
+
+    def fixed(self, name: str, text: str) -> "PromptBuilder":
+        """A section that is never cut (identifiers, user scope)"""
+        return self.section(name, text, floor=len(text.encode()))
+
+    def _render(self, values: Dict[str, str]) -> str:
+        return self.template.format(**values)
+
+    def build(self) -> Prompt:
+        # Leave room for at least PROMPT_MIN_TOP_K retrieved chunks
+        reserved = settings.PROMPT_MIN_TOP_K * prompt_budget.chunk_tokens(self.document_type)
+        limit = int((prompt_budget.budget(self.stage) - reserved) * settings.PROMPT_BYTES_PER_TOKEN)
+
+        values = {name: section.text for name, section in self._sections.items()}
+        size = len(self._render(values).encode())
+        cut = []
+        for name, section in sorted(self._sections.items(), key=lambda item: item[1].priority):
+            overflow = size - limit
+            if overflow <= 0:
+                break
+            current = len(values[name].encode())
+            target = max(section.floor, current - overflow)
+            if target >= current:
+                continue
+            values[name] = section.compact(target) if section.compact else truncate_text(values[name], target)
+            size = len(self._render(values).encode())
+            cut.append(name)
+            sections_cut.inc(stage=self.stage, section=name)
+
+        text = self._render(values)
+        tokens = estimate_tokens(text)
+        top_k = prompt_budget.top_k(self.stage, tokens, self.default_top_k, self.document_type)
+        prompt_tokens.observe(tokens, stage=self.stage)
+        prompt_top_k.observe(top_k, stage=self.stage)
+        return Prompt(text, tokens, top_k, cut)
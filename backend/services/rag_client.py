@@ -2,12 +2,37 @@ import httpx
 import aiofiles
 from typing import AsyncGenerator, Optional, Dict, Any
 from config import settings
+from services import structured_output
+from services.cache import TTLCache
+from services.resilience import CircuitOpenError, get_endpoint_guard, is_retryable
+from services.deadline import DeadlineExceeded, clamp_timeout, current_deadline
+from services.admission import AdmissionRejected, admission
+from services.prompt_budget import prompt_budget
+from services.metrics import metrics
 import logging
 import json
-import re
 
 logger = logging.getLogger(__name__)
 
+# Last good answer per query payload, served while the RAG API is unhealthy
+_stale_answers = TTLCache(
+    max_size=settings.RAG_STALE_CACHE_SIZE,
+    ttl_seconds=settings.RAG_STALE_CACHE_MAX_AGE_SECONDS
+)
+
+# Extracted classification JSON and SQL per prompt payload. Prompts embed the
+# user's scope, so an entry is only reused for the same question in the same
+# scope; filled ahead of peak hours by services.cache_warmup.
+CACHED_FORMATS = ("json", "sql")
+_structured_answers = TTLCache(
+    max_size=settings.RAG_ANSWER_CACHE_SIZE,
+    ttl_seconds=settings.RAG_ANSWER_CACHE_TTL_SECONDS
+)
+
+answer_cache_lookups = metrics.counter(
+    "rag_answer_cache_total", "Structured RAG answer cache lookups, by format and outcome"
+)
+
 class RAGClient:
     def __init__(self):
         self.base_url = settings.RAG_API_BASE_URL
@@ -19,6 +44,8 @@ class RAGClient:
             "Authorization": f"Bearer {self.bearer_token}",
             "Content-Type": "application/json"
         }
+        
+        self.query_guard = get_endpoint_guard("rag_query")
     
     async def upload_document(
         self,
@@ -39,7 +66,7 @@ class RAGClient:
                 'metadata': json.dumps(metadata) if metadata else '{}'
             }
             
-            async with httpx.AsyncClient(timeout=300.0) as client:
+            async with httpx.AsyncClient(timeout=clamp_timeout(300.0, "document upload")) as client:
                 response = await client.post(
                     self.upload_endpoint,
                     files=files,
@@ -51,6 +78,8 @@ class RAGClient:
                 result = response.json()
                 
                 logger.info(f"Document uploaded successfully: {document_name}")
+                # Answers were generated from the previous guides
+                self.clear_answer_cache()
                 return {
                     "success": True,
                     "document_name": document_name,
@@ -87,37 +116,41 @@ class RAGClient:
             filters: Metadata filters (e.g., {"document_type": "classification"})
             return_raw: If True, return raw response without processing
         """
-        try:
-            payload = {
-                "query": query,
-                "top_k": top_k,
-                "filters": filters or {}
-            }
-            
-            async with httpx.AsyncClient(timeout=60.0) as client:
+        payload = {
+            "query": query,
+            "top_k": top_k,
+            "filters": filters or {}
+        }
+        cache_key = json.dumps(payload, sort_keys=True)
+        
+        async def send(timeout: float) -> dict:
+            async with httpx.AsyncClient(timeout=timeout) as client:
                 response = await client.post(
                     self.query_endpoint,
                     json=payload,
                     headers=self.headers
                 )
-                
                 response.raise_for_status()
-                result = response.json()
-                
-                logger.info(f"RAG query successful: {query[:50]}...")
-                
-                if return_raw:
-                    return result
-                
-                return {
-                    "success": True,
-                    "results": result.get("results", []),
-                    "context": result.get("context", ""),
-                    "sources": result.get("sources", [])
-                }
+                return response.json()
+        
+        try:
+            async with admission.slot("rag_api"):
+                result = await self.query_guard.call(send, settings.RAG_QUERY_TIMEOUT_SECONDS)
+            _stale_answers.set(cache_key, result)
+            if isinstance(result.get("results"), list):
+                prompt_budget.observe(payload["filters"].get("document_type"), result["results"])
+            
+            logger.info("RAG query successful: %.50s...", query, extra={"category": "rag"})
+            return self._format_query_result(result, return_raw)
                 
+        except CircuitOpenError as e:
+            return self._fallback_result(cache_key, return_raw, f"Query rejected: {str(e)}")
+        except (DeadlineExceeded, AdmissionRejected):
+            raise
         except httpx.HTTPStatusError as e:
             logger.error(f"HTTP error querying RAG: {e}")
+            if is_retryable(e):
+                return self._fallback_result(cache_key, return_raw, f"Query failed: {str(e)}")
             return {
                 "success": False,
                 "error": f"Query failed: {str(e)}",
@@ -126,6 +159,8 @@ class RAGClient:
             }
         except Exception as e:
             logger.error(f"Error querying RAG: {e}")
+            if is_retryable(e):
+                return self._fallback_result(cache_key, return_raw, str(e))
             return {
                 "success": False,
                 "error": str(e),
@@ -133,6 +168,43 @@ class RAGClient:
                 "context": ""
             }
     
+    @staticmethod
+    def clear_answer_cache():
+        _structured_answers.clear()
+    
+    @staticmethod
+    def answer_cache_size() -> int:
+        return len(_structured_answers)
+    
+    def _format_query_result(self, result: dict, return_raw: bool, cached: bool = False) -> dict:
+        if return_raw:
+            return result
+        
+        formatted = {
+            "success": True,
+            "results": result.get("results", []),
+            "context": result.get("context", ""),
+            "sources": result.get("sources", [])
+        }
+        if cached:
+            formatted["cached"] = True
+        return formatted
+    
+    def _fallback_result(self, cache_key: str, return_raw: bool, error: str) -> dict:
+        """Serve the last good answer for this payload, or fail fast"""
+        cached = _stale_answers.get(cache_key)
+        if cached is not None:
+            logger.warning(f"Serving cached RAG answer ({error})")
+            return self._format_query_result(cached, return_raw, cached=True)
+        
+        logger.error(f"RAG query unavailable: {error}")
+        return {
+            "success": False,
+            "error": error,
+            "results": [],
+            "context": ""
+        }
+    
     async def query_rag_with_structure(
         self,
         query: str,
@@ -152,6 +224,17 @@ class RAGClient:
         Returns:
             Extracted structured data
         """
+        cache_key = None
+        if expected_format in CACHED_FORMATS:
+            cache_key = json.dumps(
+                {"query": query, "top_k": top_k, "filters": filters or {}, "format": expected_format},
+                sort_keys=True
+            )
+            cached = _structured_answers.get(cache_key)
+            answer_cache_lookups.inc(format=expected_format, outcome="hit" if cached is not None else "miss")
+            if cached is not None:
+                return dict(cached)
+        
         result = await self.query_rag(query, top_k, filters)
         
         if not result.get("success"):
@@ -162,7 +245,7 @@ class RAGClient:
         if expected_format == "json":
             # Extract JSON from response
             extracted = self._extract_json(context)
-            return {
+            answer = {
                 "success": True,
                 "data": extracted,
                 "context": context,
@@ -172,7 +255,7 @@ class RAGClient:
         elif expected_format == "sql":
             # Extract SQL from response
             extracted = self._extract_sql(context)
-            return {
+            answer = {
                 "success": True,
                 "sql": extracted,
                 "context": context,
@@ -188,41 +271,19 @@ class RAGClient:
                 "context": context,
                 "sources": result.get("sources", [])
             }
+        
+        # Stale fallbacks and failed extractions are not worth keeping
+        if extracted is not None and not result.get("cached"):
+            _structured_answers.set(cache_key, answer)
+        return answer
     
     def _extract_json(self, text: str) -> Optional[dict]:
         """Extract JSON object from text"""
         try:
-            # Method 1: Look for JSON pattern
-            json_pattern = r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}'
-            matches = re.finditer(json_pattern, text, re.DOTALL)
-            
-            for match in matches:
-                try:
-                    json_str = match.group(0)
-                    parsed = json.loads(json_str)
-                    # Validate it's a dict (not just a number or string in braces)
-                    if isinstance(parsed, dict):
-                        return parsed
-                except json.JSONDecodeError:
-                    continue
-            
-            # Method 2: Try to parse entire text
-            try:
-                return json.loads(text)
-            except json.JSONDecodeError:
-                pass
-            
-            # Method 3: Look for JSON in code blocks
-            code_block_pattern = r'```(?:json)?\s*(\{.*?\})\s*```'
-            code_match = re.search(code_block_pattern, text, re.DOTALL)
-            if code_match:
-                try:
-                    return json.loads(code_match.group(1))
-                except json.JSONDecodeError:
-                    pass
-            
-            logger.warning("Could not extract valid JSON from response")
-            return None
+            extracted = structured_output.extract_json(text)
+            if extracted is None:
+                logger.warning("Could not extract valid JSON from response")
+            return extracted
             
         except Exception as e:
             logger.error(f"Error extracting JSON: {e}")
@@ -231,29 +292,10 @@ class RAGClient:
     def _extract_sql(self, text: str) -> Optional[str]:
         """Extract SQL query from text"""
         try:
-            # Method 1: Look for SQL with semicolon
-            sql_pattern = r'(SELECT|INSERT|UPDATE|DELETE|WITH)\s+.*?;'
-            match = re.search(sql_pattern, text, re.IGNORECASE | re.DOTALL)
-            if match:
-                sql = match.group(0).strip()
-                return self._clean_sql(sql)
-            
-            # Method 2: Look for SQL in code blocks
-            code_block_pattern = r'```(?:sql)?\s*((?:SELECT|INSERT|UPDATE|DELETE|WITH).*?)\s*```'
-            match = re.search(code_block_pattern, text, re.IGNORECASE | re.DOTALL)
-            if match:
-                sql = match.group(1).strip()
-                return self._clean_sql(sql)
-            
-            # Method 3: Find SQL without semicolon
-            sql_pattern = r'(SELECT|INSERT|UPDATE|DELETE|WITH)\s+.*?(?=\n\n|$)'
-            match = re.search(sql_pattern, text, re.IGNORECASE | re.DOTALL)
-            if match:
-                sql = match.group(0).strip()
-                return self._clean_sql(sql)
-            
-            logger.warning("Could not extract SQL from response")
-            return None
+            extracted = structured_output.extract_sql(text)
+            if extracted is None:
+                logger.warning("Could not extract SQL from response")
+            return extracted
             
         except Exception as e:
             logger.error(f"Error extracting SQL: {e}")
@@ -261,36 +303,11 @@ class RAGClient:
     
     def _clean_sql(self, sql: str) -> str:
         """Clean and format SQL query"""
-        # Remove extra whitespace
-        sql = ' '.join(sql.split())
-        
-        # Ensure it ends with semicolon
-        if not sql.endswith(';'):
-            sql += ';'
-        
-        return sql
+        return structured_output.clean_sql(sql)
     
     def _clean_text(self, text: str) -> str:
         """Clean text response by removing guide/instruction text"""
-        # Remove common instruction patterns
-        patterns_to_remove = [
-            r'based on the.*?guide[,:]?\s*',
-            r'(?:example|response|format):\s*',
-            r'here(?:\'s| is) (?:the|a|an).*?:\s*',
-            r'```.*?```',  # Remove code blocks
-        ]
-        
-        cleaned = text
-        for pattern in patterns_to_remove:
-            cleaned = re.sub(pattern, '', cleaned, flags=re.IGNORECASE | re.DOTALL)
-        
-        # Remove multiple blank lines
-        cleaned = re.sub(r'\n{3,}', '\n\n', cleaned)
-        
-        # Trim whitespace
-        cleaned = cleaned.strip()
-        
-        return cleaned
+        return structured_output.clean_text(text)
     
     async def query_rag_stream(
         self,
@@ -299,6 +316,12 @@ class RAGClient:
         filters: Optional[dict] = None
     ) -> AsyncGenerator[str, None]:
         """Query RAG system with streaming response"""
+        breaker = self.query_guard.breaker
+        if not breaker.allow_request():
+            yield json.dumps({"error": f"Streaming unavailable, retry in {breaker.retry_after():.0f}s"})
+            return
+        
+        deadline = current_deadline()
         try:
             payload = {
                 "query": query,
@@ -307,7 +330,8 @@ class RAGClient:
                 "stream": True
             }
             
-            async with httpx.AsyncClient(timeout=120.0) as client:
+            async with admission.slot("rag_api"), \
+                    httpx.AsyncClient(timeout=clamp_timeout(120.0, "RAG stream")) as client:
                 async with client.stream(
                     "POST",
                     self.query_endpoint,
@@ -317,22 +341,41 @@ class RAGClient:
                     response.raise_for_status()
                     
                     async for chunk in response.aiter_bytes():
+                        # httpx timeouts are per read; the deadline bounds the whole stream
+                        if deadline is not None:
+                            deadline.check("RAG stream")
                         if chunk:
                             yield chunk.decode('utf-8')
+            
+            breaker.record_success()
                             
+        except (DeadlineExceeded, AdmissionRejected):
+            raise
         except httpx.HTTPStatusError as e:
             logger.error(f"HTTP error streaming RAG: {e}")
+            self._record_stream_error(e)
             yield json.dumps({"error": f"Streaming failed: {str(e)}"})
         except Exception as e:
+            if deadline is not None and deadline.expired:
+                raise DeadlineExceeded("RAG stream", deadline.budget) from e
             logger.error(f"Error streaming RAG: {e}")
+            self._record_stream_error(e)
             yield json.dumps({"error": str(e)})
+        finally:
+            breaker.release_probe()
+    
+    def _record_stream_error(self, error: Exception):
+        if is_retryable(error):
+            self.query_guard.breaker.record_failure()
+        else:
+            self.query_guard.breaker.record_success()
     
     async def list_documents(self) -> dict:
         """List all uploaded documents"""
         try:
             list_endpoint = f"{self.base_url}/documents"
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
+            async with httpx.AsyncClient(timeout=clamp_timeout(30.0, "document listing")) as client:
                 response = await client.get(
                     list_endpoint,
                     headers=self.headers
@@ -0,0 +1,314 @@
+"""
+Resilience primitives for calls to the enterprise RAG API.
+
+Each upstream endpoint gets one shared ``EndpointGuard`` combining:
+- adaptive timeouts derived from observed latency percentiles
+- a retry budget with jittered exponential backoff
+- optional hedged duplicate requests once the p95 latency has elapsed
+- a circuit breaker that fails fast while the endpoint is unhealthy
+"""
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+from config import settings
+from services.deadline import DeadlineExceeded, clamp_timeout, current_deadline
+import asyncio
+import httpx
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the circuit breaker is open"""
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies (seconds)"""
+
+    def __init__(self, window_size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=window_size)
+
+    @property
+    def ready(self) -> bool:
+        return len(self._samples) >= self.min_samples
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class RetryBudget:
+    """
+    Token bucket limiting retries to a fraction of recent traffic
+
+    Every request deposits ``ratio`` tokens (capped at ``max_tokens``) and
+    every retry or hedge spends one, so a degraded upstream sees at most
+    ~``ratio`` extra load instead of a retry storm.
+    """
+
+    def __init__(self, ratio: float = 0.2, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def record_request(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow_request(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+
+        # Half-open: let exactly one probe through
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info("RAG circuit breaker closed")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(
+                    f"RAG circuit breaker opened after {self.consecutive_failures} failures"
+                )
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """Free the half-open slot when a call ends without a verdict (e.g. cancelled)"""
+        self._probe_in_flight = False
+
+    def retry_after(self) -> float:
+        """Seconds until the breaker will allow a probe"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Transport errors, timeouts, 429 and 5xx are worth retrying; other 4xx are not"""
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(error, (httpx.TransportError, asyncio.TimeoutError))
+
+
+class EndpointGuard:
+    """
+    Adaptive timeout, retry budget, hedging and circuit breaking for one endpoint
+
+    Attempt timeouts and retry delays are also bounded by the current request
+    deadline, if one is set.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latency = LatencyTracker()
+        self.retry_budget = RetryBudget(ratio=settings.RAG_RETRY_BUDGET_RATIO)
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.RAG_CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=settings.RAG_CIRCUIT_RESET_SECONDS
+        )
+        self.max_attempts = settings.RAG_RETRY_MAX_ATTEMPTS
+        self.hedge_enabled = settings.RAG_HEDGE_ENABLED
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+        self.rejected = 0
+
+    def timeout(self, default: float) -> float:
+        """Timeout for the next attempt, clamped to [RAG_MIN_TIMEOUT_SECONDS, default]"""
+        if not self.latency.ready:
+            return default
+        observed = self.latency.percentile(settings.RAG_TIMEOUT_PERCENTILE)
+        adaptive = observed * settings.RAG_TIMEOUT_MULTIPLIER
+        return max(settings.RAG_MIN_TIMEOUT_SECONDS, min(default, adaptive))
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: uniform in [0, min(cap, base * 2^attempt)]
+        ceiling = min(
+            settings.RAG_RETRY_MAX_DELAY_SECONDS,
+            settings.RAG_RETRY_BASE_DELAY_SECONDS * (2 ** attempt)
+        )
+        return random.uniform(0, ceiling)
+
+    async def _timed(self, send: Callable[[float], Awaitable[T]], timeout: float) -> T:
+        started = time.monotonic()
+        result = await send(timeout)
+        self.latency.record(time.monotonic() - started)
+        return result
+
+    async def _attempt(self, send: Callable[[float], Awaitable[T]], timeout: float) -> T:
+        hedge_delay = self.latency.percentile(settings.RAG_HEDGE_PERCENTILE)
+        if not self.hedge_enabled or not self.latency.ready or hedge_delay >= timeout:
+            return await self._timed(send, timeout)
+
+        primary = asyncio.ensure_future(self._timed(send, timeout))
+        pending = {primary}
+        error: Optional[BaseException] = None
+        # Everything below, the first wait included, cancels what is still in
+        # flight on the way out, so a cancelled caller never leaves a request running
+        try:
+            done, _ = await asyncio.wait(pending, timeout=hedge_delay)
+            if done or not self.retry_budget.try_spend():
+                return await primary
+
+            self.hedges += 1
+            pending.add(asyncio.ensure_future(self._timed(send, timeout - hedge_delay)))
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled():
+                        continue
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error if error is not None else asyncio.CancelledError()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call(self, send: Callable[[float], Awaitable[T]], default_timeout: float) -> T:
+        """
+        Run ``send(timeout)`` under the guard
+
+        Raises CircuitOpenError without calling upstream while the breaker is
+        open; otherwise raises the last error once retries are exhausted.
+        """
+        if not self.breaker.allow_request():
+            self.rejected += 1
+            raise CircuitOpenError(
+                f"{self.name} unavailable, retry in {self.breaker.retry_after():.0f}s"
+            )
+
+        self.calls += 1
+        self.retry_budget.record_request()
+        try:
+            return await self._call_with_retries(send, default_timeout)
+        except asyncio.CancelledError:
+            self.breaker.release_probe()
+            raise
+
+    async def _call_with_retries(self, send: Callable[[float], Awaitable[T]], default_timeout: float) -> T:
+        attempt = 0
+        while True:
+            try:
+                timeout = clamp_timeout(self.timeout(default_timeout), self.name)
+                result = await self._attempt(send, timeout)
+                self.breaker.record_success()
+                return result
+            except DeadlineExceeded:
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                deadline = current_deadline()
+                if deadline is not None and deadline.expired:
+                    # Our own budget ran out; that says nothing about upstream health
+                    self.breaker.release_probe()
+                    raise DeadlineExceeded(self.name, deadline.budget) from e
+
+                if not is_retryable(e):
+                    # The upstream answered; a 4xx says nothing about its health
+                    self.breaker.record_success()
+                    raise
+
+                attempt += 1
+                if (
+                    attempt >= self.max_attempts
+                    or self.breaker.state != CircuitBreaker.CLOSED
+                    or not self.retry_budget.try_spend()
+                ):
+                    self.breaker.record_failure()
+                    raise
+
+                delay = self._backoff(attempt)
+                if deadline is not None and deadline.remaining() <= delay:
+                    self.breaker.record_failure()
+                    raise
+
+                self.retries += 1
+                logger.warning(f"{self.name} attempt {attempt} failed ({e!r}), retrying in {delay:.2f}s")
+
+            await asyncio.sleep(delay)
+
+    def snapshot(self) -> dict:
+        return {
+            "circuit_state": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "retry_after_seconds": round(self.breaker.retry_after(), 1),
+            "p50_ms": _ms(self.latency.percentile(50)),
+            "p95_ms": _ms(self.latency.percentile(95)),
+            "p99_ms": _ms(self.latency.percentile(99)),
+            "retry_tokens": round(self.retry_budget.tokens, 2),
+            "calls": self.calls,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "rejected": self.rejected
+        }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+# Guards are shared by every RAGClient instance so that the agent's client and
+# the endpoint-level client see the same upstream health.
+_guards: Dict[str, EndpointGuard] = {}
+
+
+def get_endpoint_guard(name: str) -> EndpointGuard:
+    guard = _guards.get(name)
+    if guard is None:
+        guard = _guards[name] = EndpointGuard(name)
+    return guard
+
+
+def guard_snapshots() -> Dict[str, dict]:
+    return {name: guard.snapshot() for name, guard in _guards.items()}
@@ -0,0 +1,168 @@
+"""
+Compact storage for query results that are read back page by page.
+
+Rows are kept as tuples under a single column list instead of one dict per
+row. Results whose encoded size passes RESULT_SPILL_THRESHOLD_BYTES are
+written to a local NDJSON file with a row offset index, so a page read is a
+single seek + read and large results do not stay in process memory.
+
+``ResultStore`` hands out opaque handles to such results so a chat answer
+can carry only its first page and the rest is fetched on demand.
+"""
+from array import array
+from datetime import date, datetime, time as dt_time
+from decimal import Decimal
+from typing import Any, List, Optional, Sequence, Tuple
+from config import settings
+from services.cache import TTLCache
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+def encode_value(value: Any) -> Any:
+    # Same representations FastAPI's encoder would give the in-memory rows
+    if isinstance(value, (datetime, date, dt_time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+
+class StoredResult:
+    def __init__(self, columns: Sequence[str]):
+        self.columns = list(columns)
+        self.row_count = 0
+        self._rows: Optional[List[Tuple]] = []
+        self._path: Optional[str] = None
+        self._offsets: Optional[array] = None
+
+    @classmethod
+    def from_rows(cls, columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> "StoredResult":
+        """Build from row tuples; blocking, so run it off the event loop"""
+        stored = cls(columns)
+        threshold = settings.RESULT_SPILL_THRESHOLD_BYTES
+        encoded_size = 0
+
+        for index, row in enumerate(rows):
+            values = tuple(row)
+            line = json.dumps(values, default=encode_value, separators=(",", ":")).encode() + b"\n"
+            encoded_size += len(line)
+            if encoded_size > threshold:
+                stored._spill(rows, index)
+                break
+            stored._rows.append(values)
+
+        stored.row_count = len(rows)
+        return stored
+
+    @property
+    def spilled(self) -> bool:
+        return self._path is not None
+
+    def _spill(self, rows: Sequence[Sequence[Any]], spill_from: int):
+        fd, self._path = tempfile.mkstemp(
+            prefix="result-", suffix=".ndjson", dir=settings.RESULT_SPILL_DIR or None
+        )
+        self._offsets = array("q")
+        position = 0
+        with os.fdopen(fd, "wb") as spill:
+            # Re-encode everything so every row lives in the file
+            for row in rows:
+                self._offsets.append(position)
+                line = json.dumps(tuple(row), default=encode_value, separators=(",", ":")).encode() + b"\n"
+                spill.write(line)
+                position += len(line)
+        self._offsets.append(position)
+        self._rows = None
+        logger.info(f"Spilled {len(rows)} result rows ({position} bytes) to {self._path}")
+
+    def _read_rows(self, start: int, end: int) -> List[list]:
+        with open(self._path, "rb") as spill:
+            spill.seek(self._offsets[start])
+            chunk = spill.read(self._offsets[end] - self._offsets[start])
+        return [json.loads(line) for line in chunk.splitlines()]
+
+    async def page(self, offset: int, limit: int) -> List[dict]:
+        """Rows ``offset``..``offset + limit`` as dicts"""
+        start = max(0, offset)
+        end = min(self.row_count, start + max(0, limit))
+        if start >= end:
+            return []
+
+        if self._path is None:
+            rows = self._rows[start:end]
+        else:
+            rows = await asyncio.to_thread(self._read_rows, start, end)
+        return [dict(zip(self.columns, row)) for row in rows]
+
+    async def page_response(self, offset: int, limit: int) -> dict:
+        """API payload for one page, with the offset of the next one (if any)"""
+        offset = max(0, offset)
+        limit = max(1, min(limit, settings.RESULT_MAX_PAGE_SIZE))
+        rows = await self.page(offset, limit)
+        end = offset + len(rows)
+        return {
+            "columns": self.columns,
+            "data": rows,
+            "offset": offset,
+            "total_rows": self.row_count,
+            "next_offset": end if end < self.row_count else None
+        }
+
+    def discard(self):
+        """Delete the spill file (if any); the result is unusable afterwards"""
+        path, self._path = self._path, None
+        self._rows = []
+        self.row_count = 0
+        if path is not None:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.error(f"Failed to remove result spill file {path}: {e}")
+
+
+class ResultStore:
+    """Bounded, TTL-evicted results addressed by handle, scoped to their owner"""
+
+    def __init__(self):
+        self.results = TTLCache(
+            max_size=settings.RESULT_STORE_MAX_RESULTS,
+            ttl_seconds=settings.RESULT_STORE_TTL_SECONDS,
+            on_evict=lambda handle, entry: entry[1].discard()
+        )
+
+    async def paginate(
+        self,
+        user_id: int,
+        columns: Sequence[str],
+        rows: Sequence[Sequence[Any]],
+        page_size: int
+    ) -> Tuple[List[dict], Optional[str]]:
+        """
+        First page of ``rows`` and a handle to the rest
+
+        Results that fit in one page are returned whole, with no handle.
+        """
+        if len(rows) <= page_size:
+            return [dict(zip(columns, row)) for row in rows], None
+
+        self.results.purge_expired()
+        stored = await asyncio.to_thread(StoredResult.from_rows, columns, rows)
+        handle = uuid.uuid4().hex
+        self.results.set(handle, (user_id, stored))
+        return await stored.page(0, page_size), handle
+
+    def get(self, handle: str, user_id: int) -> Optional[StoredResult]:
+        entry = self.results.get(handle)
+        if entry is None or entry[0] != user_id:
+            return None
+        return entry[1]
+
+    def clear(self):
+        self.results.clear()
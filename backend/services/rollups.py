@@ -0,0 +1,332 @@
+"""
+Pre-aggregated rollups for the common dashboard questions.
+
+Counts of controls per review_status and of KRIs per status are kept per
+ou/lre/country in small rollup tables. Row triggers apply +1/-1 deltas on
+every insert, delete or status/scope change (so writes made through chat are
+reflected immediately), and a periodic refresh recomputes everything,
+including the time-dependent overdue-review counts. Matching aggregate
+questions are answered from a primary-key lookup instead of an
+LLM-generated GROUP BY over the base tables.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import text
+from config import settings
+from database.registry import DatabaseRegistry, DatabaseTarget
+from database.schema import ensure_statements
+from services.metrics import metrics
+import asyncio
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+CONTROLS_BY_STATUS = "controls_by_status"
+KRIS_BY_STATUS = "kris_by_status"
+OVERDUE_REVIEWS = "overdue_reviews"
+
+# Stands in for NULL statuses, which cannot be part of the rollup key
+UNSET_STATUS = "Unset"
+
+
+def _status_rollup_ddl(rollup: str, source: str, status_column: str, count_column: str) -> List[str]:
+    """Rollup table keyed by scope and status, plus the trigger that keeps it current"""
+    return [
+        f"""
+        CREATE TABLE IF NOT EXISTS {rollup} (
+            ou VARCHAR(100) NOT NULL,
+            lre VARCHAR(100) NOT NULL,
+            country VARCHAR(100) NOT NULL,
+            {status_column} VARCHAR(50) NOT NULL,
+            {count_column} INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (ou, lre, country, {status_column})
+        )
+        """,
+        f"""
+        CREATE OR REPLACE FUNCTION {rollup}_apply() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE {rollup} SET {count_column} = {count_column} - 1
+                WHERE ou = OLD.ou AND lre = OLD.lre AND country = OLD.country
+                  AND {status_column} = COALESCE(OLD.{status_column}, '{UNSET_STATUS}');
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO {rollup} (ou, lre, country, {status_column}, {count_column})
+                VALUES (NEW.ou, NEW.lre, NEW.country, COALESCE(NEW.{status_column}, '{UNSET_STATUS}'), 1)
+                ON CONFLICT (ou, lre, country, {status_column})
+                DO UPDATE SET {count_column} = {rollup}.{count_column} + 1;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """,
+        f"DROP TRIGGER IF EXISTS {rollup}_maintain ON {source}",
+        f"""
+        CREATE TRIGGER {rollup}_maintain
+        AFTER INSERT OR DELETE OR UPDATE OF ou, lre, country, {status_column} ON {source}
+        FOR EACH ROW EXECUTE FUNCTION {rollup}_apply()
+        """
+    ]
+
+
+def _status_rollup_refresh(rollup: str, source: str, status_column: str, count_column: str) -> List[str]:
+    return [
+        # Blocks trigger deltas until the recount commits, so none are lost or double counted
+        f"LOCK TABLE {rollup} IN SHARE ROW EXCLUSIVE MODE",
+        f"DELETE FROM {rollup}",
+        f"""
+        INSERT INTO {rollup} (ou, lre, country, {status_column}, {count_column})
+        SELECT ou, lre, country, COALESCE({status_column}, '{UNSET_STATUS}'), count(*)
+        FROM {source}
+        GROUP BY 1, 2, 3, 4
+        """
+    ]
+
+
+# Idempotent, and only re-run when it changes (see database.schema)
+ROLLUP_DDL = {
+    "eControls": _status_rollup_ddl("control_status_rollup", "controls", "review_status", "control_count") + [
+        """
+        CREATE TABLE IF NOT EXISTS control_overdue_rollup (
+            ou VARCHAR(100) NOT NULL,
+            lre VARCHAR(100) NOT NULL,
+            country VARCHAR(100) NOT NULL,
+            overdue_count INTEGER NOT NULL,
+            PRIMARY KEY (ou, lre, country)
+        )
+        """
+    ],
+    "MyKRI": _status_rollup_ddl("kri_status_rollup", "kri_indicators", "status", "kri_count")
+}
+
+ROLLUP_REFRESH = {
+    "eControls": _status_rollup_refresh("control_status_rollup", "controls", "review_status", "control_count") + [
+        "DELETE FROM control_overdue_rollup"
+    ],
+    "MyKRI": _status_rollup_refresh("kri_status_rollup", "kri_indicators", "status", "kri_count")
+}
+
+# Overdue: not in a completed status, and last reviewed (or created) too long ago
+OVERDUE_REFRESH = text("""
+    INSERT INTO control_overdue_rollup (ou, lre, country, overdue_count)
+    SELECT c.ou, c.lre, c.country, count(*)
+    FROM controls c
+    LEFT JOIN (
+        SELECT control_id, max(review_date) AS last_review
+        FROM control_reviews
+        GROUP BY control_id
+    ) r ON r.control_id = c.control_id
+    WHERE COALESCE(c.review_status, '') <> ALL(:completed)
+      AND COALESCE(r.last_review, c.created_at) < now() - make_interval(days => :overdue_days)
+    GROUP BY 1, 2, 3
+""")
+
+ROLLUP_QUERIES = {
+    CONTROLS_BY_STATUS: ("eControls", text("""
+        SELECT review_status AS status, control_count AS count
+        FROM control_status_rollup
+        WHERE ou = :ou AND lre = :lre AND country = :country AND control_count > 0
+        ORDER BY review_status
+    """)),
+    KRIS_BY_STATUS: ("MyKRI", text("""
+        SELECT status, kri_count AS count
+        FROM kri_status_rollup
+        WHERE ou = :ou AND lre = :lre AND country = :country AND kri_count > 0
+        ORDER BY status
+    """)),
+    OVERDUE_REVIEWS: ("eControls", text("""
+        SELECT overdue_count AS count
+        FROM control_overdue_rollup
+        WHERE ou = :ou AND lre = :lre AND country = :country
+    """))
+}
+
+# Status words of each rollup, refreshed with it
+ROLLUP_STATUSES = {
+    CONTROLS_BY_STATUS: ("eControls", text("SELECT DISTINCT review_status FROM control_status_rollup")),
+    KRIS_BY_STATUS: ("MyKRI", text("SELECT DISTINCT status FROM kri_status_rollup"))
+}
+
+# Only whole question shapes are answered from rollups: a count (or a
+# by-status breakdown) of the noun, optionally of one status. Any other
+# content word (a person, another OU, a category, "values", "with no ...")
+# narrows the question beyond scope and status, so it goes to SQL generation.
+_WORDS = re.compile(r"[a-z0-9']+")
+_COUNTING = re.compile(
+    r"\b(?:how many|count|counts|number of|totals?|breakdown|split)\b|\b(?:by|per) (?:review )?status(?:es)?\b"
+)
+_SHAPE_WORDS = frozenset("""
+    how many count counts number of total totals breakdown split by per review status statuses
+    what what's whats is are the my our i we me do does have has there in all show give get tell currently now
+""".split())
+_NOUNS = {
+    CONTROLS_BY_STATUS: frozenset({"control", "controls"}),
+    KRIS_BY_STATUS: frozenset({"kri", "kris"})
+}
+# "How many controls are overdue for review?"; only controls have reviews
+_OVERDUE_WORDS = frozenset({"overdue", "for", "review", "reviews"})
+
+rollup_answers = metrics.counter("rollup_answers_total", "Chat questions answered from rollups, by rollup")
+
+
+class RollupService:
+    """Rollups live next to the data, so every shard of an application has its own"""
+
+    def __init__(self, registry: DatabaseRegistry):
+        self.registry = registry
+        self.interval = settings.ROLLUP_REFRESH_SECONDS
+        # Keyed by database (admission resource name)
+        self._installed: Dict[str, bool] = {}
+        self._ready: Dict[str, bool] = {}
+        self._refreshed_at: Dict[str, datetime] = {}
+        # (resource, rollup) -> words of the statuses it holds
+        self._status_words: Dict[Tuple[str, str], frozenset] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def _targets(self) -> List[Tuple[str, DatabaseTarget]]:
+        return [
+            (application, target)
+            for application in ROLLUP_DDL if application in self.registry
+            for target in self.registry.targets(application)
+        ]
+
+    async def install(self):
+        """Create rollup tables and triggers; new ones answer questions once first filled"""
+        await asyncio.gather(*(self._install(application, target) for application, target in self._targets()))
+
+    async def _install(self, application: str, target: DatabaseTarget):
+        try:
+            created = await ensure_statements(target.engine, f"rollups:{application}", ROLLUP_DDL[application])
+        except Exception as e:
+            # Aggregate questions fall back to generated SQL
+            logger.warning(f"Rollups unavailable for {target.resource}: {e}")
+            return
+        self._installed[target.resource] = True
+        if not created:
+            # The triggers kept the counts current while we were down
+            self._ready[target.resource] = True
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        # The first pass fills new rollups and catches up overdue counts off the start-up path
+        while True:
+            for application, target in self._targets():
+                if not self._installed.get(target.resource):
+                    continue
+                try:
+                    await self._refresh(application, target)
+                    self._ready[target.resource] = True
+                except Exception as e:
+                    logger.error(f"Rollup refresh failed for {target.resource}: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _refresh(self, application: str, target: DatabaseTarget):
+        async with target.engine.begin() as conn:
+            for statement in ROLLUP_REFRESH[application]:
+                await conn.execute(text(statement))
+            if application == "eControls":
+                await conn.execute(OVERDUE_REFRESH, {
+                    "completed": list(settings.ROLLUP_COMPLETED_STATUSES),
+                    "overdue_days": settings.ROLLUP_OVERDUE_DAYS
+                })
+            for name, (rollup_application, statuses_query) in ROLLUP_STATUSES.items():
+                if rollup_application == application:
+                    statuses = (await conn.execute(statuses_query)).scalars().all()
+                    self._status_words[(target.resource, name)] = frozenset(
+                        word for status in statuses for word in _WORDS.findall(status.lower())
+                    )
+        self._refreshed_at[target.resource] = datetime.utcnow()
+
+    def match(self, query: str, user_context: dict) -> Optional[str]:
+        """The rollup that answers ``query``, if it is a plain scope-level aggregate"""
+        words = _WORDS.findall(query.lower())
+        if not _COUNTING.search(" ".join(words)):
+            return None
+
+        named = [name for name, nouns in _NOUNS.items() if nouns.intersection(words)]
+        if len(named) != 1:
+            return None
+        name = named[0]
+        application = ROLLUP_QUERIES[name][0]
+        if application not in self.registry:
+            return None
+        resource = self.registry.resource(application, user_context)
+
+        rest = set(words) - _NOUNS[name] - _SHAPE_WORDS
+        if "overdue" in rest:
+            if name != CONTROLS_BY_STATUS or rest - _OVERDUE_WORDS:
+                return None
+            name = OVERDUE_REVIEWS
+        elif rest - self._status_words.get((resource, name), frozenset()):
+            return None
+        return name if self._ready.get(resource) else None
+
+    async def answer(self, name: str, query: str, user_context: dict) -> dict:
+        application, rollup_query = ROLLUP_QUERIES[name]
+        scope = {
+            "ou": user_context["ou"],
+            "lre": user_context["lre"],
+            "country": user_context["country"]
+        }
+        target = self.registry.target(application, user_context)
+        async with target.read_engine().connect() as conn:
+            result = await conn.execute(rollup_query, scope)
+            rows = [dict(row._mapping) for row in result]
+        rollup_answers.inc(rollup=name)
+
+        if name == OVERDUE_REVIEWS:
+            count = rows[0]["count"] if rows else 0
+            data = [{"overdue_count": count}]
+            response = (
+                f"{count} of your controls have not been reviewed in the last "
+                f"{settings.ROLLUP_OVERDUE_DAYS} days."
+            )
+        else:
+            noun = "controls" if name == CONTROLS_BY_STATUS else "KRIs"
+            data, response = self._by_status(query, noun, rows)
+
+        # Not refreshed yet this run: status counts are trigger-maintained, overdue is from the last run
+        refreshed = self._refreshed_at.get(target.resource)
+        return {
+            "response": response,
+            "data": data,
+            "row_count": len(data),
+            "application": application,
+            "refreshed_at": refreshed.isoformat() + "Z" if refreshed else None
+        }
+
+    @staticmethod
+    def _by_status(query: str, noun: str, rows: List[dict]):
+        total = sum(row["count"] for row in rows)
+        # "how many controls are pending" -> just that status
+        asked = [row for row in rows if re.search(rf"\b{re.escape(row['status'])}\b", query, re.IGNORECASE)]
+        if len(asked) == 1:
+            row = asked[0]
+            return [row], f"{row['count']} of your {total} {noun} are {row['status']}."
+        if not rows:
+            return [], f"There are no {noun} in your scope."
+        breakdown = ", ".join(f"{row['status']}: {row['count']}" for row in rows)
+        return rows, f"You have {total} {noun} ({breakdown})."
+
+    def snapshot(self) -> dict:
+        snapshot = {}
+        for _, target in self._targets():
+            refreshed = self._refreshed_at.get(target.resource)
+            snapshot[target.resource] = {
+                "ready": self._ready.get(target.resource, False),
+                "refreshed_at": refreshed.isoformat() + "Z" if refreshed else None
+            }
+        return snapshot
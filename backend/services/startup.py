@@ -0,0 +1,42 @@
+"""
+Start-up phase timing.
+
+Phases that do not depend on each other run concurrently, so the breakdown
+records each phase's own duration alongside the wall-clock total.
+"""
+from datetime import datetime
+from typing import Awaitable, Dict, Optional, TypeVar
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class StartupTimer:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.phases: Dict[str, float] = {}
+        self.total: Optional[float] = None
+        self.finished_at: Optional[datetime] = None
+
+    async def run(self, phase: str, awaitable: Awaitable[T]) -> T:
+        started = time.monotonic()
+        try:
+            return await awaitable
+        finally:
+            self.phases[phase] = round(time.monotonic() - started, 3)
+
+    def finish(self):
+        self.total = round(time.monotonic() - self.started, 3)
+        self.finished_at = datetime.utcnow()
+        breakdown = ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self.phases.items())
+        logger.info(f"Application started in {self.total:.2f}s ({breakdown})")
+
+    def snapshot(self) -> dict:
+        return {
+            "total_seconds": self.total,
+            "phases": dict(self.phases),
+            "finished_at": self.finished_at.isoformat() + "Z" if self.finished_at else None
+        }
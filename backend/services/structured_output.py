@@ -0,0 +1,236 @@
+"""
+Structured output extraction for RAG responses.
+
+Pulls JSON objects, SQL statements and cleaned prose out of the free-form
+``context`` returned by the RAG API. Every pattern is compiled once at import
+and each extractor walks the text left to right without re-scanning, so the
+cost stays linear in the size of the context even for adversarial inputs
+(unbalanced braces, keywords without terminators, unclosed code fences).
+"""
+import json
+import re
+from typing import Iterator, Optional, Tuple
+
+# ==================== JSON ====================
+
+# Structural characters that matter while looking for balanced {...} spans
+_JSON_STRUCTURE = re.compile(r'[{}"\\]')
+# A JSON object opens with '{' followed by a key or '}', anything else is prose
+_JSON_OBJECT_OPEN = re.compile(r'\{\s*["}]')
+_CODE_FENCE = '```'
+_JSON_FENCE_BODY = re.compile(r'(?:json)?\s*', re.IGNORECASE)
+
+# Nested objects are only searched two levels deep (same reach as the old
+# nested-brace regex), which keeps the total work bounded by 3 * len(text).
+_MAX_JSON_DESCENT = 2
+
+
+def _balanced_spans(text: str, start: int, end: int) -> Iterator[Tuple[int, int]]:
+    """
+    Yield top-level balanced ``{...}`` spans in ``text[start:end]``.
+
+    Braces pair up like a stack, so a '{' in prose that never closes does not
+    hide the balanced spans after it. Spans closed while such a brace is still
+    open are held until it is known whether something encloses them.
+    """
+    opened = []
+    pending = []
+    in_string = False
+    skip_until = -1
+
+    for match in _JSON_STRUCTURE.finditer(text, start, end):
+        pos = match.start()
+        if pos < skip_until:
+            continue
+        char = match.group()
+
+        if in_string:
+            if char == '\\':
+                skip_until = pos + 2
+            elif char == '"':
+                in_string = False
+            continue
+
+        if char == '"':
+            # Quotes only open strings inside an object; prose quotes are ignored
+            if opened:
+                in_string = True
+        elif char == '{':
+            opened.append(pos)
+        elif char == '}' and opened:
+            span_start = opened.pop()
+            # Spans closed inside this one are not top-level after all
+            while pending and pending[-1][0] > span_start:
+                pending.pop()
+            if opened:
+                pending.append((span_start, pos + 1))
+            else:
+                yield span_start, pos + 1
+
+    yield from pending
+
+
+def _first_object(text: str, start: int, end: int, descent: int) -> Optional[dict]:
+    for span_start, span_end in _balanced_spans(text, start, end):
+        # Only spans that look like an object are worth a decode attempt
+        if _JSON_OBJECT_OPEN.match(text, span_start, span_end):
+            try:
+                parsed = json.loads(text[span_start:span_end])
+                if isinstance(parsed, dict):
+                    return parsed
+            except (ValueError, RecursionError):
+                pass
+
+        # Prose in braces may still wrap a valid object one level down
+        if descent < _MAX_JSON_DESCENT:
+            inner = _first_object(text, span_start + 1, span_end - 1, descent + 1)
+            if inner is not None:
+                return inner
+    return None
+
+
+def _fenced_blocks(text: str) -> Iterator[Tuple[int, int]]:
+    """Yield (body_start, body_end) for each closed ``` code block."""
+    pos = text.find(_CODE_FENCE)
+    while pos != -1:
+        body_start = pos + len(_CODE_FENCE)
+        close = text.find(_CODE_FENCE, body_start)
+        if close == -1:
+            return
+        yield body_start, close
+        pos = text.find(_CODE_FENCE, close + len(_CODE_FENCE))
+
+
+def extract_json(text: str) -> Optional[dict]:
+    """
+    Extract the first JSON object from text
+
+    Tries, in order: the first balanced object that decodes to a dict, the
+    whole text, then the body of any ```json code block.
+    """
+    if not text:
+        return None
+
+    parsed = _first_object(text, 0, len(text), 0)
+    if parsed is not None:
+        return parsed
+
+    try:
+        return json.loads(text)
+    except (ValueError, RecursionError):
+        pass
+
+    for body_start, body_end in _fenced_blocks(text):
+        body_start = _JSON_FENCE_BODY.match(text, body_start, body_end).end()
+        body = text[body_start:body_end].rstrip()
+        if body.startswith('{') and body.endswith('}'):
+            try:
+                return json.loads(body)
+            except (ValueError, RecursionError):
+                continue
+
+    return None
+
+# ==================== SQL ====================
+
+_SQL_KEYWORD = r'(?:SELECT|INSERT|UPDATE|DELETE|WITH)'
+_SQL_START = re.compile(r'\b' + _SQL_KEYWORD + r'(?=\s)', re.IGNORECASE)
+_SQL_FENCE_BODY = re.compile(r'(?:sql)?\s*(?=' + _SQL_KEYWORD + r')', re.IGNORECASE)
+_BLANK_LINE = re.compile(r'\n\s*\n')
+
+# Tokens inside a statement: quoted literals/identifiers and line comments are
+# consumed whole so a ';' inside them does not terminate the statement.
+_SQL_BODY_TOKEN = re.compile(
+    r"'[^']*(?:''[^']*)*'"
+    r'|"[^"]*"'
+    r'|--[^\n]*'
+    r'|;'
+)
+
+
+def _statement_end(text: str, start: int) -> int:
+    """Return the index just past the terminating ';', or -1"""
+    for match in _SQL_BODY_TOKEN.finditer(text, start):
+        if match.group() == ';':
+            return match.end()
+    return -1
+
+
+def clean_sql(sql: str) -> str:
+    """Collapse whitespace and ensure a trailing semicolon"""
+    sql = ' '.join(sql.split())
+    if not sql.endswith(';'):
+        sql += ';'
+    return sql
+
+
+def extract_sql(text: str) -> Optional[str]:
+    """
+    Extract the first SQL statement from text
+
+    Tries, in order: the first statement terminated by ';', the first ```sql
+    code block starting with a statement keyword, then the first statement
+    running up to a blank line or the end of the text.
+    """
+    if not text:
+        return None
+
+    first = _SQL_START.search(text)
+    if first:
+        end = _statement_end(text, first.end())
+        if end != -1:
+            return clean_sql(text[first.start():end])
+
+    for body_start, body_end in _fenced_blocks(text):
+        body = _SQL_FENCE_BODY.match(text, body_start, body_end)
+        if body:
+            sql = text[body.end():body_end].strip()
+            if sql:
+                return clean_sql(sql)
+
+    if first:
+        blank = _BLANK_LINE.search(text, first.end())
+        end = blank.start() if blank else len(text)
+        return clean_sql(text[first.start():end])
+
+    return None
+
+# ==================== Text ====================
+
+# (start, end) pairs: everything from a start match through the next end match
+# is removed, mirroring the old non-greedy ".*?" patterns without re-scanning.
+_TEXT_SPAN_PATTERNS = [
+    (re.compile(r'based on the', re.IGNORECASE), re.compile(r'guide[,:]?\s*', re.IGNORECASE)),
+    (re.compile(r'here(?:\'s| is) (?:the|a|an)', re.IGNORECASE), re.compile(r':\s*')),
+    (re.compile(r'```'), re.compile(r'```')),
+]
+_TEXT_LABEL = re.compile(r'(?:example|response|format):\s*', re.IGNORECASE)
+_EXTRA_BLANK_LINES = re.compile(r'\n{3,}')
+
+
+def _remove_spans(text: str, start_pattern: re.Pattern, end_pattern: re.Pattern) -> str:
+    parts = []
+    pos = 0
+    while True:
+        start = start_pattern.search(text, pos)
+        if not start:
+            break
+        end = end_pattern.search(text, start.end())
+        if not end:
+            # No terminator after this start means none after later starts either
+            break
+        parts.append(text[pos:start.start()])
+        pos = end.end()
+    parts.append(text[pos:])
+    return ''.join(parts)
+
+
+def clean_text(text: str) -> str:
+    """Remove guide/instruction boilerplate and code blocks from a text response"""
+    cleaned = _remove_spans(text, *_TEXT_SPAN_PATTERNS[0])
+    cleaned = _TEXT_LABEL.sub('', cleaned)
+    for start_pattern, end_pattern in _TEXT_SPAN_PATTERNS[1:]:
+        cleaned = _remove_spans(cleaned, start_pattern, end_pattern)
+
+    cleaned = _EXTRA_BLANK_LINES.sub('\n\n', cleaned)
+    return cleaned.strip()
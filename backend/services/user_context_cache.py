@@ -0,0 +1,178 @@
+from typing import Dict, List, Optional
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from config import settings
+from database.schema import ensure_statements
+from services.cache import TTLCache
+import asyncio
+import asyncpg
+import logging
+
+logger = logging.getLogger(__name__)
+
+USER_CONTEXT_QUERY = text("""
+    SELECT user_id, username, email, user_ou, user_lre, user_country
+    FROM users
+    WHERE user_id = :user_id AND is_active = true
+""")
+
+USER_CONTEXT_WARM_QUERY = text("""
+    SELECT user_id, username, email, user_ou, user_lre, user_country
+    FROM users
+    WHERE is_active = true
+    ORDER BY updated_at DESC NULLS LAST
+    LIMIT :limit
+""")
+
+# Idempotent, and only re-run when it changes (see database.schema)
+USER_CONTEXT_TRIGGER_DDL = [
+    f"""
+    CREATE OR REPLACE FUNCTION notify_user_context_changed() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify(
+            '{settings.USER_CONTEXT_NOTIFY_CHANNEL}',
+            COALESCE(NEW.user_id, OLD.user_id)::text
+        );
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS users_notify_context_changed ON users",
+    """
+    CREATE TRIGGER users_notify_context_changed
+    AFTER INSERT OR UPDATE OR DELETE ON users
+    FOR EACH ROW EXECUTE FUNCTION notify_user_context_changed()
+    """
+]
+
+
+def _to_context(row) -> dict:
+    return {
+        "user_id": row.user_id,
+        "username": row.username,
+        "email": row.email,
+        "ou": row.user_ou,
+        "lre": row.user_lre,
+        "country": row.user_country
+    }
+
+
+class UserContextCache:
+    """
+    TTL + LRU cache of user context per (application, user_id)
+
+    Warmed in bulk at start-up and invalidated through Postgres LISTEN/NOTIFY:
+    a trigger on ``users`` publishes the changed user_id, and a dedicated
+    listener connection per database evicts the matching entry.
+    """
+
+    def __init__(self, engines: Dict[str, AsyncEngine]):
+        self.engines = engines
+        self.cache = TTLCache(
+            max_size=settings.USER_CONTEXT_CACHE_SIZE,
+            ttl_seconds=settings.USER_CONTEXT_CACHE_TTL_SECONDS
+        )
+        self._listeners: Dict[str, asyncpg.Connection] = {}
+        self._reconnect_tasks: List[asyncio.Task] = []
+        self._stopping = False
+
+    async def get(self, application: str, user_id: int, session: AsyncSession) -> Optional[dict]:
+        """Return the user's context, querying ``session`` only on a cache miss"""
+        key = (application, user_id)
+        context = self.cache.get(key)
+        if context is not None:
+            return dict(context)
+
+        result = await session.execute(USER_CONTEXT_QUERY, {"user_id": user_id})
+        user = result.fetchone()
+        if not user:
+            return None
+
+        context = _to_context(user)
+        self.cache.set(key, context)
+        return dict(context)
+
+    def invalidate(self, application: str, user_id: int):
+        self.cache.pop((application, user_id))
+
+    async def start(self):
+        """Install triggers, warm the cache and start listening on every database concurrently"""
+        self._stopping = False
+        await asyncio.gather(*(
+            self._start(application, engine) for application, engine in self.engines.items()
+        ))
+
+    async def _start(self, application: str, engine: AsyncEngine):
+        try:
+            await self._install_trigger(engine)
+            await self._listen(application, engine)
+            await self.warm(application, engine)
+        except Exception as e:
+            # The endpoint still works without the cache; it just queries
+            logger.warning(f"User context cache unavailable for {application}: {e}")
+
+    async def stop(self):
+        self._stopping = True
+        for task in list(self._reconnect_tasks):
+            task.cancel()
+
+        for connection in list(self._listeners.values()):
+            try:
+                await connection.close()
+            except Exception as e:
+                logger.error(f"Error closing user context listener: {e}")
+        self._listeners.clear()
+
+    async def warm(self, application: str, engine: AsyncEngine) -> int:
+        async with engine.connect() as conn:
+            result = await conn.execute(
+                USER_CONTEXT_WARM_QUERY,
+                {"limit": settings.USER_CONTEXT_WARM_LIMIT}
+            )
+            rows = result.fetchall()
+
+        for row in rows:
+            self.cache.set((application, row.user_id), _to_context(row))
+
+        logger.info(f"User context cache warmed for {application}: {len(rows)} users")
+        return len(rows)
+
+    async def _install_trigger(self, engine: AsyncEngine):
+        await ensure_statements(engine, "user_context_trigger", USER_CONTEXT_TRIGGER_DDL)
+
+    async def _listen(self, application: str, engine: AsyncEngine):
+        # LISTEN needs a connection that lives outside the SQLAlchemy pool
+        dsn = engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        connection = await asyncpg.connect(dsn)
+
+        def on_notify(conn, pid, channel, payload):
+            try:
+                self.invalidate(application, int(payload))
+            except ValueError:
+                logger.warning(f"Ignoring malformed user context notification: {payload!r}")
+
+        def on_terminate(conn):
+            # Notifications may have been missed while disconnected
+            self.cache.clear()
+            self._listeners.pop(application, None)
+            if not self._stopping:
+                logger.warning(f"User context listener for {application} lost, reconnecting")
+                task = asyncio.create_task(self._reconnect(application, engine))
+                self._reconnect_tasks.append(task)
+                task.add_done_callback(self._reconnect_tasks.remove)
+
+        await connection.add_listener(settings.USER_CONTEXT_NOTIFY_CHANNEL, on_notify)
+        connection.add_termination_listener(on_terminate)
+        self._listeners[application] = connection
+
+    async def _reconnect(self, application: str, engine: AsyncEngine):
+        delay = 1.0
+        while not self._stopping:
+            try:
+                await self._listen(application, engine)
+                logger.info(f"User context listener for {application} reconnected")
+                return
+            except Exception as e:
+                logger.error(f"User context listener reconnect failed: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60.0)
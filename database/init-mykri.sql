@@ -21,6 +21,9 @@ CREATE TABLE IF NOT EXISTS kri_indicators (
     kri_description TEXT,
     kri_category VARCHAR(100),
     threshold_value VARCHAR(100),
+    threshold_operator VARCHAR(2),
+    threshold_bound NUMERIC,
+    threshold_unit VARCHAR(10),
     ou VARCHAR(100) NOT NULL,
     lre VARCHAR(100) NOT NULL,
     country VARCHAR(100) NOT NULL,
@@ -35,6 +38,8 @@ CREATE TABLE IF NOT EXISTS kri_values (
     kri_id INTEGER REFERENCES kri_indicators(kri_id),
     entered_by INTEGER REFERENCES users(user_id),
     kri_value VARCHAR(255) NOT NULL,
+    kri_value_numeric NUMERIC,
+    kri_value_unit VARCHAR(10),
     entry_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     comments TEXT
 );
@@ -53,7 +58,8 @@ CREATE TABLE IF NOT EXISTS audit_logs (
     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     ip_address VARCHAR(50),
     success BOOLEAN DEFAULT TRUE,
-    error_message TEXT
+    error_message TEXT,
+    question TEXT
 );
 
 -- Create Indexes
@@ -62,10 +68,111 @@ CREATE INDEX IF NOT EXISTS idx_kri_status ON kri_indicators(status);
 CREATE INDEX IF NOT EXISTS idx_kri_ref ON kri_indicators(kri_ref);
 CREATE INDEX IF NOT EXISTS idx_kri_values_kri_id ON kri_values(kri_id);
 CREATE INDEX IF NOT EXISTS idx_kri_values_entry_date ON kri_values(entry_date DESC);
+CREATE INDEX IF NOT EXISTS idx_kri_values_kri_id_entry_date ON kri_values(kri_id, entry_date DESC);
 CREATE INDEX IF NOT EXISTS idx_users_ou_lre_country ON users(user_ou, user_lre, user_country);
-CREATE INDEX IF NOT EXISTS idx_audit_user_id ON audit_logs(user_id);
+CREATE INDEX IF NOT EXISTS idx_audit_user_ts ON audit_logs(user_id, timestamp DESC, audit_id DESC)
+    INCLUDE (application, operation, table_name, success);
+CREATE INDEX IF NOT EXISTS idx_audit_record_ts ON audit_logs(application, table_name, record_id, timestamp DESC, audit_id DESC);
 CREATE INDEX IF NOT EXISTS idx_audit_timestamp ON audit_logs(timestamp DESC);
 
+-- Notify the backend's user context cache when a user changes
+CREATE OR REPLACE FUNCTION notify_user_context_changed() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('user_context_changed', COALESCE(NEW.user_id, OLD.user_id)::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_notify_context_changed ON users;
+CREATE TRIGGER users_notify_context_changed
+AFTER INSERT OR UPDATE OR DELETE ON users
+FOR EACH ROW EXECUTE FUNCTION notify_user_context_changed();
+
+-- Keep typed copies of KRI values and thresholds for breach evaluation
+CREATE OR REPLACE FUNCTION parse_kri_number(raw TEXT) RETURNS NUMERIC AS $$
+    SELECT (regexp_match(replace(raw, ',', ''), '[-+]?[0-9]*\.?[0-9]+'))[1]::numeric
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION parse_kri_unit(raw TEXT) RETURNS VARCHAR AS $$
+    SELECT CASE
+        WHEN position('%' in raw) > 0 THEN '%'
+        WHEN raw ~* '[0-9\s]bps\s*$' THEN 'bps'
+        ELSE ''
+    END
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION parse_threshold_operator(raw TEXT) RETURNS VARCHAR AS $$
+    SELECT CASE
+        WHEN raw ~ '^\s*(±|\+/-)' THEN '±'
+        WHEN raw ~ '^\s*(<=|≤)' THEN '<='
+        WHEN raw ~ '^\s*(>=|≥)' THEN '>='
+        WHEN raw ~ '^\s*<' THEN '<'
+        WHEN raw ~ '^\s*>' THEN '>'
+    END
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION kri_values_parse_numeric() RETURNS trigger AS $$
+BEGIN
+    NEW.kri_value_numeric := parse_kri_number(NEW.kri_value);
+    NEW.kri_value_unit := parse_kri_unit(NEW.kri_value);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION kri_indicators_parse_threshold() RETURNS trigger AS $$
+BEGIN
+    NEW.threshold_operator := parse_threshold_operator(NEW.threshold_value);
+    NEW.threshold_bound := CASE
+        WHEN NEW.threshold_operator = '±' THEN abs(parse_kri_number(NEW.threshold_value))
+        WHEN NEW.threshold_operator IS NOT NULL THEN parse_kri_number(NEW.threshold_value)
+    END;
+    NEW.threshold_unit := parse_kri_unit(NEW.threshold_value);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS kri_values_numeric ON kri_values;
+CREATE TRIGGER kri_values_numeric
+BEFORE INSERT OR UPDATE OF kri_value ON kri_values
+FOR EACH ROW EXECUTE FUNCTION kri_values_parse_numeric();
+
+DROP TRIGGER IF EXISTS kri_indicators_threshold ON kri_indicators;
+CREATE TRIGGER kri_indicators_threshold
+BEFORE INSERT OR UPDATE OF threshold_value ON kri_indicators
+FOR EACH ROW EXECUTE FUNCTION kri_indicators_parse_threshold();
+
+-- KRI counts per scope and status, kept current by a trigger
+CREATE TABLE IF NOT EXISTS kri_status_rollup (
+    ou VARCHAR(100) NOT NULL,
+    lre VARCHAR(100) NOT NULL,
+    country VARCHAR(100) NOT NULL,
+    status VARCHAR(50) NOT NULL,
+    kri_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (ou, lre, country, status)
+);
+
+CREATE OR REPLACE FUNCTION kri_status_rollup_apply() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE kri_status_rollup SET kri_count = kri_count - 1
+        WHERE ou = OLD.ou AND lre = OLD.lre AND country = OLD.country
+          AND status = COALESCE(OLD.status, 'Unset');
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO kri_status_rollup (ou, lre, country, status, kri_count)
+        VALUES (NEW.ou, NEW.lre, NEW.country, COALESCE(NEW.status, 'Unset'), 1)
+        ON CONFLICT (ou, lre, country, status)
+        DO UPDATE SET kri_count = kri_status_rollup.kri_count + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS kri_status_rollup_maintain ON kri_indicators;
+CREATE TRIGGER kri_status_rollup_maintain
+AFTER INSERT OR DELETE OR UPDATE OF ou, lre, country, status ON kri_indicators
+FOR EACH ROW EXECUTE FUNCTION kri_status_rollup_apply();
+
 -- Insert Sample Users
 INSERT INTO users (user_id, username, email, user_ou, user_lre, user_country) 
 VALUES 